@@ -3,13 +3,14 @@ from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 from config import BOT_TOKEN
+from media.telegram_files import create_bot_session
 from routers import all_routers
 # import logging
 
 # logging.basicConfig(level=logging.INFO)
 
-# Инициализация бота и диспетчера
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# Инициализация бота и диспетчера (с собственным сервером Bot API, если он задан)
+bot = Bot(token=BOT_TOKEN, session=create_bot_session(), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 dp = Dispatcher()
 
 # Подключение модулей (роутеров)
@@ -0,0 +1,10 @@
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+# callback обрабатывается в core модуле и отменяет задачи пользователя
+CANCEL_CALLBACK = "cancel_task"
+
+def get_cancel_menu() -> InlineKeyboardMarkup:
+    """Кнопка отмены для сообщений «Думаю...» / «Обрабатываю...»"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⛔ Отмена", callback_data=CANCEL_CALLBACK)]
+    ])
@@ -0,0 +1,6 @@
+"""
+Общий аудио-конвейер для модулей транскрипции
+
+Скачивание из Telegram в память, обработка через ffmpeg (stdin/stdout)
+и метрики этапов. Используется ChatGPT модулем и модулем транскрипции.
+"""
@@ -0,0 +1,185 @@
+"""
+Бенчмарк движков локального Whisper на CPU
+
+Сравнивает движки на одном наборе записей: время загрузки модели, фактор
+реального времени (RTF - время распознавания / длительность записи; меньше 1 -
+быстрее реального времени), пиковую память процесса и долю ошибок в словах
+(WER) относительно эталонных расшифровок.
+
+Набор записей - папка с аудиофайлами (любой формат, который читает ffmpeg) и
+эталонными текстами рядом: clip.ogg + clip.txt. Каждый движок запускается в
+отдельном процессе, GPU отключается.
+
+Запуск:
+    python -m media.benchmark --clips bench_clips --model base --language ru
+    python -m media.benchmark --clips bench_clips --backends faster-whisper --compute-type int8
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .ffmpeg import FFMPEG_AVAILABLE, WHISPER_SAMPLE_RATE, decode_pcm
+from .metrics import peak_rss_mb
+from .payload import AudioPayload
+from .whisper_backends import BACKEND_FASTER_WHISPER, BACKEND_WHISPER, backend_available, create_backend
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+AUDIO_EXTENSIONS = {".ogg", ".oga", ".opus", ".mp3", ".m4a", ".mp4", ".wav", ".flac", ".webm"}
+
+
+def normalize_words(text: str) -> List[str]:
+    """Слова без регистра и пунктуации (ё = е) для подсчета WER"""
+    text = text.lower().replace("ё", "е")
+    return re.sub(r"[^\w\s]", " ", text).split()
+
+
+def word_errors(reference: str, hypothesis: str) -> Tuple[int, int]:
+    """(ошибок - замены + вставки + пропуски, слов в эталоне)"""
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            )
+        previous = current
+    return previous[-1], len(ref)
+
+
+def load_clips(folder: Path) -> List[Tuple[str, "np.ndarray", Optional[str]]]:
+    """Записи набора: (имя, PCM float32 16 кГц, эталонный текст или None)"""
+    clips = []
+    for path in sorted(folder.iterdir()):
+        if path.suffix.lower() not in AUDIO_EXTENSIONS:
+            continue
+        pcm = asyncio.run(decode_pcm(AudioPayload(filename=path.name, path=path)))
+        audio = np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+        reference_path = path.with_suffix(".txt")
+        reference = reference_path.read_text(encoding="utf-8") if reference_path.exists() else None
+        clips.append((path.name, audio, reference))
+    return clips
+
+
+def _run_backend(name: str, model_name: str, compute_type: str, threads: int,
+                 clips: List[Tuple[str, "np.ndarray", Optional[str]]], language: Optional[str]) -> Dict:
+    """Прогон одного движка (в отдельном процессе, чтобы память не смешивалась)"""
+    backend = create_backend(name, model_name, threads=threads, compute_type=compute_type)
+    started = time.perf_counter()
+    backend.load()
+    backend.configure_worker()
+    load_sec = time.perf_counter() - started
+
+    # Прогрев: первые вызовы включают разовые расходы (выделение памяти, JIT)
+    backend.transcribe(clips[0][1][:5 * WHISPER_SAMPLE_RATE], language)
+
+    results = []
+    for clip_name, audio, reference in clips:
+        started = time.perf_counter()
+        text = backend.transcribe(audio, language)
+        results.append({
+            'clip': clip_name,
+            'audio_sec': len(audio) / WHISPER_SAMPLE_RATE,
+            'sec': time.perf_counter() - started,
+            'text': text,
+            'reference': reference,
+        })
+    return {'load_sec': load_sec, 'peak_rss_mb': peak_rss_mb(), 'clips': results}
+
+
+def summarize(name: str, run: Dict) -> Dict:
+    """Итоги движка: RTF и WER по всему набору"""
+    audio_sec = sum(clip['audio_sec'] for clip in run['clips'])
+    busy_sec = sum(clip['sec'] for clip in run['clips'])
+    errors = words = 0
+    for clip in run['clips']:
+        if clip['reference'] is not None:
+            clip_errors, clip_words = word_errors(clip['reference'], clip['text'])
+            errors += clip_errors
+            words += clip_words
+    return {
+        'backend': name,
+        'load_sec': round(run['load_sec'], 1),
+        'rtf': round(busy_sec / audio_sec, 3) if audio_sec else None,
+        'peak_rss_mb': run['peak_rss_mb'],
+        'wer': round(errors / words * 100, 1) if words else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк движков локального Whisper на CPU")
+    parser.add_argument("--clips", type=Path, required=True, help="Папка с записями и эталонными .txt")
+    parser.add_argument("--backends", nargs="+", default=[BACKEND_WHISPER, BACKEND_FASTER_WHISPER])
+    parser.add_argument("--model", default="base", help="Модель (tiny, base, small, ...)")
+    parser.add_argument("--compute-type", default="int8", help="Квантование для faster-whisper")
+    parser.add_argument("--threads", type=int, default=0, help="Потоков на движок (0 - по умолчанию библиотеки)")
+    parser.add_argument("--language", default=None, help="Язык (по умолчанию - автоопределение)")
+    parser.add_argument("--json", type=Path, default=None, help="Сохранить подробные результаты в JSON")
+    args = parser.parse_args(argv)
+
+    if not FFMPEG_AVAILABLE or not NUMPY_AVAILABLE:
+        print("❌ Нужны ffmpeg и numpy")
+        return 1
+
+    clips = load_clips(args.clips)
+    if not clips:
+        print(f"❌ В {args.clips} нет аудиофайлов")
+        return 1
+    total_sec = sum(len(audio) for _, audio, _ in clips) / WHISPER_SAMPLE_RATE
+    print(f"🎧 Записей: {len(clips)}, всего {total_sec:.0f} сек; модель {args.model}, только CPU")
+
+    # Только CPU: воркеры не должны видеть GPU
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    context = multiprocessing.get_context("spawn")
+
+    summaries = []
+    details = {}
+    for name in args.backends:
+        if not backend_available(name):
+            print(f"⚠️  {name}: библиотека не установлена, пропускаю")
+            continue
+        print(f"⏳ {name}...")
+        try:
+            with context.Pool(1) as pool:
+                run = pool.apply(_run_backend, (name, args.model, args.compute_type, args.threads, clips, args.language))
+        except Exception as e:
+            print(f"❌ {name}: {e}")
+            continue
+        details[name] = run
+        summaries.append(summarize(name, run))
+
+    if not summaries:
+        return 1
+
+    print(f"\n{'Движок':<16}{'Загрузка, с':>12}{'RTF':>8}{'Память, МБ':>12}{'WER, %':>9}")
+    for row in summaries:
+        print(
+            f"{row['backend']:<16}{row['load_sec']:>12}{row['rtf'] if row['rtf'] is not None else '-':>8}"
+            f"{row['peak_rss_mb'] if row['peak_rss_mb'] is not None else '-':>12}"
+            f"{row['wer'] if row['wer'] is not None else '-':>9}"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps({'summary': summaries, 'runs': details}, ensure_ascii=False, indent=2),
+                             encoding="utf-8")
+        print(f"\n💾 Подробности: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
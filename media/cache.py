@@ -0,0 +1,207 @@
+"""
+Кэш результатов распознавания речи
+
+Одно и то же голосовое, пересланное повторно или отправленное в разные модули,
+не скачивается и не распознается заново. Ключ - file_unique_id Telegram (он
+одинаков у пересланных копий) или, если его нет либо он не совпал, SHA-256
+содержимого файла; в ключ входят также модель и язык распознавания.
+
+Два уровня: LRU в памяти и (если задан TRANSCRIPTION_CACHE_DIR) JSON-файлы
+на диске, которые переживают перезапуск бота. Записи старше TTL не выдаются.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from .payload import AudioPayload
+
+logger = logging.getLogger(__name__)
+
+# Параметры по умолчанию (переопределяются переменными окружения)
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_TTL_HOURS = 168
+
+
+@dataclass
+class CachedTranscription:
+    """Сохраненный результат распознавания"""
+    text: str
+    method: str
+    language: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+
+
+def transcription_key(source: str, model: str, language: Optional[str]) -> str:
+    """Ключ кэша: источник (tg:<file_unique_id> или sha256:<хеш>) + модель + язык"""
+    language = (language or "auto").lower()
+    return hashlib.sha256(f"{source}|{model}|{language}".encode()).hexdigest()
+
+
+def payload_digest(payload: AudioPayload) -> str:
+    """SHA-256 содержимого файла (в памяти или на диске)"""
+    digest = hashlib.sha256()
+    if payload.in_memory:
+        digest.update(payload.data)
+    elif payload.size:
+        # Файл на диске (в том числе у локального сервера Bot API) отображается
+        # в память без чтения в буфер
+        with open(payload.path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            digest.update(view)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """Двухуровневый кэш распознанного текста: LRU в памяти + файлы на диске"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, disk_dir: Optional[Path] = None,
+                 ttl_sec: float = DEFAULT_TTL_HOURS * 3600):
+        self.max_entries = max_entries
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.ttl_sec = ttl_sec
+        self._memory: "OrderedDict[str, CachedTranscription]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.disk_dir is not None
+
+    def _expired(self, entry: CachedTranscription) -> bool:
+        return self.ttl_sec > 0 and time.time() - entry.created_at > self.ttl_sec
+
+    def _remember(self, key: str, entry: CachedTranscription):
+        """Кладет запись в LRU (самая старая по использованию вытесняется)"""
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[CachedTranscription]:
+        path = self._disk_path(key)
+        try:
+            entry = CachedTranscription(**json.loads(path.read_text(encoding="utf-8")))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Поврежденная запись кэша {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        if self._expired(entry):
+            path.unlink(missing_ok=True)
+            return None
+        return entry
+
+    def _write_disk(self, keys: Iterable[str], entry: CachedTranscription):
+        data = json.dumps(asdict(entry), ensure_ascii=False)
+        for key in keys:
+            # Запись через временный файл: параллельное чтение не увидит половину JSON
+            temp = self.disk_dir / f".{key}.{uuid.uuid4().hex}.tmp"
+            temp.write_text(data, encoding="utf-8")
+            os.replace(temp, self._disk_path(key))
+
+    async def get(self, key: str) -> Optional[CachedTranscription]:
+        """Результат по ключу (сначала память, потом диск) или None"""
+        if not self.enabled:
+            return None
+
+        entry = self._memory.get(key)
+        if entry is not None and self._expired(entry):
+            del self._memory[key]
+            entry = None
+        if entry is not None:
+            self._memory.move_to_end(key)
+        elif self.disk_dir:
+            try:
+                entry = await asyncio.to_thread(self._read_disk, key)
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать кэш распознавания: {e}")
+            if entry is not None:
+                self._remember(key, entry)
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def put(self, keys: Iterable[str], entry: CachedTranscription):
+        """Сохраняет результат под несколькими ключами (file_unique_id и хеш содержимого)"""
+        if not self.enabled:
+            return
+        keys = [key for key in keys if key]
+        for key in keys:
+            self._remember(key, entry)
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, keys, entry)
+            except Exception as e:
+                logger.warning(f"Не удалось записать кэш распознавания на диск: {e}")
+
+    def prune_disk(self) -> int:
+        """Удаляет устаревшие записи с диска (синхронно); возвращает их число"""
+        if not self.disk_dir or self.ttl_sec <= 0:
+            return 0
+        removed = 0
+        threshold = time.time() - self.ttl_sec
+        for path in self.disk_dir.glob("*.json"):
+            try:
+                if path.stat().st_mtime < threshold:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Попадания, промахи и размер кэша"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total * 100, 1) if total else 0.0,
+            'memory_entries': len(self._memory),
+            'disk': str(self.disk_dir) if self.disk_dir else None,
+        }
+
+
+# Общий кэш для всех модулей (создается при первом использовании)
+_transcription_cache: Optional[TranscriptionCache] = None
+
+
+def get_transcription_cache() -> TranscriptionCache:
+    """
+    Общий кэш распознавания
+
+    TRANSCRIPTION_CACHE_SIZE - записей в памяти (0 - без памяти),
+    TRANSCRIPTION_CACHE_DIR - папка для записей на диске (пусто - только память),
+    TRANSCRIPTION_CACHE_TTL_HOURS - срок хранения (0 - бессрочно).
+    """
+    global _transcription_cache
+    if _transcription_cache is None:
+        disk_dir = os.getenv("TRANSCRIPTION_CACHE_DIR", "").strip() or None
+        _transcription_cache = TranscriptionCache(
+            max_entries=int(os.getenv("TRANSCRIPTION_CACHE_SIZE", str(DEFAULT_MAX_ENTRIES))),
+            disk_dir=Path(disk_dir) if disk_dir else None,
+            ttl_sec=float(os.getenv("TRANSCRIPTION_CACHE_TTL_HOURS", str(DEFAULT_TTL_HOURS))) * 3600
+        )
+        removed = _transcription_cache.prune_disk()
+        if removed:
+            logger.info(f"Кэш распознавания: удалено устаревших записей - {removed}")
+    return _transcription_cache
@@ -0,0 +1,119 @@
+"""
+Длинные записи: нарезка по паузам и склейка распознанного текста
+
+Запись делится на сегменты не длиннее заданного, границы выбираются в самых
+тихих местах возле предела длины (чтобы не резать слова). Соседние сегменты
+немного перекрываются; при склейке повторившиеся на стыке слова удаляются.
+"""
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Где искать тихое место для разреза: последние N секунд перед пределом длины
+SPLIT_SEARCH_SEC = 20.0
+# Длина кадра для поиска паузы
+SPLIT_FRAME_MS = 50
+# Сколько слов на стыке сравнивать при удалении повторов
+MAX_OVERLAP_WORDS = 30
+# Пометка на месте сегмента, который не удалось распознать
+MISSING_SEGMENT_MARK = "[…]"
+
+
+@dataclass
+class Chunk:
+    """Сегмент записи в сэмплах: [start, end)"""
+    index: int
+    start: int
+    end: int
+
+    def duration(self, sample_rate: int) -> float:
+        return (self.end - self.start) / sample_rate
+
+
+def _quietest_point(samples: "np.ndarray", start: int, end: int, frame_len: int) -> int:
+    """Середина самого тихого кадра в диапазоне [start, end) (из равных - ближайшего к концу)"""
+    frames = (end - start) // frame_len
+    if frames <= 1:
+        return end
+    window = samples[start:start + frames * frame_len].astype(np.float32)
+    energy = np.mean(window.reshape(frames, frame_len) ** 2, axis=1)
+    quietest = frames - 1 - int(np.argmin(energy[::-1]))
+    return start + quietest * frame_len + frame_len // 2
+
+
+def plan_chunks(
+    samples: "np.ndarray",
+    sample_rate: int,
+    max_chunk_sec: float,
+    overlap_sec: float = 1.0,
+) -> List[Chunk]:
+    """
+    Делит запись на сегменты не длиннее max_chunk_sec (с учетом перекрытия)
+
+    Каждый разрез делается в самом тихом месте последних SPLIT_SEARCH_SEC
+    перед пределом длины; следующий сегмент начинается на overlap_sec раньше.
+    """
+    total = len(samples)
+    max_len = int(max_chunk_sec * sample_rate)
+    overlap = int(overlap_sec * sample_rate)
+    if total <= max_len:
+        return [Chunk(0, 0, total)]
+
+    frame_len = max(int(sample_rate * SPLIT_FRAME_MS / 1000), 1)
+    search = min(int(SPLIT_SEARCH_SEC * sample_rate), max_len // 2)
+
+    chunks: List[Chunk] = []
+    start = 0
+    while start < total:
+        limit = start + max_len
+        if limit >= total:
+            chunks.append(Chunk(len(chunks), start, total))
+            break
+        cut = _quietest_point(samples, limit - search, limit, frame_len)
+        chunks.append(Chunk(len(chunks), start, cut))
+        start = max(cut - overlap, start + 1)
+    return chunks
+
+
+def _normalize(word: str) -> str:
+    """Слово без регистра и пунктуации (для сравнения на стыке)"""
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def _overlap_length(previous: List[str], current: List[str]) -> int:
+    """Сколько первых слов current повторяют последние слова previous"""
+    prev_norm = [_normalize(w) for w in previous[-MAX_OVERLAP_WORDS:]]
+    curr_norm = [_normalize(w) for w in current[:MAX_OVERLAP_WORDS]]
+    for size in range(min(len(prev_norm), len(curr_norm)), 0, -1):
+        if prev_norm[-size:] != curr_norm[:size] or not any(prev_norm[-size:]):
+            continue
+        # Одно короткое слово («и», «а») часто повторяется и без перекрытия
+        if size == 1 and len(prev_norm[-1]) < 3:
+            continue
+        return size
+    return 0
+
+
+def stitch_transcripts(parts: List[Optional[str]]) -> str:
+    """
+    Склеивает тексты сегментов по порядку, убирая повторы на стыках
+
+    None на месте сегмента означает, что его не удалось распознать.
+    """
+    words: List[str] = []
+    for part in parts:
+        if part is None:
+            words.append(MISSING_SEGMENT_MARK)
+            continue
+        current = part.split()
+        if not current:
+            continue
+        skip = _overlap_length(words, current) if words else 0
+        words.extend(current[skip:])
+    return " ".join(words)
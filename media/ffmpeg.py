@@ -0,0 +1,141 @@
+"""
+Обработка аудио через ffmpeg без промежуточных файлов (stdin → stdout)
+"""
+import asyncio
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import List, Optional
+
+from utils.process import run_process
+from .payload import AudioPayload
+from .workspace import get_workspace_manager
+
+logger = logging.getLogger(__name__)
+
+# ffmpeg запускается как отдельный процесс (отменяемый через asyncio)
+FFMPEG_AVAILABLE = shutil.which("ffmpeg") is not None
+
+# Частота дискретизации, с которой работает Whisper
+WHISPER_SAMPLE_RATE = 16000
+
+# Контейнеры ISO BMFF: из pipe читаются, только если индекс moov в начале файла
+SEEKABLE_CONTAINERS = {"mp4", "m4a", "mov", "3gp"}
+
+# Форматы, которые принимает Whisper API
+WHISPER_API_FORMATS = {"flac", "m4a", "mp3", "mp4", "mpeg", "mpga", "oga", "ogg", "wav", "webm"}
+
+
+# Битрейт Opus для речи: 16 кГц моно разборчиво уже на 16-24 кбит/с
+DEFAULT_SPEECH_BITRATE = "24k"
+
+# Пул процессов ffmpeg: одновременно работает не больше FFMPEG_MAX_PROCESSES
+# (по умолчанию - число ядер), остальные задачи ждут своей очереди
+_process_slots: Optional[asyncio.Semaphore] = None
+
+
+class FFmpegError(Exception):
+    """Ошибка обработки аудио в ffmpeg"""
+
+
+def _get_process_slots() -> asyncio.Semaphore:
+    """Семафор пула процессов (создается при первом использовании)"""
+    global _process_slots
+    if _process_slots is None:
+        limit = int(os.getenv("FFMPEG_MAX_PROCESSES", "0")) or os.cpu_count() or 2
+        _process_slots = asyncio.Semaphore(limit)
+    return _process_slots
+
+
+async def _run(input_args: List[str], output_args: List[str], input_data: Optional[bytes]) -> bytes:
+    """Запускает ffmpeg с выводом в stdout (в пределах пула процессов)"""
+    args = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    if input_data is None:
+        args.append("-nostdin")
+    async with _get_process_slots():
+        returncode, stdout, stderr = await run_process([*args, *input_args, *output_args, "pipe:1"], input_data=input_data)
+    if returncode != 0:
+        raise FFmpegError(stderr.decode(errors="ignore")[-300:] or f"код {returncode}")
+    return stdout
+
+
+def is_streamable_mp4(data: bytes) -> bool:
+    """
+    Проверяет, что индекс (moov) лежит до данных (mdat) - такой mp4 читается из pipe
+
+    Иначе ffmpeg прочитает из stdin только часть потока и завершится «успешно»
+    с почти пустым результатом.
+    """
+    offset = 0
+    while offset + 8 <= len(data):
+        size = int.from_bytes(data[offset:offset + 4], "big")
+        box_type = data[offset + 4:offset + 8]
+        if box_type == b"moov":
+            return True
+        if box_type == b"mdat":
+            return False
+        if size == 1 and offset + 16 <= len(data):
+            size = int.from_bytes(data[offset + 8:offset + 16], "big")
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+
+async def run_ffmpeg(payload: AudioPayload, output_args: List[str]) -> bytes:
+    """
+    Пропускает аудио через ffmpeg и возвращает результат из stdout
+
+    Данные из памяти подаются через stdin. mp4 с индексом в конце файла
+    (без faststart) из pipe не читается - такие данные один раз
+    записываются в рабочую папку (по возможности в /dev/shm).
+    """
+    if not FFMPEG_AVAILABLE:
+        raise FFmpegError("FFmpeg недоступен")
+
+    if not payload.in_memory:
+        return await _run(["-i", str(payload.path)], output_args, None)
+
+    if payload.extension not in SEEKABLE_CONTAINERS or is_streamable_mp4(payload.data):
+        return await _run(["-i", "pipe:0"], output_args, payload.data)
+
+    async with get_workspace_manager().workspace(len(payload.data)) as workspace:
+        await workspace.reserve(len(payload.data))
+        spill = workspace.file(f".{payload.extension}")
+        spill.write_bytes(payload.data)
+        return await _run(["-i", str(spill)], output_args, None)
+
+
+async def encode_speech_opus(payload: AudioPayload, bitrate: str = DEFAULT_SPEECH_BITRATE) -> AudioPayload:
+    """Убирает видео и перекодирует звук в моно 16 кГц Opus/OGG (формат голосовых Telegram)"""
+    data = await run_ffmpeg(payload, [
+        "-vn", "-ac", "1", "-ar", str(WHISPER_SAMPLE_RATE),
+        "-c:a", "libopus", "-b:a", bitrate, "-application", "voip", "-f", "ogg"
+    ])
+    return AudioPayload(filename=f"{Path(payload.filename).stem}.ogg", data=data)
+
+
+async def encode_pcm_opus(pcm: bytes, filename: str, sample_rate: int = WHISPER_SAMPLE_RATE,
+                          bitrate: str = DEFAULT_SPEECH_BITRATE) -> AudioPayload:
+    """Кодирует моно PCM s16le (например, после обрезки тишины) в Opus/OGG"""
+    if not FFMPEG_AVAILABLE:
+        raise FFmpegError("FFmpeg недоступен")
+    data = await _run(
+        ["-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0"],
+        ["-c:a", "libopus", "-b:a", bitrate, "-application", "voip", "-f", "ogg"],
+        pcm
+    )
+    return AudioPayload(filename=f"{Path(filename).stem}.ogg", data=data)
+
+
+async def transcode_for_api(payload: AudioPayload) -> AudioPayload:
+    """Перекодирует аудио в OGG/Opus, если Whisper API не принимает формат как есть"""
+    if payload.extension in WHISPER_API_FORMATS:
+        return payload
+    return await encode_speech_opus(payload)
+
+
+async def decode_pcm(payload: AudioPayload, sample_rate: int = WHISPER_SAMPLE_RATE) -> bytes:
+    """Декодирует аудио в моно PCM s16le с нужной частотой дискретизации"""
+    return await run_ffmpeg(payload, ["-vn", "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate)])
@@ -0,0 +1,94 @@
+"""
+Метрики аудио-конвейера: время этапов и пиковое потребление памяти
+"""
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# resource есть только на Unix (на Windows пиковую память не считаем)
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Пиковый RSS процесса в МБ (на Linux ru_maxrss в КБ, на macOS - в байтах)"""
+    if not RESOURCE_AVAILABLE:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divider = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(maxrss / divider, 1)
+
+
+class PipelineMetrics:
+    """Метрики обработки одного файла"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+        self.started_at = time.monotonic()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Замеряет длительность этапа (повторные замеры суммируются)"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.monotonic() - started
+
+    def add(self, name: str, value: float):
+        """Увеличивает счетчик (байты, секунды аудио и т.п.)"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self):
+        """Завершает замер, пишет его в лог и в общую статистику"""
+        total = time.monotonic() - self.started_at
+        stages = ", ".join(f"{name}={sec * 1000:.0f}мс" for name, sec in self.timings.items())
+        counters = ", ".join(f"{name}={value:g}" for name, value in self.counters.items())
+        logger.info(
+            f"Аудио [{self.label}]: всего {total * 1000:.0f}мс ({stages})"
+            f"{f'; {counters}' if counters else ''}; пик RSS {peak_rss_mb()} МБ"
+        )
+        audio_pipeline_stats.record(self, total)
+
+
+class AudioPipelineStats:
+    """Накопленная статистика аудио-конвейера"""
+
+    def __init__(self):
+        self.files = 0
+        self.total_sec = 0.0
+        self.stage_sec: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+
+    def record(self, metrics: PipelineMetrics, total_sec: float):
+        """Добавляет метрики обработанного файла"""
+        self.files += 1
+        self.total_sec += total_sec
+        for name, sec in metrics.timings.items():
+            self.stage_sec[name] = self.stage_sec.get(name, 0.0) + sec
+        for name, value in metrics.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Средние времена этапов (мс), счетчики и пиковая память"""
+        files = max(self.files, 1)
+        return {
+            'files': self.files,
+            'avg_total_ms': round(self.total_sec / files * 1000),
+            'avg_stage_ms': {name: round(sec / files * 1000) for name, sec in self.stage_sec.items()},
+            'counters': dict(self.counters),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+
+# Глобальная статистика
+audio_pipeline_stats = AudioPipelineStats()
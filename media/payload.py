@@ -0,0 +1,105 @@
+"""
+Аудио в памяти: скачивание из Telegram без временных файлов
+
+Файл скачивается общим менеджером скачивания (media.telegram_files) прямо в
+буфер и загружается в Whisper API как именованный файл из памяти. В рабочую
+папку задания (media.workspace) попадают только файлы больше порога (чтобы не
+держать в памяти несколько крупных файлов сразу).
+
+С локальным сервером Bot API файл не копируется: конвейер читает его прямо
+с диска сервера.
+"""
+import asyncio
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from aiogram import Bot
+
+from utils.deadline import Deadline
+from .telegram_files import get_telegram_downloads, local_file_path
+
+if TYPE_CHECKING:
+    from .workspace import Workspace
+
+logger = logging.getLogger(__name__)
+
+# Файлы больше порога скачиваются на диск
+DEFAULT_MEMORY_LIMIT_MB = 20
+
+
+@dataclass
+class AudioPayload:
+    """Аудио-данные в памяти (data) или, для крупных файлов, на диске (path)"""
+    filename: str
+    data: Optional[bytes] = None
+    path: Optional[Path] = None
+
+    @property
+    def in_memory(self) -> bool:
+        return self.data is not None
+
+    @property
+    def size(self) -> int:
+        if self.data is not None:
+            return len(self.data)
+        return self.path.stat().st_size if self.path and self.path.exists() else 0
+
+    @property
+    def extension(self) -> str:
+        """Расширение без точки в нижнем регистре"""
+        return Path(self.filename).suffix.lower().lstrip(".")
+
+    @contextmanager
+    def upload_file(self):
+        """Файл для OpenAI SDK: (имя, bytes) из памяти или открытый файл с диска"""
+        if self.data is not None:
+            yield (self.filename, self.data)
+        else:
+            with open(self.path, "rb") as file:
+                yield (self.filename, file)
+
+
+async def download_telegram_file(
+    bot: Bot,
+    file_id: str,
+    filename: str,
+    workspace: "Workspace",
+    file_size: Optional[int] = None,
+    deadline: Optional[Deadline] = None,
+    memory_limit_mb: float = DEFAULT_MEMORY_LIMIT_MB,
+    file_unique_id: Optional[str] = None,
+) -> AudioPayload:
+    """
+    Скачивает файл из Telegram в память (или в рабочую папку, если он больше порога)
+
+    Место под крупный файл резервируется в квоте рабочих папок, а сам файл
+    удаляется вместе с рабочей папкой задания.
+
+    Raises:
+        DeadlineExceeded: если бюджет времени исчерпан
+        Exception: при ошибке получения или скачивания файла
+    """
+    downloads = get_telegram_downloads()
+    file_info = await downloads.get_file(bot, file_id)
+
+    # Локальный сервер Bot API: файл уже на диске - без скачивания и копирования
+    local_path = local_file_path(bot, file_info)
+    if local_path is not None:
+        return AudioPayload(filename=filename, path=local_path)
+
+    timeout = deadline.timeout(stage="скачивание") if deadline else 60
+    size = file_size or file_info.file_size or 0
+
+    if size > memory_limit_mb * 1024 * 1024:
+        # Ждем места в квоте не дольше, чем позволяет бюджет времени
+        await asyncio.wait_for(workspace.reserve(size), timeout)
+        path = workspace.file(Path(filename).suffix)
+        await downloads.download(bot, file_id, path, file_unique_id, timeout)
+        logger.info(f"Крупный файл ({size / 1024 / 1024:.1f} МБ) скачан на диск: {path}")
+        return AudioPayload(filename=filename, path=path)
+
+    data = await downloads.read(bot, file_id, file_unique_id, timeout)
+    return AudioPayload(filename=filename, data=data)
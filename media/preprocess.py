@@ -0,0 +1,58 @@
+"""
+Подготовка аудио к отправке в Whisper API
+
+Whisper нужна только речь: моно 16 кГц. Видео из кружочков и высокий битрейт
+mp3/m4a/wav увеличивают загрузку в разы, поэтому перед отправкой звук
+извлекается и перекодируется в Opus с низким битрейтом. Голосовые Telegram
+уже в Opus - их небольшие файлы отправляются как есть.
+"""
+import logging
+from typing import Optional
+
+from .ffmpeg import DEFAULT_SPEECH_BITRATE, FFMPEG_AVAILABLE, encode_speech_opus
+from .metrics import PipelineMetrics
+from .payload import AudioPayload
+
+logger = logging.getLogger(__name__)
+
+# Контейнеры с Opus (голосовые сообщения Telegram)
+OPUS_EXTENSIONS = {"ogg", "oga", "opus"}
+
+
+async def prepare_for_whisper(
+    payload: AudioPayload,
+    bitrate: str = DEFAULT_SPEECH_BITRATE,
+    skip_opus_below_mb: float = 1.0,
+    metrics: Optional[PipelineMetrics] = None,
+) -> AudioPayload:
+    """
+    Извлекает звук и перекодирует его в моно 16 кГц Opus/OGG
+
+    Возвращает исходный payload, если перекодирование не нужно (небольшой
+    Opus), невозможно (нет ffmpeg) или не уменьшило размер.
+    """
+    if not FFMPEG_AVAILABLE:
+        return payload
+
+    size = payload.size
+    if payload.extension in OPUS_EXTENSIONS and size <= skip_opus_below_mb * 1024 * 1024:
+        return payload
+
+    try:
+        if metrics:
+            with metrics.stage("preprocess"):
+                encoded = await encode_speech_opus(payload, bitrate)
+        else:
+            encoded = await encode_speech_opus(payload, bitrate)
+    except Exception as e:
+        # API принимает исходный формат - просто отправляем как есть
+        logger.warning(f"Не удалось перекодировать {payload.filename}: {e}")
+        return payload
+
+    if encoded.size >= size:
+        return payload
+
+    logger.info(f"{payload.filename}: {size / 1024:.0f} КБ → {encoded.size / 1024:.0f} КБ Opus")
+    if metrics:
+        metrics.add("bytes_saved", size - encoded.size)
+    return encoded
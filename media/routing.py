@@ -0,0 +1,119 @@
+"""
+Выбор способа распознавания по длительности записи и наблюдаемой задержке
+
+Короткое голосовое быстрее распознает «теплая» локальная модель, чем запрос
+к API (одна загрузка и ответ по сети дольше, чем проход tiny/base на CPU).
+Длинные записи выгоднее отправлять в API или распознавать сегментами.
+
+Решение учитывает длительность (после обрезки тишины), размер файла, очередь
+локального пула и скользящее среднее задержки каждого способа отдельно для
+коротких, средних и длинных записей. Решения и их итоги пишутся в лог и
+накапливаются в статистике.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROUTE_API = "api"
+ROUTE_LOCAL = "local"
+ROUTE_CHUNKED = "chunked"
+
+# Лимит размера файла Whisper API
+API_MAX_BYTES = 25 * 1024 * 1024
+
+# Границы групп длительности для оценки задержки (секунды)
+DURATION_BUCKETS = ((30, "short"), (180, "medium"))
+# Вес нового замера в скользящем среднем
+EWMA_ALPHA = 0.3
+# Локальная модель выбирается, только если ее оценка заметно лучше
+LOCAL_ADVANTAGE = 0.8
+
+
+def duration_bucket(duration_sec: float) -> str:
+    """Группа длительности: short, medium или long"""
+    for limit, name in DURATION_BUCKETS:
+        if duration_sec <= limit:
+            return name
+    return "long"
+
+
+@dataclass
+class RouteDecision:
+    """Выбранный способ и причина (для лога)"""
+    route: str
+    reason: str
+
+
+class TranscriptionRouter:
+    """Политика выбора API / локальная модель / сегменты и статистика задержек"""
+
+    def __init__(self, short_local_sec: float = 15.0, local_max_queue: int = 1):
+        self.short_local_sec = short_local_sec
+        self.local_max_queue = local_max_queue
+        # (способ, группа) -> сглаженная задержка на секунду записи
+        self._sec_per_sec: Dict[Tuple[str, str], float] = {}
+        self.decisions: Dict[str, int] = {}
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+
+    def estimate(self, route: str, duration_sec: float) -> Optional[float]:
+        """Ожидаемая задержка способа для записи этой длительности (None - замеров еще нет)"""
+        rate = self._sec_per_sec.get((route, duration_bucket(duration_sec)))
+        return None if rate is None else rate * max(duration_sec, 1.0)
+
+    def choose(self, duration_sec: float, size_bytes: int, api_available: bool, local_available: bool,
+               local_warm: bool, local_queue: int, long_audio: bool = False) -> RouteDecision:
+        """Выбирает способ распознавания"""
+        decision = self._choose(duration_sec, size_bytes, api_available, local_available,
+                                local_warm, local_queue, long_audio)
+        self.decisions[decision.route] = self.decisions.get(decision.route, 0) + 1
+        logger.info(f"Маршрут распознавания {duration_sec:.1f} сек: {decision.route} ({decision.reason})")
+        return decision
+
+    def _choose(self, duration_sec: float, size_bytes: int, api_available: bool, local_available: bool,
+                local_warm: bool, local_queue: int, long_audio: bool) -> RouteDecision:
+        if long_audio:
+            return RouteDecision(ROUTE_CHUNKED, "длинная запись")
+        if not api_available:
+            return RouteDecision(ROUTE_LOCAL, "API недоступен")
+        if not local_available:
+            return RouteDecision(ROUTE_API, "локальная модель недоступна")
+        if size_bytes > API_MAX_BYTES:
+            return RouteDecision(ROUTE_LOCAL, "файл больше лимита API")
+        if not local_warm:
+            return RouteDecision(ROUTE_API, "локальная модель не загружена")
+        if local_queue >= self.local_max_queue:
+            return RouteDecision(ROUTE_API, f"очередь локальной модели: {local_queue}")
+
+        api_estimate = self.estimate(ROUTE_API, duration_sec)
+        local_estimate = self.estimate(ROUTE_LOCAL, duration_sec)
+        if api_estimate is not None and local_estimate is not None:
+            if local_estimate < api_estimate * LOCAL_ADVANTAGE:
+                return RouteDecision(ROUTE_LOCAL, f"оценка {local_estimate:.1f} с против {api_estimate:.1f} с у API")
+            return RouteDecision(ROUTE_API, f"оценка {api_estimate:.1f} с против {local_estimate:.1f} с локально")
+
+        # Замеров пока нет - короткие записи локально, остальные через API
+        if duration_sec <= self.short_local_sec:
+            return RouteDecision(ROUTE_LOCAL, "короткая запись")
+        return RouteDecision(ROUTE_API, "по умолчанию")
+
+    def record(self, route: str, duration_sec: float, latency_sec: float, ok: bool):
+        """Итог распознавания: успех/ошибка и задержка (для следующих решений)"""
+        outcome = self.outcomes.setdefault(route, {'ok': 0, 'failed': 0})
+        outcome['ok' if ok else 'failed'] += 1
+        if not ok or duration_sec <= 0:
+            return
+        key = (route, duration_bucket(duration_sec))
+        rate = latency_sec / max(duration_sec, 1.0)
+        previous = self._sec_per_sec.get(key)
+        self._sec_per_sec[key] = rate if previous is None else previous + EWMA_ALPHA * (rate - previous)
+        logger.info(f"Распознавание [{route}] {duration_sec:.1f} сек аудио за {latency_sec:.1f} сек")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Решения, итоги и оценки задержки (секунд на секунду записи)"""
+        return {
+            'decisions': dict(self.decisions),
+            'outcomes': {route: dict(outcome) for route, outcome in self.outcomes.items()},
+            'sec_per_sec': {f"{route}/{bucket}": round(rate, 3) for (route, bucket), rate in self._sec_per_sec.items()},
+        }
@@ -0,0 +1,441 @@
+"""
+Доступ к файлам Telegram: облачный Bot API или локальный сервер telegram-bot-api
+
+По умолчанию файлы скачиваются по HTTP с api.telegram.org, а облачный Bot API
+отдает файлы не больше 20 МБ. С собственным сервером, запущенным с флагом
+--local (TELEGRAM_API_URL + TELEGRAM_API_LOCAL=true), get_file возвращает путь
+к файлу на диске сервера: файлы читаются напрямую, без копирования по HTTP,
+а лимит - 2000 МБ.
+
+Если сервер работает в контейнере, его рабочая папка видна боту по другому
+пути: TELEGRAM_API_SERVER_DIR (путь на сервере) заменяется на
+TELEGRAM_API_LOCAL_DIR (тот же каталог у бота).
+
+Все модули скачивают файлы через общий менеджер (TelegramDownloads):
+- ответы get_file кэшируются (ссылка на файл действует не меньше часа);
+- одновременные запросы одного файла (по file_unique_id) скачивают его один раз;
+- число одновременных скачиваний ограничено;
+- недавние файлы хранятся в LRU в памяти и (если задана папка) на диске.
+Модуль получает либо bytes, либо путь к файлу.
+"""
+import asyncio
+import io
+import logging
+import math
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import SimpleFilesPathWrapper, TelegramAPIServer
+from aiogram.types import File
+
+from .workspace import get_workspace_manager
+
+logger = logging.getLogger(__name__)
+
+# Лимиты скачивания файлов ботом
+CLOUD_FILE_LIMIT_BYTES = 20 * 1024 * 1024
+LOCAL_FILE_LIMIT_BYTES = 2000 * 1024 * 1024
+
+# Параметры по умолчанию (переопределяются переменными окружения)
+DEFAULT_MAX_CONCURRENT = 4
+DEFAULT_MEMORY_CACHE_MB = 64
+DEFAULT_DISK_CACHE_MB = 512
+# Ссылка get_file действует не меньше часа - храним ответ чуть меньше
+FILE_INFO_TTL_SEC = 50 * 60
+FILE_INFO_MAX_ENTRIES = 1000
+
+
+def create_bot_session() -> Optional[AiohttpSession]:
+    """
+    Сессия бота для собственного сервера Bot API (None - облачный api.telegram.org)
+
+    TELEGRAM_API_URL - адрес сервера (например, http://localhost:8081),
+    TELEGRAM_API_LOCAL - сервер запущен с --local (файлы читаются с диска),
+    TELEGRAM_API_SERVER_DIR / TELEGRAM_API_LOCAL_DIR - замена пути к файлам.
+    """
+    api_url = os.getenv("TELEGRAM_API_URL", "").strip()
+    if not api_url:
+        return None
+
+    is_local = os.getenv("TELEGRAM_API_LOCAL", "false").lower() == "true"
+    server_dir = os.getenv("TELEGRAM_API_SERVER_DIR", "").strip()
+    local_dir = os.getenv("TELEGRAM_API_LOCAL_DIR", "").strip()
+    kwargs = {}
+    if is_local and server_dir and local_dir:
+        kwargs['wrap_local_file'] = SimpleFilesPathWrapper(Path(server_dir), Path(local_dir))
+
+    logger.info(f"Bot API: {api_url}{' (локальный режим)' if is_local else ''}")
+    return AiohttpSession(api=TelegramAPIServer.from_base(api_url, is_local=is_local, **kwargs))
+
+
+def is_local_mode(bot: Bot) -> bool:
+    """Сервер Bot API отдает файлы с локального диска"""
+    return bot.session.api.is_local
+
+
+def max_download_bytes(bot: Bot) -> int:
+    """Максимальный размер файла, который бот может скачать"""
+    return LOCAL_FILE_LIMIT_BYTES if is_local_mode(bot) else CLOUD_FILE_LIMIT_BYTES
+
+
+def local_file_path(bot: Bot, file_info: File) -> Optional[Path]:
+    """Путь к файлу на диске в локальном режиме (None - файл нужно скачивать по HTTP)"""
+    if not is_local_mode(bot) or not file_info.file_path:
+        return None
+    path = Path(bot.session.api.wrap_local_file.to_local(file_info.file_path))
+    if not path.is_file():
+        logger.warning(f"Файл локального сервера Bot API недоступен боту: {path}")
+        return None
+    return path
+
+
+def _link_or_copy(source: Path, destination: Path):
+    """Жесткая ссылка на файл (без копирования), а на другой файловой системе - копия"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class TelegramDownloads:
+    """Общий менеджер скачивания файлов Telegram: кэш get_file, дедупликация, лимит и LRU файлов"""
+
+    def __init__(self, max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+                 memory_bytes: int = DEFAULT_MEMORY_CACHE_MB * 1024 * 1024,
+                 disk_dir: Optional[Path] = None, disk_bytes: int = DEFAULT_DISK_CACHE_MB * 1024 * 1024):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_bytes = disk_bytes
+        self._semaphore = asyncio.Semaphore(max(max_concurrent, 1))
+        self._file_info: "OrderedDict[str, Tuple[File, float]]" = OrderedDict()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_used = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_used = 0
+        # Скачивания в процессе: bytes (read) или путь к файлу (download)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Сколько запросов ждут каждое скачивание (временный файл удаляет последний)
+        self._waiting: Dict[asyncio.Task, int] = {}
+
+        # Статистика
+        self.file_info_hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.downloads = 0
+        self.deduplicated = 0
+        self.bytes_downloaded = 0
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._load_disk_index()
+
+    # ----- get_file -----
+
+    async def get_file(self, bot: Bot, file_id: str) -> File:
+        """Ответ get_file (из кэша, пока ссылка на файл действует)"""
+        cached = self._file_info.get(file_id)
+        if cached and time.monotonic() - cached[1] < FILE_INFO_TTL_SEC:
+            self.file_info_hits += 1
+            self._file_info.move_to_end(file_id)
+            return cached[0]
+
+        file_info = await bot.get_file(file_id)
+        if not file_info.file_path:
+            raise Exception("Не удалось получить путь к файлу")
+        self._file_info[file_id] = (file_info, time.monotonic())
+        self._file_info.move_to_end(file_id)
+        while len(self._file_info) > FILE_INFO_MAX_ENTRIES:
+            self._file_info.popitem(last=False)
+        return file_info
+
+    # ----- bytes -----
+
+    async def read(self, bot: Bot, file_id: str, file_unique_id: Optional[str] = None,
+                   timeout: Union[int, float] = 60) -> bytes:
+        """
+        Содержимое файла: из кэша, с диска локального сервера Bot API или скачанное
+
+        Одновременные запросы одного файла ждут одно скачивание; отмена запроса
+        не прерывает скачивание, нужное другим.
+
+        Raises:
+            asyncio.TimeoutError: если файл не получен за timeout секунд
+        """
+        key = file_unique_id or file_id
+        data = self._memory.get(key)
+        if data is not None:
+            self.memory_hits += 1
+            self._memory.move_to_end(key)
+            return data
+        if key in self._disk:
+            try:
+                data = await asyncio.to_thread(self._read_disk, key)
+            except OSError:
+                self._forget_disk(key)
+            else:
+                self.disk_hits += 1
+                self._disk.move_to_end(key)
+                self._remember(key, data)
+                return data
+
+        task = self._join(key, lambda: self._fetch(bot, file_id, key, timeout))
+        return await self._wait(task, timeout, self._as_bytes)
+
+    def _join(self, key: str, start: Callable[[], Awaitable[Union[bytes, Path]]]) -> asyncio.Task:
+        """Скачивание файла: уже идущее или новое"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(start())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.deduplicated += 1
+        return task
+
+    async def _wait(self, task: asyncio.Task, timeout: Union[int, float],
+                    use: Callable[[Union[bytes, Path]], Awaitable[Any]]) -> Any:
+        """Ждет скачивание (отмена ожидания его не прерывает) и забирает результат"""
+        self._waiting[task] = self._waiting.get(task, 0) + 1
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), timeout)
+            return await use(result)
+        finally:
+            self._waiting[task] -= 1
+            self._release(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Ошибку получают ожидающие; если их не осталось - только в лог
+        if not task.cancelled() and task.exception():
+            logger.debug(f"Не удалось скачать файл Telegram: {task.exception()}")
+        self._release(task)
+
+    def _release(self, task: asyncio.Task):
+        """Завершенное скачивание без ожидающих: временный файл больше не нужен"""
+        if not task.done() or self._waiting.get(task):
+            return
+        self._waiting.pop(task, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        # Временные файлы начинаются с точки, файлы LRU на диске остаются
+        if isinstance(result, Path) and result.name.startswith("."):
+            self._remove_staging(result)
+
+    @staticmethod
+    async def _as_bytes(result: Union[bytes, Path]) -> bytes:
+        if isinstance(result, Path):
+            return await asyncio.to_thread(result.read_bytes)
+        return result
+
+    async def _fetch(self, bot: Bot, file_id: str, key: str, timeout: Union[int, float]) -> bytes:
+        """Одно скачивание файла (результат - в кэш)"""
+        file_info = await self.get_file(bot, file_id)
+        path = local_file_path(bot, file_info)
+        if path is not None:
+            # Файл уже на диске локального сервера - не копируем его в кэш
+            return await asyncio.to_thread(path.read_bytes)
+
+        async with self._semaphore:
+            buffer = io.BytesIO()
+            # aiogram принимает целый таймаут в секундах
+            await bot.download_file(file_info.file_path, destination=buffer, timeout=math.ceil(timeout))
+        data = buffer.getvalue()
+        self.downloads += 1
+        self.bytes_downloaded += len(data)
+        self._remember(key, data)
+        if self.disk_dir and len(data) <= self.disk_bytes // 4 and key not in self._disk:
+            try:
+                await asyncio.to_thread(self._write_disk, key, data)
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить файл Telegram в кэш на диске: {e}")
+            else:
+                self._disk[key] = len(data)
+                self._disk_used += len(data)
+                self._evict_disk()
+        return data
+
+    # ----- путь к файлу -----
+
+    async def download(self, bot: Bot, file_id: str, destination: Path, file_unique_id: Optional[str] = None,
+                       timeout: Union[int, float] = 60) -> Path:
+        """
+        Файл на диске: путь у локального сервера Bot API или destination
+
+        Одновременные запросы одного файла ждут одно скачивание (как и read).
+        Файл скачивается во временный файл и, если помещается, переносится в LRU
+        на диске; в destination он попадает жесткой ссылкой (или копией).
+        Без папки кэша временный файл создается в отдельной папке скачивания (не
+        в папке задания: задание может завершиться раньше других ожидающих) и
+        удаляется, когда его получат все ожидающие. Возвращенный путь, отличный
+        от destination, удалять нельзя.
+        """
+        file_info = await self.get_file(bot, file_id)
+        path = local_file_path(bot, file_info)
+        if path is not None:
+            return path
+
+        key = file_unique_id or file_id
+        data = self._memory.get(key)
+        if data is not None:
+            self.memory_hits += 1
+            await asyncio.to_thread(destination.write_bytes, data)
+            return destination
+        if key in self._disk:
+            try:
+                await asyncio.to_thread(_link_or_copy, self._disk_path(key), destination)
+                self.disk_hits += 1
+                self._disk.move_to_end(key)
+                return destination
+            except OSError:
+                self._forget_disk(key)
+
+        task = self._join(key, lambda: self._fetch_file(bot, file_info, key, timeout))
+        await self._wait(task, timeout, lambda result: self._place(result, destination))
+        return destination
+
+    async def _fetch_file(self, bot: Bot, file_info: File, key: str, timeout: Union[int, float]) -> Path:
+        """Одно скачивание файла на диск: путь в LRU на диске или временный файл"""
+        directory = self.disk_dir or get_workspace_manager().scratch_dir()
+        staging = directory / f".{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            async with self._semaphore:
+                await bot.download_file(file_info.file_path, destination=staging, timeout=math.ceil(timeout))
+            size = staging.stat().st_size
+            self.downloads += 1
+            self.bytes_downloaded += size
+            if self.disk_dir and size <= self.disk_bytes // 4 and key not in self._disk:
+                path = self._disk_path(key)
+                os.replace(staging, path)
+                self._disk[key] = size
+                self._disk_used += size
+                self._evict_disk()
+                return path
+        except BaseException:
+            self._remove_staging(staging)
+            raise
+        return staging
+
+    def _remove_staging(self, staging: Path):
+        """Удаляет временный файл скачивания (и его отдельную папку, если кэша на диске нет)"""
+        if staging.parent == self.disk_dir:
+            staging.unlink(missing_ok=True)
+        else:
+            shutil.rmtree(staging.parent, ignore_errors=True)
+
+    @staticmethod
+    async def _place(result: Union[bytes, Path], destination: Path):
+        """Результат скачивания - в destination"""
+        if isinstance(result, Path):
+            await asyncio.to_thread(_link_or_copy, result, destination)
+        else:
+            await asyncio.to_thread(destination.write_bytes, result)
+
+    # ----- LRU в памяти и на диске -----
+
+    def _remember(self, key: str, data: bytes):
+        """Кладет файл в LRU в памяти (файлы больше четверти объема не кэшируются)"""
+        if len(data) > self.memory_bytes // 4:
+            return
+        if key in self._memory:
+            self._memory_used -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_used += len(data)
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key
+
+    def _load_disk_index(self):
+        """Файлы кэша, оставшиеся с прошлого запуска (старые - первыми на вытеснение)"""
+        entries = []
+        for path in self.disk_dir.iterdir():
+            if path.name.startswith("."):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_used += size
+        self._evict_disk()
+
+    def _read_disk(self, key: str) -> bytes:
+        path = self._disk_path(key)
+        data = path.read_bytes()
+        # Время изменения - порядок вытеснения после перезапуска
+        os.utime(path)
+        return data
+
+    def _write_disk(self, key: str, data: bytes):
+        # Запись через временный файл: параллельное чтение не увидит половину файла
+        temp = self.disk_dir / f".{key}.{uuid.uuid4().hex}.tmp"
+        temp.write_bytes(data)
+        os.replace(temp, self._disk_path(key))
+
+    def _forget_disk(self, key: str):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_used -= size
+
+    def _evict_disk(self):
+        while self._disk_used > self.disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_used -= size
+            self._disk_path(key).unlink(missing_ok=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Скачивания, попадания в кэши и их заполнение"""
+        return {
+            'downloads': self.downloads,
+            'downloaded_mb': round(self.bytes_downloaded / 1024 / 1024, 1),
+            'deduplicated': self.deduplicated,
+            'file_info_hits': self.file_info_hits,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'memory_mb': round(self._memory_used / 1024 / 1024, 1),
+            'disk_mb': round(self._disk_used / 1024 / 1024, 1) if self.disk_dir else None,
+        }
+
+
+# Общий менеджер для всех модулей (создается при первом использовании)
+_telegram_downloads: Optional[TelegramDownloads] = None
+
+
+def get_telegram_downloads() -> TelegramDownloads:
+    """
+    Общий менеджер скачивания файлов Telegram
+
+    TELEGRAM_DOWNLOAD_CONCURRENCY - одновременных скачиваний,
+    TELEGRAM_FILE_CACHE_MB - LRU файлов в памяти (0 - без кэша),
+    TELEGRAM_FILE_CACHE_DIR - папка LRU на диске (пусто - только память),
+    TELEGRAM_FILE_CACHE_DISK_MB - объем LRU на диске.
+    """
+    global _telegram_downloads
+    if _telegram_downloads is None:
+        disk_dir = os.getenv("TELEGRAM_FILE_CACHE_DIR", "").strip() or None
+        _telegram_downloads = TelegramDownloads(
+            max_concurrent=int(os.getenv("TELEGRAM_DOWNLOAD_CONCURRENCY", str(DEFAULT_MAX_CONCURRENT))),
+            memory_bytes=int(float(os.getenv("TELEGRAM_FILE_CACHE_MB", str(DEFAULT_MEMORY_CACHE_MB))) * 1024 * 1024),
+            disk_dir=Path(disk_dir) if disk_dir else None,
+            disk_bytes=int(float(os.getenv("TELEGRAM_FILE_CACHE_DISK_MB", str(DEFAULT_DISK_CACHE_MB))) * 1024 * 1024)
+        )
+    return _telegram_downloads
+
+
+async def read_telegram_file(bot: Bot, file_id: str, file_unique_id: Optional[str] = None,
+                             timeout: Union[int, float] = 60) -> bytes:
+    """Содержимое файла Telegram через общий менеджер скачивания"""
+    return await get_telegram_downloads().read(bot, file_id, file_unique_id, timeout)
@@ -0,0 +1,826 @@
+"""
+Общий движок распознавания речи для всех модулей бота
+
+Модули ChatGPT и транскрипции используют один экземпляр движка: один клиент
+OpenAI, один пул процессов локального Whisper, общий кэш результатов, общие
+лимиты одновременной обработки и общая статистика. Оптимизации конвейера
+(обработка в памяти, Opus, VAD, длинные записи, выбор способа) действуют для
+всего аудио бота.
+
+Настройки читаются из переменных окружения при первом обращении к движку,
+когда .env всех модулей уже загружены.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.fair_queue import FairQueue, PositionCallback
+from .cache import CachedTranscription, get_transcription_cache, payload_digest, transcription_key
+from .chunking import MISSING_SEGMENT_MARK, Chunk, plan_chunks, stitch_transcripts
+from .ffmpeg import FFMPEG_AVAILABLE, WHISPER_SAMPLE_RATE, decode_pcm, encode_pcm_opus, transcode_for_api
+from .metrics import PipelineMetrics
+from .payload import AudioPayload, download_telegram_file
+from .preprocess import prepare_for_whisper
+from .telegram_files import max_download_bytes
+from .routing import ROUTE_API, ROUTE_CHUNKED, ROUTE_LOCAL, RouteDecision, TranscriptionRouter
+from .vad import NUMPY_AVAILABLE, VadResult, trim_silence
+from .whisper_backends import backend_available
+from .whisper_pool import WhisperPool
+from .workspace import Workspace, get_workspace_manager
+
+logger = logging.getLogger(__name__)
+
+try:
+    from openai import AsyncOpenAI
+    OPENAI_LIBRARY_AVAILABLE = True
+except ImportError:
+    OPENAI_LIBRARY_AVAILABLE = False
+    logger.warning("OpenAI library not available")
+
+try:
+    import numpy as np
+except ImportError:
+    logger.warning("NumPy not available: silence trimming disabled. Install with: pip install numpy")
+
+if not FFMPEG_AVAILABLE:
+    logger.warning("FFmpeg not available. Install ffmpeg and add it to PATH")
+
+# Прогресс распознавания длинной записи: (готово сегментов, всего сегментов)
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+# Промежуточный текст при потоковом локальном распознавании
+PartialCallback = Callable[[str], Awaitable[None]]
+
+WHISPER_MODES = ("api", "local", "auto")
+# Приблизительный битрейт сжатого аудио (байт в секунду): длительность, если Telegram ее не сообщил
+ASSUMED_BYTES_PER_SEC = 4000
+LOCAL_BACKENDS = ("whisper", "faster-whisper")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, "true" if default else "false").lower() == "true"
+
+
+@dataclass
+class TranscriptionSettings:
+    """Настройки распознавания (общие для всех модулей)"""
+    api_key: Optional[str] = None
+    whisper_mode: str = "api"
+    whisper_model: str = "whisper-1"
+    whisper_language: str = "auto"
+    whisper_temperature: float = 0.0
+    max_concurrent: int = 8
+    queue_short_sec: float = 60.0
+    queue_quantum_sec: float = 120.0
+    queue_aging_sec: float = 120.0
+    deadline_fast_mode_sec: float = 20.0
+
+    # Лимиты и обработка в памяти
+    max_audio_size_mb: int = 25
+    max_audio_duration_sec: int = 300
+    audio_memory_limit_mb: float = 20.0
+
+    # Перекодирование и обрезка тишины
+    audio_preprocess: bool = True
+    audio_opus_bitrate: str = "24k"
+    audio_preprocess_skip_opus_mb: float = 1.0
+    vad_enabled: bool = True
+    vad_threshold_db: float = -45.0
+    vad_min_silence_ms: int = 700
+    vad_min_gain_sec: float = 1.0
+
+    # Длинные записи
+    long_audio_enabled: bool = True
+    long_audio_threshold_sec: int = 180
+    long_audio_chunk_sec: int = 120
+    long_audio_overlap_sec: float = 1.0
+    long_audio_concurrency: int = 6
+    long_audio_max_duration_sec: int = 3600
+
+    # Локальный Whisper
+    local_whisper_model: str = "base"
+    local_whisper_backend: str = "whisper"
+    local_whisper_compute_type: str = "int8"
+    local_whisper_workers: int = 0
+    local_whisper_threads: int = 1
+    local_whisper_preload: bool = False
+    local_whisper_fork: bool = True
+    local_whisper_batch_size: int = 8
+    local_whisper_batch_wait_ms: int = 50
+    local_streaming: bool = True
+    local_streaming_segment_sec: int = 30
+
+    # Выбор способа в режиме auto
+    routing_short_local_sec: float = 15.0
+    routing_local_max_queue: int = 0
+
+    @classmethod
+    def from_env(cls) -> "TranscriptionSettings":
+        """Настройки из переменных окружения (с проверкой значений)"""
+        whisper_mode = os.getenv("WHISPER_MODE", "api").lower()
+        if whisper_mode not in WHISPER_MODES:
+            logger.warning(f"Неверное значение WHISPER_MODE: {whisper_mode}, используется api")
+            whisper_mode = "api"
+        backend = os.getenv("LOCAL_WHISPER_BACKEND", "whisper").lower()
+        if backend not in LOCAL_BACKENDS:
+            logger.warning(f"Неверное значение LOCAL_WHISPER_BACKEND: {backend}, используется whisper")
+            backend = "whisper"
+
+        return cls(
+            api_key=os.getenv("OPENAI_API_KEY") or None,
+            whisper_mode=whisper_mode,
+            whisper_model=os.getenv("WHISPER_MODEL", "whisper-1"),
+            whisper_language=os.getenv("WHISPER_LANGUAGE", "auto") or "auto",
+            whisper_temperature=float(os.getenv("WHISPER_TEMPERATURE", "0")),
+            max_concurrent=int(os.getenv("TRANSCRIPTION_MAX_CONCURRENT", "8")),
+            queue_short_sec=float(os.getenv("TRANSCRIPTION_QUEUE_SHORT_SEC", "60")),
+            queue_quantum_sec=float(os.getenv("TRANSCRIPTION_QUEUE_QUANTUM_SEC", "120")),
+            queue_aging_sec=float(os.getenv("TRANSCRIPTION_QUEUE_AGING_SEC", "120")),
+            deadline_fast_mode_sec=float(os.getenv("DEADLINE_FAST_MODE_SEC", "20")),
+            max_audio_size_mb=int(os.getenv("MAX_AUDIO_SIZE_MB", "25")),
+            max_audio_duration_sec=int(os.getenv("MAX_AUDIO_DURATION_SEC", "300")),
+            audio_memory_limit_mb=float(os.getenv("AUDIO_MEMORY_LIMIT_MB", "20")),
+            audio_preprocess=_env_bool("AUDIO_PREPROCESS", True),
+            audio_opus_bitrate=os.getenv("AUDIO_OPUS_BITRATE", "24k"),
+            audio_preprocess_skip_opus_mb=float(os.getenv("AUDIO_PREPROCESS_SKIP_OPUS_MB", "1")),
+            vad_enabled=_env_bool("AUDIO_VAD_ENABLED", True),
+            vad_threshold_db=float(os.getenv("AUDIO_VAD_THRESHOLD_DB", "-45")),
+            vad_min_silence_ms=int(os.getenv("AUDIO_VAD_MIN_SILENCE_MS", "700")),
+            vad_min_gain_sec=float(os.getenv("AUDIO_VAD_MIN_GAIN_SEC", "1")),
+            long_audio_enabled=_env_bool("LONG_AUDIO_ENABLED", True),
+            long_audio_threshold_sec=int(os.getenv("LONG_AUDIO_THRESHOLD_SEC", "180")),
+            long_audio_chunk_sec=int(os.getenv("LONG_AUDIO_CHUNK_SEC", "120")),
+            long_audio_overlap_sec=float(os.getenv("LONG_AUDIO_OVERLAP_SEC", "1")),
+            long_audio_concurrency=max(int(os.getenv("LONG_AUDIO_CONCURRENCY", "6")), 1),
+            long_audio_max_duration_sec=int(os.getenv("LONG_AUDIO_MAX_DURATION_SEC", "3600")),
+            local_whisper_model=os.getenv("LOCAL_WHISPER_MODEL", "base"),
+            local_whisper_backend=backend,
+            local_whisper_compute_type=os.getenv("LOCAL_WHISPER_COMPUTE_TYPE", "int8"),
+            local_whisper_workers=max(int(os.getenv("LOCAL_WHISPER_WORKERS", "0")), 0),
+            local_whisper_threads=int(os.getenv("LOCAL_WHISPER_THREADS", "1")),
+            # По умолчанию модель загружается при старте в режимах local и auto
+            local_whisper_preload=_env_bool("LOCAL_WHISPER_PRELOAD", whisper_mode != "api"),
+            local_whisper_fork=_env_bool("LOCAL_WHISPER_FORK", True),
+            local_whisper_batch_size=int(os.getenv("LOCAL_WHISPER_BATCH_SIZE", "8")),
+            local_whisper_batch_wait_ms=int(os.getenv("LOCAL_WHISPER_BATCH_WAIT_MS", "50")),
+            local_streaming=_env_bool("LOCAL_STREAMING", True),
+            local_streaming_segment_sec=max(int(os.getenv("LOCAL_STREAMING_SEGMENT_SEC", "30")), 5),
+            routing_short_local_sec=float(os.getenv("ROUTING_SHORT_LOCAL_SEC", "15")),
+            routing_local_max_queue=max(int(os.getenv("ROUTING_LOCAL_MAX_QUEUE", "0")), 0),
+        )
+
+
+@dataclass
+class TranscriptionResult:
+    """Итог распознавания: текст (пустой - речи нет), способ и ошибка для пользователя"""
+    text: Optional[str]
+    method: str
+    error: Optional[str] = None
+    language: Optional[str] = None
+    cached: bool = False
+
+
+class TranscriptionEngine:
+    """Конвейер распознавания: скачивание → декодирование → VAD → выбор способа → текст"""
+    
+    def __init__(self, settings: TranscriptionSettings):
+        self.settings = settings
+        self.whisper_mode = settings.whisper_mode
+        
+        # Один клиент на все модули: отмена задачи обрывает загрузку в Whisper API
+        self.openai_client = AsyncOpenAI(api_key=settings.api_key) if OPENAI_LIBRARY_AVAILABLE and settings.api_key else None
+        self.api_available = self.openai_client is not None
+        
+        self.local_available = backend_available(settings.local_whisper_backend)
+        if not self.local_available and settings.whisper_mode != "api":
+            package = "faster-whisper" if settings.local_whisper_backend == "faster-whisper" else "openai-whisper"
+            logger.warning(f"Local Whisper not available. Install with: pip install {package}")
+        
+        # Общая очередь файлов (скачивание + распознавание): лимит, приоритет коротких, очередность пользователей
+        self.queue = None
+        if settings.max_concurrent > 0:
+            self.queue = FairQueue(
+                settings.max_concurrent,
+                quantum=settings.queue_quantum_sec,
+                aging_sec=settings.queue_aging_sec
+            )
+        self._preload: Optional[asyncio.Task] = None
+        
+        # Пул процессов локального Whisper (модель загружается при старте бота)
+        self.local_whisper_pool = None
+        if self.local_available:
+            self.local_whisper_pool = WhisperPool(
+                settings.local_whisper_model,
+                backend=settings.local_whisper_backend,
+                compute_type=settings.local_whisper_compute_type,
+                workers=settings.local_whisper_workers,
+                threads=settings.local_whisper_threads,
+                batch_size=settings.local_whisper_batch_size,
+                batch_wait_ms=settings.local_whisper_batch_wait_ms,
+                fork=settings.local_whisper_fork,
+                language=settings.whisper_language
+            )
+        
+        # Выбор способа распознавания в режиме auto: по умолчанию очередь -
+        # по одной записи на воркер (число воркеров пул уже определил, 0 = по ядрам)
+        local_workers = self.local_whisper_pool.workers if self.local_whisper_pool else 1
+        self.router = TranscriptionRouter(
+            short_local_sec=settings.routing_short_local_sec,
+            local_max_queue=settings.routing_local_max_queue or local_workers
+        )
+    
+    @property
+    def long_audio_available(self) -> bool:
+        return self.settings.long_audio_enabled and NUMPY_AVAILABLE and FFMPEG_AVAILABLE
+    
+    def start(self):
+        """Фоновая загрузка локальной модели при старте бота (повторные вызовы ничего не делают)"""
+        # Рабочие папки: при первом обращении удаляются брошенные прошлым запуском
+        get_workspace_manager()
+        if self._preload is None and self.local_whisper_pool and self.settings.local_whisper_preload:
+            self._preload = asyncio.create_task(self.start_local_whisper())
+    
+    async def start_local_whisper(self):
+        """Загрузка локальной модели и запуск воркеров"""
+        if not self.local_whisper_pool:
+            return
+        try:
+            await self.local_whisper_pool.start()
+        except Exception as e:
+            logger.error(f"Не удалось запустить локальный Whisper: {e}")
+    
+    async def close(self):
+        """Остановка воркеров локального Whisper"""
+        if self._preload:
+            self._preload.cancel()
+        if self.local_whisper_pool:
+            await self.local_whisper_pool.close()
+    
+    def validate(self, file_size: Optional[int], duration: Optional[int]) -> Tuple[bool, str]:
+        """Проверка размера и длительности файла"""
+        max_size_mb = self.settings.max_audio_size_mb
+        if file_size and file_size > max_size_mb * 1024 * 1024:
+            return False, f"Файл слишком большой. Максимум: {max_size_mb} МБ"
+        
+        # Длинные записи распознаются по сегментам - лимит длительности выше
+        max_duration = self.max_duration_sec
+        if duration and duration > max_duration:
+            return False, f"Аудио слишком длинное. Максимум: {max_duration // 60} минут"
+        
+        return True, "OK"
+    
+    @property
+    def max_duration_sec(self) -> int:
+        if self.long_audio_available:
+            return max(self.settings.max_audio_duration_sec, self.settings.long_audio_max_duration_sec)
+        return self.settings.max_audio_duration_sec
+    
+    async def download_audio(self, bot: Bot, file_id: str, filename: str, file_size: Optional[int],
+                             workspace: Workspace, deadline: Optional[Deadline] = None,
+                             file_unique_id: Optional[str] = None) -> AudioPayload:
+        """Скачивание аудио из Telegram в память (крупные файлы - в рабочую папку задания)"""
+        try:
+            return await download_telegram_file(
+                bot, file_id, filename, workspace,
+                file_size=file_size,
+                deadline=deadline,
+                memory_limit_mb=self.settings.audio_memory_limit_mb,
+                file_unique_id=file_unique_id
+            )
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("скачивание")
+    
+    async def load_audio_pcm(self, payload: AudioPayload) -> Optional["np.ndarray"]:
+        """Декодирование аудио в моно PCM 16 кГц (int16)"""
+        if not FFMPEG_AVAILABLE or not NUMPY_AVAILABLE:
+            logger.warning("FFmpeg или NumPy недоступны для декодирования")
+            return None
+        
+        try:
+            # Декодируем в отдельном процессе через stdin/stdout: отмена задачи завершает ffmpeg
+            pcm = await decode_pcm(payload, WHISPER_SAMPLE_RATE)
+            samples = np.frombuffer(pcm, np.int16)
+            logger.info(f"Аудио декодировано: {len(samples) / WHISPER_SAMPLE_RATE:.1f} сек")
+            return samples
+            
+        except Exception as e:
+            logger.error(f"Ошибка декодирования аудио: {e}")
+            return None
+    
+    async def trim_silence(self, samples: "np.ndarray", metrics: PipelineMetrics) -> VadResult:
+        """Вырезает тишину в начале, в конце и длинные паузы (в отдельном потоке)"""
+        with metrics.stage("vad"):
+            result = await asyncio.to_thread(
+                trim_silence,
+                samples,
+                WHISPER_SAMPLE_RATE,
+                threshold_db=self.settings.vad_threshold_db,
+                min_silence_ms=self.settings.vad_min_silence_ms
+            )
+        metrics.add("silence_removed_sec", round(result.removed_sec, 1))
+        logger.info(
+            f"VAD: {result.original_sec:.1f} сек → {result.kept_sec:.1f} сек "
+            f"(вырезано {result.removed_sec:.1f} сек тишины)"
+        )
+        return result
+    
+    async def transcribe_with_api(self, payload: AudioPayload, deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Транскрипция через OpenAI Whisper API"""
+        if not self.openai_client:
+            return None
+        
+        try:
+            # Подготавливаем параметры для API
+            api_params = {
+                'model': self.settings.whisper_model,
+                'file': None,  # Будет установлен ниже
+            }
+            
+            # Добавляем язык только если он не 'auto' (API не поддерживает 'auto')
+            if self.settings.whisper_language and self.settings.whisper_language.lower() != 'auto':
+                api_params['language'] = self.settings.whisper_language
+            if self.settings.whisper_temperature:
+                api_params['temperature'] = self.settings.whisper_temperature
+            
+            # Форматы, которые API не принимает, перекодируются через ffmpeg в памяти
+            payload = await transcode_for_api(payload)
+            
+            # Запрос получает оставшийся бюджет времени: без повторов клиента
+            # (каждый получил бы весь таймаут заново) и с пределом на весь запрос
+            client = self.openai_client
+            timeout = None
+            if deadline:
+                timeout = deadline.timeout(stage="распознавание")
+                api_params['timeout'] = timeout
+                client = client.with_options(max_retries=0)
+            
+            # Файл загружается из памяти под исходным именем (по расширению API определяет формат)
+            with payload.upload_file() as upload:
+                api_params['file'] = upload
+                response = await asyncio.wait_for(client.audio.transcriptions.create(**api_params), timeout)
+                
+            transcription = response.text.strip()
+            logger.info(f"Транскрипция через API успешна: {len(transcription)} символов")
+            return transcription
+            
+        except DeadlineExceeded:
+            raise
+            
+        except Exception as e:
+            logger.error(f"Ошибка транскрипции через API: {e}")
+            return None
+    
+    async def transcribe_with_local_whisper(self, audio: "np.ndarray") -> Optional[str]:
+        """
+        Транскрипция через локальный Whisper
+        
+        Принимает уже декодированный PCM: сам Whisper запускал бы ffmpeg
+        через subprocess.run, который нельзя прервать при отмене задачи.
+        Запись ставится в очередь пула процессов; при отмене задание,
+        которое еще ждет в очереди, не выполняется, а уже начатое
+        прерывается перезапуском воркера.
+        """
+        if not self.local_available:
+            return None
+        
+        try:
+            transcription = await self.local_whisper_pool.transcribe(audio)
+            logger.info(f"Локальная транскрипция успешна: {len(transcription)} символов")
+            return transcription
+            
+        except Exception as e:
+            logger.error(f"Ошибка локальной транскрипции: {e}")
+            return None
+    
+    async def _transcribe_local(self, samples: "np.ndarray", deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Локальный Whisper для PCM int16 в пределах бюджета времени"""
+        audio = samples.astype(np.float32) / 32768.0
+        if not deadline:
+            return await self.transcribe_with_local_whisper(audio)
+        try:
+            return await asyncio.wait_for(
+                self.transcribe_with_local_whisper(audio),
+                timeout=deadline.timeout(stage="распознавание")
+            )
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("распознавание")
+    
+    def is_long_audio(self, samples: "np.ndarray") -> bool:
+        """Запись достаточно длинная для параллельного распознавания сегментами"""
+        return (self.settings.long_audio_enabled
+                and len(samples) > self.settings.long_audio_threshold_sec * WHISPER_SAMPLE_RATE)
+    
+    async def _transcribe_chunk(self, samples: "np.ndarray", index: int,
+                                deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Распознавание одного сегмента длинной записи (API с fallback на локальный Whisper)"""
+        if self.whisper_mode != "local":
+            upload = await encode_pcm_opus(
+                samples.tobytes(), f"chunk_{index}.ogg",
+                bitrate=self.settings.audio_opus_bitrate
+            )
+            transcription = await self.transcribe_with_api(upload, deadline)
+            if transcription is not None:
+                return transcription
+            if deadline and deadline.is_short(self.settings.deadline_fast_mode_sec):
+                return None
+        
+        if not self.local_available:
+            return None
+        return await self._transcribe_local(samples, deadline)
+    
+    async def transcribe_long(self, samples: "np.ndarray", deadline: Optional[Deadline] = None,
+                              metrics: Optional[PipelineMetrics] = None,
+                              on_progress: Optional[ProgressCallback] = None) -> Tuple[Optional[str], str]:
+        """
+        Длинная запись: нарезка по паузам и параллельное распознавание сегментов
+        
+        Сегменты распознаются одновременно (не больше LONG_AUDIO_CONCURRENCY),
+        поэтому время обработки близко ко времени самого длинного сегмента.
+        """
+        metrics = metrics or PipelineMetrics("transcribe")
+        chunks = plan_chunks(
+            samples, WHISPER_SAMPLE_RATE,
+            max_chunk_sec=self.settings.long_audio_chunk_sec,
+            overlap_sec=self.settings.long_audio_overlap_sec
+        )
+        logger.info(f"Длинное аудио ({len(samples) / WHISPER_SAMPLE_RATE:.0f} сек): {len(chunks)} сегментов")
+        metrics.add("chunks", len(chunks))
+        
+        semaphore = asyncio.Semaphore(self.settings.long_audio_concurrency)
+        results: List[Optional[str]] = [None] * len(chunks)
+        done = 0
+        
+        async def run_chunk(chunk: Chunk):
+            nonlocal done
+            async with semaphore:
+                results[chunk.index] = await self._transcribe_chunk(
+                    samples[chunk.start:chunk.end], chunk.index, deadline
+                )
+            done += 1
+            if on_progress:
+                try:
+                    await on_progress(done, len(chunks))
+                except Exception as e:
+                    logger.debug(f"Не удалось обновить прогресс: {e}")
+        
+        tasks = [asyncio.create_task(run_chunk(chunk)) for chunk in chunks]
+        try:
+            with metrics.stage("chunks"):
+                await asyncio.gather(*tasks)
+        except BaseException:
+            # Ошибка, отмена или исчерпанный бюджет - останавливаем остальные сегменты
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        failed = sum(1 for result in results if result is None)
+        if failed == len(chunks):
+            return None, "Ошибка транскрипции"
+        if failed:
+            logger.warning(f"Не распознано сегментов: {failed} из {len(chunks)}")
+        
+        method = "OpenAI Whisper API" if self.whisper_mode != "local" else "Локальный Whisper"
+        return stitch_transcripts(results), f"{method}, {len(chunks)} сегм."
+    
+    def use_streaming(self, route: str, samples: Optional["np.ndarray"],
+                      on_partial: Optional[PartialCallback]) -> bool:
+        """Показывать ли текст по мере распознавания (только локальный Whisper)"""
+        return (on_partial is not None and samples is not None
+                and self.settings.local_streaming and self.local_available
+                and (route == ROUTE_LOCAL or (route == ROUTE_CHUNKED and self.whisper_mode == "local")))
+    
+    async def transcribe_streaming(self, samples: "np.ndarray", deadline: Optional[Deadline] = None,
+                                   metrics: Optional[PipelineMetrics] = None,
+                                   on_partial: Optional[PartialCallback] = None) -> Optional[str]:
+        """
+        Локальное распознавание по сегментам с промежуточным текстом
+        
+        Все сегменты сразу ставятся в очередь пула (короткие распознаются
+        пакетами), а текст отдается по мере готовности сегментов по порядку:
+        первый текст появляется через время одного сегмента, а не всей записи.
+        """
+        metrics = metrics or PipelineMetrics("transcribe")
+        chunks = plan_chunks(
+            samples, WHISPER_SAMPLE_RATE,
+            max_chunk_sec=self.settings.local_streaming_segment_sec,
+            overlap_sec=self.settings.long_audio_overlap_sec
+        )
+        if len(chunks) == 1:
+            with metrics.stage("local_whisper"):
+                return await self._transcribe_local(samples, deadline)
+        
+        metrics.add("chunks", len(chunks))
+        tasks = [
+            asyncio.create_task(self._transcribe_local(samples[chunk.start:chunk.end], deadline))
+            for chunk in chunks
+        ]
+        results: List[Optional[str]] = []
+        try:
+            with metrics.stage("local_whisper"):
+                for task in tasks:
+                    results.append(await task)
+                    partial = stitch_transcripts(results)
+                    if on_partial and partial:
+                        try:
+                            await on_partial(partial)
+                        except Exception as e:
+                            logger.debug(f"Не удалось показать промежуточный текст: {e}")
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        if all(result is None for result in results):
+            return None
+        return stitch_transcripts(results)
+    
+    async def transcribe_audio(self, payload: AudioPayload, deadline: Optional[Deadline] = None,
+                               metrics: Optional[PipelineMetrics] = None,
+                               on_progress: Optional[ProgressCallback] = None,
+                               on_partial: Optional[PartialCallback] = None) -> Tuple[Optional[str], str]:
+        """
+        Основная функция транскрипции
+        Возвращает: (транскрипция, метод_использования)
+        """
+        metrics = metrics or PipelineMetrics("transcribe")
+        samples = None  # PCM (после обрезки тишины) - для VAD, длинных записей и локального Whisper
+        trimmed = False
+        
+        # Декодируем заранее, если нужна обрезка тишины или нарезка длинных записей
+        if NUMPY_AVAILABLE and FFMPEG_AVAILABLE and (self.settings.vad_enabled or self.settings.long_audio_enabled):
+            with metrics.stage("decode"):
+                samples = await self.load_audio_pcm(payload)
+            if samples is not None and self.settings.vad_enabled:
+                vad = await self.trim_silence(samples, metrics)
+                if not vad.has_speech:
+                    return "", "VAD"
+                samples = vad.audio
+                # Отправляем обрезанную запись, только если выигрыш заметный
+                trimmed = vad.removed_sec >= self.settings.vad_min_gain_sec
+        
+        # Способ распознавания: фиксированный (WHISPER_MODE=api/local) или по длительности (auto)
+        decision = self.choose_route(samples, payload)
+        transcription, method = await self._transcribe_route(
+            decision.route, payload, samples, trimmed, deadline, metrics, on_progress, on_partial
+        )
+        if transcription or decision.route == ROUTE_CHUNKED:
+            return transcription, method
+        
+        # Запасной способ: локальный Whisper после API и наоборот (в режиме auto)
+        fallback = ROUTE_LOCAL if decision.route == ROUTE_API else ROUTE_API
+        if fallback == ROUTE_LOCAL and not self.local_available:
+            return None, "Ошибка транскрипции"
+        if fallback == ROUTE_API and (self.whisper_mode != "auto" or not self.api_available):
+            return transcription, method
+        
+        # Медленный запасной способ не успеет, если бюджет почти исчерпан
+        if deadline and deadline.is_short(self.settings.deadline_fast_mode_sec):
+            logger.info(f"Способ {decision.route} не сработал, на запасной не хватает времени")
+            return None, "Ошибка транскрипции"
+        
+        logger.info(f"Способ {decision.route} не сработал, пробуем {fallback}...")
+        return await self._transcribe_route(fallback, payload, samples, trimmed, deadline, metrics, on_progress, on_partial)
+    
+    def choose_route(self, samples: Optional["np.ndarray"], payload: AudioPayload) -> RouteDecision:
+        """Способ распознавания для записи (решение пишется в лог)"""
+        long_audio = samples is not None and self.is_long_audio(samples)
+        if self.whisper_mode != "auto":
+            if long_audio:
+                return RouteDecision(ROUTE_CHUNKED, "длинная запись")
+            return RouteDecision(ROUTE_API if self.whisper_mode == "api" else ROUTE_LOCAL, f"WHISPER_MODE={self.whisper_mode}")
+        
+        if samples is None:
+            # Без декодирования длительность неизвестна
+            return RouteDecision(ROUTE_API if self.api_available else ROUTE_LOCAL, "длительность неизвестна")
+        
+        pool = self.local_whisper_pool
+        return self.router.choose(
+            duration_sec=len(samples) / WHISPER_SAMPLE_RATE,
+            size_bytes=payload.size,
+            api_available=self.api_available,
+            local_available=self.local_available,
+            local_warm=bool(pool and pool.started),
+            local_queue=pool.queue_depth if pool else 0,
+            long_audio=long_audio
+        )
+    
+    async def _transcribe_route(self, route: str, payload: AudioPayload, samples: Optional["np.ndarray"],
+                                trimmed: bool, deadline: Optional[Deadline], metrics: PipelineMetrics,
+                                on_progress: Optional[ProgressCallback],
+                                on_partial: Optional[PartialCallback] = None) -> Tuple[Optional[str], str]:
+        """Распознавание выбранным способом; задержка и итог учитываются в следующих решениях"""
+        duration = len(samples) / WHISPER_SAMPLE_RATE if samples is not None else 0.0
+        started = time.monotonic()
+        
+        if self.use_streaming(route, samples, on_partial):
+            # Локально с промежуточным текстом
+            transcription = await self.transcribe_streaming(samples, deadline, metrics, on_partial)
+            method = "Локальный Whisper" if transcription is not None else "Ошибка транскрипции"
+        elif route == ROUTE_CHUNKED:
+            # Длинная запись - параллельно по сегментам
+            transcription, method = await self.transcribe_long(samples, deadline, metrics, on_progress)
+        elif route == ROUTE_API:
+            transcription = await self._transcribe_upload(payload, samples, trimmed, deadline, metrics)
+            method = "OpenAI Whisper API"
+        else:
+            transcription = await self._transcribe_decoded(payload, samples, deadline, metrics)
+            method = "Локальный Whisper" if transcription is not None else "Ошибка транскрипции"
+        
+        self.router.record(route, duration, time.monotonic() - started, transcription is not None)
+        return transcription, method
+    
+    async def _transcribe_upload(self, payload: AudioPayload, samples: Optional["np.ndarray"], trimmed: bool,
+                                 deadline: Optional[Deadline], metrics: PipelineMetrics) -> Optional[str]:
+        """Отправка в Whisper API (обрезанной записи или перекодированного файла)"""
+        upload = payload
+        if trimmed:
+            with metrics.stage("preprocess"):
+                upload = await encode_pcm_opus(
+                    samples.tobytes(), payload.filename,
+                    bitrate=self.settings.audio_opus_bitrate
+                )
+        elif self.settings.audio_preprocess:
+            # Только речь: без видео, моно 16 кГц Opus (загрузка в разы меньше)
+            upload = await prepare_for_whisper(
+                payload,
+                bitrate=self.settings.audio_opus_bitrate,
+                skip_opus_below_mb=self.settings.audio_preprocess_skip_opus_mb,
+                metrics=metrics
+            )
+        metrics.add("upload_bytes", upload.size)
+        
+        with metrics.stage("api"):
+            return await self.transcribe_with_api(upload, deadline)
+    
+    async def _transcribe_decoded(self, payload: AudioPayload, samples: Optional["np.ndarray"],
+                                  deadline: Optional[Deadline], metrics: PipelineMetrics) -> Optional[str]:
+        """Локальный Whisper (запись декодируется, если это еще не сделано)"""
+        if not self.local_available:
+            return None
+        
+        if samples is None:
+            with metrics.stage("decode"):
+                samples = await self.load_audio_pcm(payload)
+            if samples is None:
+                return None
+        
+        with metrics.stage("local_whisper"):
+            return await self._transcribe_local(samples, deadline)
+    
+    def cache_model(self) -> str:
+        """Модель для ключа кэша: результаты API и локального Whisper не смешиваются"""
+        if self.whisper_mode != "local":
+            return self.settings.whisper_model
+        return f"{self.settings.local_whisper_backend}-{self.settings.local_whisper_model}"
+    
+    @contextlib.asynccontextmanager
+    async def _queue_slot(self, user_id: str, file_size: Optional[int], duration: Optional[int],
+                          deadline: Optional[Deadline], on_queue: Optional[PositionCallback],
+                          metrics: PipelineMetrics):
+        """Место в общей очереди на время обработки файла"""
+        if not self.queue:
+            yield
+            return
+        # Стоимость - секунды аудио: короткие голосовые обгоняют длинные файлы
+        cost = float(duration or (file_size or 0) / ASSUMED_BYTES_PER_SEC or 1)
+        priority = 0 if cost <= self.settings.queue_short_sec else 1
+        try:
+            with metrics.stage("queue"):
+                job_id = await self.queue.acquire(
+                    user_id, cost=cost, priority=priority, on_position=on_queue,
+                    timeout=deadline.timeout(stage="очередь") if deadline else None
+                )
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("очередь")
+        try:
+            yield
+        finally:
+            self.queue.release(job_id)
+    
+    async def transcribe_telegram_file(self, bot: Bot, file_id: str, filename: str,
+                                       file_unique_id: Optional[str] = None,
+                                       file_size: Optional[int] = None,
+                                       duration: Optional[int] = None,
+                                       deadline: Optional[Deadline] = None,
+                                       on_progress: Optional[ProgressCallback] = None,
+                                       on_partial: Optional[PartialCallback] = None,
+                                       user_id: Optional[str] = None,
+                                       on_queue: Optional[PositionCallback] = None,
+                                       label: str = "audio") -> TranscriptionResult:
+        """
+        Полная обработка файла из Telegram: кэш → скачивание → распознавание
+        
+        Args:
+            filename: Имя файла (по расширению определяется формат)
+            file_unique_id: Постоянный идентификатор файла - ключ кэша без скачивания
+            deadline: Общий бюджет времени на обработку (делится между этапами)
+            on_progress: Вызывается по мере распознавания сегментов длинной записи (готово, всего)
+            on_partial: Получает промежуточный текст при потоковом локальном распознавании
+            user_id: Пользователь (для очередности в общей очереди)
+            on_queue: Получает позицию в очереди и ожидаемое время ожидания, пока файл ждет
+            label: Модуль-источник (для метрик)
+        """
+        metrics = PipelineMetrics(label)
+        cache = get_transcription_cache()
+        model = self.cache_model()
+        language = self.settings.whisper_language
+        
+        try:
+            is_valid, validation_message = self.validate(file_size, duration)
+            if not is_valid:
+                return TranscriptionResult(None, "Ошибка", validation_message)
+            if file_size and file_size > max_download_bytes(bot):
+                # Облачный Bot API не отдает файлы больше 20 МБ (нужен локальный сервер)
+                return TranscriptionResult(None, "Ошибка", f"Файл слишком большой. Максимум: "
+                                                          f"{max_download_bytes(bot) // 1024 // 1024} МБ")
+            
+            # Повтор (пересланное или уже распознанное в другом модуле) - без скачивания
+            unique_key = None
+            if file_unique_id:
+                unique_key = transcription_key(f"tg:{file_unique_id}", model, language)
+                cached = await cache.get(unique_key)
+                if cached:
+                    metrics.add("cache_hits", 1)
+                    return TranscriptionResult(cached.text, f"{cached.method}, из кэша",
+                                               language=cached.language, cached=True)
+            
+            # Общая очередь для всех модулей: ждем своей очереди
+            # Рабочая папка задания удаляется при любом исходе, в том числе при отмене
+            async with self._queue_slot(user_id or label, file_size, duration, deadline, on_queue, metrics), \
+                    get_workspace_manager().workspace(file_size or 0) as workspace:
+                # Скачиваем файл в память
+                with metrics.stage("download"):
+                    payload = await self.download_audio(bot, file_id, filename, file_size, workspace, deadline,
+                                                        file_unique_id)
+                metrics.add("bytes", payload.size)
+                
+                # Тот же файл, загруженный заново (другой file_unique_id) - по хешу содержимого
+                content_key = None
+                if cache.enabled:
+                    digest = await asyncio.to_thread(payload_digest, payload)
+                    content_key = transcription_key(f"sha256:{digest}", model, language)
+                    cached = await cache.get(content_key)
+                    if cached:
+                        metrics.add("cache_hits", 1)
+                        await cache.put([unique_key], cached)
+                        return TranscriptionResult(cached.text, f"{cached.method}, из кэша",
+                                                   language=cached.language, cached=True)
+                
+                # Транскрибируем (если время еще осталось)
+                if deadline:
+                    deadline.check("распознавание")
+                transcription, method = await self.transcribe_audio(payload, deadline, metrics, on_progress, on_partial)
+            
+            # Пустая строка - речь не найдена (VAD), None - ошибка распознавания
+            if transcription is None:
+                return TranscriptionResult(None, "Ошибка", "Не удалось распознать речь в аудио")
+            
+            # Частичный результат длинной записи не кэшируем - повтор может распознаться целиком
+            if MISSING_SEGMENT_MARK not in transcription:
+                await cache.put([unique_key, content_key], CachedTranscription(transcription, method))
+            
+            return TranscriptionResult(transcription, method)
+            
+        except asyncio.CancelledError:
+            logger.info("Обработка аудио отменена")
+            raise
+            
+        except DeadlineExceeded as e:
+            logger.warning(f"Обработка аудио остановлена: {e}")
+            return TranscriptionResult(None, "Ошибка", str(e))
+            
+        except Exception as e:
+            logger.error(f"Ошибка обработки аудио: {e}")
+            return TranscriptionResult(None, "Ошибка", f"Произошла ошибка: {str(e)}")
+            
+        finally:
+            metrics.finish()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние движка: режим, пул локального Whisper, выбор способов, очередь и рабочие папки"""
+        pool = self.local_whisper_pool
+        return {
+            'whisper_mode': self.whisper_mode,
+            'local_pool': pool.get_stats() if pool and pool.started else None,
+            'routing': self.router.get_stats(),
+            'queue': self.queue.get_stats() if self.queue else None,
+            'workspace': get_workspace_manager().get_stats(),
+        }
+
+
+# Общий движок для всех модулей (создается при первом использовании)
+_transcription_engine: Optional[TranscriptionEngine] = None
+
+
+def get_transcription_engine() -> TranscriptionEngine:
+    """Общий движок распознавания (настройки - из переменных окружения)"""
+    global _transcription_engine
+    if _transcription_engine is None:
+        _transcription_engine = TranscriptionEngine(TranscriptionSettings.from_env())
+    return _transcription_engine
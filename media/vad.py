@@ -0,0 +1,121 @@
+"""
+Обрезка тишины перед распознаванием (энергетический VAD на NumPy)
+
+Whisper тратит время (и API - деньги) на каждую секунду аудио, включая паузы.
+Тишина в начале, в конце и длинные паузы внутри записи вырезаются по энергии
+кадров; короткие паузы между словами сохраняются. Карта сегментов позволяет
+перевести время в обрезанной записи обратно во время исходной.
+
+Функции синхронные и рассчитаны на запуск в потоке (asyncio.to_thread).
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Параметры по умолчанию
+DEFAULT_FRAME_MS = 30
+DEFAULT_THRESHOLD_DB = -45.0      # Абсолютный порог речи (dBFS)
+DEFAULT_DYNAMIC_RANGE_DB = 35.0   # Кадры тише пика на столько дБ считаются тишиной
+DEFAULT_MIN_SILENCE_MS = 700      # Более короткие паузы не вырезаются
+DEFAULT_PADDING_MS = 200          # Запас вокруг речи
+
+
+@dataclass
+class VadResult:
+    """Результат обрезки тишины"""
+    audio: "np.ndarray"
+    sample_rate: int
+    original_samples: int
+    # Сохраненные участки: (начало в обрезанной записи, начало в исходной, длина) в сэмплах
+    segments: List[Tuple[int, int, int]] = field(default_factory=list)
+
+    @property
+    def original_sec(self) -> float:
+        return self.original_samples / self.sample_rate
+
+    @property
+    def kept_sec(self) -> float:
+        return len(self.audio) / self.sample_rate
+
+    @property
+    def removed_sec(self) -> float:
+        return self.original_sec - self.kept_sec
+
+    @property
+    def has_speech(self) -> bool:
+        return bool(self.segments)
+
+    def to_original_time(self, trimmed_sec: float) -> float:
+        """Переводит время в обрезанной записи во время исходной записи"""
+        position = int(trimmed_sec * self.sample_rate)
+        for trimmed_start, original_start, length in self.segments:
+            if position < trimmed_start + length:
+                return (original_start + max(position - trimmed_start, 0)) / self.sample_rate
+        return self.original_sec
+
+
+def _frame_levels_db(samples: "np.ndarray", frame_len: int) -> "np.ndarray":
+    """Уровень каждого кадра в dBFS"""
+    frames = len(samples) // frame_len
+    data = samples[:frames * frame_len].astype(np.float32)
+    if samples.dtype == np.int16:
+        data /= 32768.0
+    rms = np.sqrt(np.mean(data.reshape(frames, frame_len) ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def trim_silence(
+    samples: "np.ndarray",
+    sample_rate: int = 16000,
+    threshold_db: float = DEFAULT_THRESHOLD_DB,
+    min_silence_ms: int = DEFAULT_MIN_SILENCE_MS,
+    padding_ms: int = DEFAULT_PADDING_MS,
+    frame_ms: int = DEFAULT_FRAME_MS,
+) -> VadResult:
+    """
+    Вырезает тишину из моно PCM (int16 или float32 в диапазоне [-1, 1])
+
+    Если речи не найдено, возвращает пустую запись (has_speech = False).
+    """
+    frame_len = max(int(sample_rate * frame_ms / 1000), 1)
+    if len(samples) < frame_len:
+        return VadResult(samples, sample_rate, len(samples), [(0, 0, len(samples))])
+
+    levels = _frame_levels_db(samples, frame_len)
+    threshold = max(threshold_db, float(levels.max()) - DEFAULT_DYNAMIC_RANGE_DB)
+    voiced = np.flatnonzero(levels > threshold)
+    if voiced.size == 0:
+        return VadResult(samples[:0], sample_rate, len(samples), [])
+
+    # Группируем речевые кадры: паузы короче min_silence_ms не разрывают участок
+    max_gap = max(int(min_silence_ms / frame_ms), 1)
+    breaks = np.flatnonzero(np.diff(voiced) > max_gap)
+    starts = np.concatenate(([voiced[0]], voiced[breaks + 1]))
+    ends = np.concatenate((voiced[breaks], [voiced[-1]])) + 1
+
+    padding = int(sample_rate * padding_ms / 1000)
+    ranges: List[List[int]] = []
+    for start, end in zip(starts * frame_len, ends * frame_len):
+        start = max(int(start) - padding, 0)
+        end = min(int(end) + padding, len(samples))
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+
+    segments: List[Tuple[int, int, int]] = []
+    trimmed_position = 0
+    for start, end in ranges:
+        segments.append((trimmed_position, start, end - start))
+        trimmed_position += end - start
+
+    audio = np.concatenate([samples[start:end] for start, end in ranges])
+    return VadResult(audio, sample_rate, len(samples), segments)
@@ -0,0 +1,138 @@
+"""
+Движки локального распознавания речи
+
+- "whisper" - openai-whisper (PyTorch, float32 на CPU);
+- "faster-whisper" - CTranslate2 с квантованием int8: на CPU в разы быстрее
+  и требует меньше памяти при сопоставимом качестве.
+
+Движок создается внутри процесса-воркера пула (media.whisper_pool) и получает
+моно PCM float32 16 кГц.
+"""
+from typing import List, Optional
+
+from .ffmpeg import WHISPER_SAMPLE_RATE
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import whisper
+    OPENAI_WHISPER_AVAILABLE = NUMPY_AVAILABLE
+except ImportError:
+    OPENAI_WHISPER_AVAILABLE = False
+
+try:
+    import faster_whisper
+    FASTER_WHISPER_AVAILABLE = NUMPY_AVAILABLE
+except ImportError:
+    FASTER_WHISPER_AVAILABLE = False
+
+# Записи не длиннее окна Whisper декодируются одним проходом - их можно объединять в пакет
+BATCH_MAX_SEC = 30.0
+# Пороги «тишины» как в whisper.transcribe: такой сегмент считается пустым
+NO_SPEECH_PROB = 0.6
+NO_SPEECH_LOGPROB = -1.0
+
+BACKEND_WHISPER = "whisper"
+BACKEND_FASTER_WHISPER = "faster-whisper"
+
+
+def backend_available(name: str) -> bool:
+    """Установлена ли библиотека движка"""
+    if name == BACKEND_FASTER_WHISPER:
+        return FASTER_WHISPER_AVAILABLE
+    return OPENAI_WHISPER_AVAILABLE
+
+
+class OpenAIWhisperBackend:
+    """openai-whisper: короткие записи декодируются пакетом за один проход"""
+
+    name = BACKEND_WHISPER
+    # Загруженные веса можно разделить между воркерами через fork
+    fork_safe = True
+
+    def __init__(self, model_name: str, threads: int = 0, **_):
+        self.model_name = model_name
+        self.threads = threads
+        self.model = None
+
+    def load(self):
+        if self.model is None:
+            self.model = whisper.load_model(self.model_name, device="cpu")
+
+    def configure_worker(self):
+        """Настройки процесса-воркера (вызывается после fork)"""
+        if self.threads > 0:
+            import torch
+            torch.set_num_threads(self.threads)
+
+    def transcribe(self, audio: "np.ndarray", language: Optional[str]) -> str:
+        result = self.model.transcribe(audio, language=language, fp16=False)
+        return result["text"].strip()
+
+    def transcribe_batch(self, clips: List["np.ndarray"], language: Optional[str]) -> List[str]:
+        import torch
+
+        n_mels = getattr(self.model.dims, "n_mels", 80)
+        mels = torch.stack([whisper.log_mel_spectrogram(whisper.pad_or_trim(clip), n_mels) for clip in clips])
+        options = whisper.DecodingOptions(language=language, fp16=False, without_timestamps=True)
+        results = whisper.decode(self.model, mels.to(self.model.device), options)
+        texts = []
+        for result in results:
+            if result.no_speech_prob > NO_SPEECH_PROB and result.avg_logprob < NO_SPEECH_LOGPROB:
+                texts.append("")
+            else:
+                texts.append(result.text.strip())
+        return texts
+
+
+class FasterWhisperBackend:
+    """faster-whisper (CTranslate2): квантованная модель, по одной записи за раз"""
+
+    name = BACKEND_FASTER_WHISPER
+    # Потоки CTranslate2 не переживают fork - каждый воркер загружает модель сам
+    fork_safe = False
+
+    def __init__(self, model_name: str, threads: int = 0, compute_type: str = "int8", beam_size: int = 5, **_):
+        self.model_name = model_name
+        self.threads = threads
+        self.compute_type = compute_type
+        self.beam_size = beam_size
+        self.model = None
+
+    def load(self):
+        if self.model is None:
+            self.model = faster_whisper.WhisperModel(
+                self.model_name,
+                device="cpu",
+                compute_type=self.compute_type,
+                cpu_threads=self.threads,
+                num_workers=1
+            )
+
+    def configure_worker(self):
+        pass
+
+    def transcribe(self, audio: "np.ndarray", language: Optional[str]) -> str:
+        segments, _ = self.model.transcribe(audio, language=language, beam_size=self.beam_size)
+        return "".join(segment.text for segment in segments).strip()
+
+    def transcribe_batch(self, clips: List["np.ndarray"], language: Optional[str]) -> List[str]:
+        return [self.transcribe(clip, language) for clip in clips]
+
+
+def create_backend(name: str, model_name: str, threads: int = 0, compute_type: str = "int8"):
+    """Движок по имени из LOCAL_WHISPER_BACKEND"""
+    if name == BACKEND_FASTER_WHISPER:
+        return FasterWhisperBackend(model_name, threads=threads, compute_type=compute_type)
+    if name == BACKEND_WHISPER:
+        return OpenAIWhisperBackend(model_name, threads=threads)
+    raise ValueError(f"Неизвестный движок локального Whisper: {name}")
+
+
+def is_batchable(audio: "np.ndarray") -> bool:
+    """Запись помещается в одно окно Whisper"""
+    return len(audio) <= BATCH_MAX_SEC * WHISPER_SAMPLE_RATE
@@ -0,0 +1,340 @@
+"""
+Пул процессов для локального Whisper (движки - в media.whisper_backends)
+
+Модель загружается один раз при старте бота, а не при первом запросе. По
+возможности (Linux, openai-whisper) она загружается в основном процессе до
+запуска воркеров: воркеры создаются через fork и разделяют веса модели
+(copy-on-write) вместо того, чтобы каждый держал свою копию. Инференс идет в отдельных процессах и
+не занимает общий пул потоков asyncio.to_thread.
+
+Задания ставятся в очередь; короткие записи (до 30 сек - одно окно Whisper)
+собираются в пакет и декодируются одним проходом модели.
+
+Каждый воркер - отдельный однопроцессный исполнитель. Если все задания пакета,
+который уже распознается, отменены, процесс воркера останавливается, а вместо
+него запускается новый: отмена не ждет окончания распознавания.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .whisper_backends import BACKEND_WHISPER, create_backend, is_batchable
+
+logger = logging.getLogger(__name__)
+
+# Движок в процессе-воркере (при fork - унаследован от основного процесса вместе с моделью)
+_backend = None
+
+
+def physical_cores() -> int:
+    """Число физических ядер, доступных процессу (гиперпотоки инференсу почти не помогают)"""
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+        if cores:
+            return max(min(cores, available), 1)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as cpuinfo:
+            cores = set()
+            physical_id = core_id = None
+            for line in cpuinfo:
+                if line.startswith("physical id"):
+                    physical_id = line.split(":", 1)[1].strip()
+                elif line.startswith("core id"):
+                    core_id = line.split(":", 1)[1].strip()
+                    cores.add((physical_id, core_id))
+            if cores:
+                return max(min(len(cores), available), 1)
+    except OSError:
+        pass
+    return max(available, 1)
+
+
+def _load_backend(name: str, model_name: str, threads: int, compute_type: str):
+    """Создает движок и загружает модель в текущий процесс (один раз)"""
+    global _backend
+    if _backend is None:
+        backend = create_backend(name, model_name, threads=threads, compute_type=compute_type)
+        backend.load()
+        _backend = backend
+    return _backend
+
+
+def _init_worker(name: str, model_name: str, threads: int, compute_type: str):
+    """Инициализация воркера: модель (если не унаследована через fork) и потоки"""
+    _load_backend(name, model_name, threads, compute_type).configure_worker()
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def _transcribe_batch(clips: List["np.ndarray"], language: Optional[str]) -> List[str]:
+    """
+    Распознает записи в воркере
+
+    Одна длинная запись распознается целиком (скользящим окном),
+    короткие - пакетом за один проход (если движок это умеет).
+    """
+    if len(clips) == 1 and not is_batchable(clips[0]):
+        return [_backend.transcribe(clips[0], language)]
+    return _backend.transcribe_batch(clips, language)
+
+
+@dataclass
+class _Job:
+    """Задание в очереди пула"""
+    audio: "np.ndarray"
+    future: asyncio.Future
+    queued_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def batchable(self) -> bool:
+        return is_batchable(self.audio)
+
+
+class WhisperPool:
+    """Очередь заданий и процессы-воркеры с загруженной моделью Whisper"""
+
+    def __init__(self, model_name: str, backend: str = BACKEND_WHISPER, compute_type: str = "int8",
+                 workers: int = 0, threads: int = 1, batch_size: int = 8, batch_wait_ms: int = 50,
+                 fork: bool = True, language: Optional[str] = None):
+        self.model_name = model_name
+        self.backend = backend
+        self.compute_type = compute_type
+        self.workers = workers or physical_cores()
+        self.threads = threads
+        self.batch_size = max(batch_size, 1)
+        self.batch_wait_sec = batch_wait_ms / 1000
+        self.fork = (fork and "fork" in multiprocessing.get_all_start_methods()
+                     and create_backend(backend, model_name).fork_safe)
+        self.language = None if not language or language.lower() == "auto" else language
+
+        self._executors: List[ProcessPoolExecutor] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Свободные воркеры
+        self._idle: Optional[asyncio.Queue] = None
+        self._context = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._deferred: List[_Job] = []
+        self._running: List[_Job] = []
+        self._in_flight = 0
+        self._closed = False
+
+        # Статистика
+        self.jobs = 0
+        self.batches = 0
+        self.busy_sec = 0.0
+        self.recycled = 0
+
+    @property
+    def started(self) -> bool:
+        return bool(self._executors)
+
+    @property
+    def queue_depth(self) -> int:
+        """Заданий в очереди и в работе"""
+        waiting = self._queue.qsize() if self._queue else 0
+        return waiting + len(self._deferred) + self._in_flight
+
+    async def start(self):
+        """Загружает модель и запускает воркеры (повторный вызов ждет первый)"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.started:
+                return
+
+            started = time.monotonic()
+            if self.fork:
+                # Модель загружается до fork - воркеры получают ее готовой и разделяют память
+                await asyncio.to_thread(_load_backend, *self._backend_args())
+                self._context = multiprocessing.get_context("fork")
+            else:
+                self._context = multiprocessing.get_context("spawn")
+
+            # Запускаем все воркеры сразу, чтобы первый запрос не ждал загрузки
+            executors = await asyncio.gather(*(self._start_worker() for _ in range(self.workers)))
+
+            self._queue = asyncio.Queue()
+            self._idle = asyncio.Queue()
+            for executor in executors:
+                self._idle.put_nowait(executor)
+            self._dispatcher = asyncio.create_task(self._dispatch())
+            logger.info(
+                f"Локальный Whisper ({self.backend}, {self.model_name}) готов за {time.monotonic() - started:.1f} сек: "
+                f"воркеров {self.workers}, {'fork' if self.fork else 'spawn'}"
+            )
+
+    def _backend_args(self):
+        return self.backend, self.model_name, self.threads, self.compute_type
+
+    async def _start_worker(self) -> ProcessPoolExecutor:
+        """Запускает процесс воркера и ждет, пока он загрузит модель"""
+        executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=self._backend_args()
+        )
+        self._executors.append(executor)
+        await asyncio.get_running_loop().run_in_executor(executor, _worker_ready)
+        return executor
+
+    def _stop_worker(self, executor: ProcessPoolExecutor):
+        """Останавливает процесс воркера, не дожидаясь текущего задания"""
+        if executor in self._executors:
+            self._executors.remove(executor)
+        # У ProcessPoolExecutor нет публичного способа прервать выполняющееся задание
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _replace_worker(self, executor: ProcessPoolExecutor):
+        """Заменяет воркер с отмененным пакетом новым процессом"""
+        self._stop_worker(executor)
+        self.recycled += 1
+        try:
+            replacement = await self._start_worker()
+        except Exception as e:
+            logger.error(f"Не удалось перезапустить воркер локального Whisper: {e}")
+            return
+        if self._closed:
+            self._stop_worker(replacement)
+            return
+        self._idle.put_nowait(replacement)
+
+    async def transcribe(self, audio: "np.ndarray") -> str:
+        """Ставит запись (float32, 16 кГц) в очередь и ждет текст"""
+        if not self.started:
+            await self.start()
+        job = _Job(audio, asyncio.get_running_loop().create_future())
+        self._queue.put_nowait(job)
+        # При отмене ожидания задание отменяется: из очереди не выполняется вовсе,
+        # а пакет, все задания которого отменены, прерывается вместе с процессом воркера
+        return await job.future
+
+    async def _next_job(self) -> _Job:
+        """Следующее задание (сначала отложенные длинные)"""
+        if self._deferred:
+            return self._deferred.pop(0)
+        return await self._queue.get()
+
+    async def _collect_batch(self, first: _Job) -> List[_Job]:
+        """Добирает короткие задания к первому, пока пакет не заполнится или не выйдет время ожидания"""
+        batch = [first]
+        if not first.batchable:
+            return batch
+        collect_until = time.monotonic() + self.batch_wait_sec
+        while len(batch) < self.batch_size:
+            if self._queue.qsize():
+                job = self._queue.get_nowait()
+            else:
+                remaining = collect_until - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if job.future.done():
+                continue
+            if job.batchable:
+                batch.append(job)
+            else:
+                self._deferred.append(job)
+        return batch
+
+    async def _dispatch(self):
+        """Разбирает очередь: свободный воркер получает следующий пакет"""
+        while True:
+            executor = await self._idle.get()
+            try:
+                job = await self._next_job()
+                while job.future.done():
+                    job = await self._next_job()
+                batch = await self._collect_batch(job)
+            except BaseException:
+                self._idle.put_nowait(executor)
+                raise
+            self._in_flight += len(batch)
+            self._running.extend(batch)
+            asyncio.create_task(self._run_batch(executor, batch))
+
+    async def _run_batch(self, executor: ProcessPoolExecutor, batch: List[_Job]):
+        """Выполняет пакет в воркере и раздает результаты (при отмене всех заданий - останавливает воркер)"""
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        work = loop.run_in_executor(executor, _transcribe_batch, [job.audio for job in batch], self.language)
+        # Результат остановленного воркера (BrokenProcessPool) никому не нужен
+        work.add_done_callback(lambda future: future.cancelled() or future.exception())
+        try:
+            while not work.done():
+                waiting = [job.future for job in batch if not job.future.done()]
+                if not waiting:
+                    break
+                await asyncio.wait([work, *waiting], return_when=asyncio.FIRST_COMPLETED)
+
+            if not work.done():
+                if self._closed:
+                    self._stop_worker(executor)
+                else:
+                    # Все, кто ждал пакет, отменили запросы - не тратим воркер на ненужный текст
+                    logger.info(f"Пакет из {len(batch)} записей отменен, перезапускаю воркер")
+                    asyncio.create_task(self._replace_worker(executor))
+                executor = None
+                return
+
+            error = work.exception()
+            for job, text in zip(batch, [] if error else work.result()):
+                if not job.future.done():
+                    job.future.set_result(text)
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_exception(error or RuntimeError("Whisper не вернул текст"))
+        finally:
+            self.jobs += len(batch)
+            self.batches += 1
+            self.busy_sec += time.monotonic() - started
+            self._in_flight -= len(batch)
+            for job in batch:
+                self._running.remove(job)
+            if executor is not None and not self._closed:
+                self._idle.put_nowait(executor)
+
+    async def close(self):
+        """Останавливает очередь и воркеры; ожидающие и выполняющиеся задания отменяются"""
+        self._closed = True
+        if self._dispatcher:
+            self._dispatcher.cancel()
+        jobs = self._running + self._deferred
+        self._deferred.clear()
+        while self._queue and not self._queue.empty():
+            jobs.append(self._queue.get_nowait())
+        for job in jobs:
+            job.future.cancel()
+        for executor in list(self._executors):
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Заданий, пакетов, средний размер пакета и загрузка"""
+        return {
+            'backend': self.backend,
+            'workers': self.workers,
+            'jobs': self.jobs,
+            'batches': self.batches,
+            'avg_batch': round(self.jobs / self.batches, 1) if self.batches else 0.0,
+            'queue_depth': self.queue_depth,
+            'busy_sec': round(self.busy_sec, 1),
+            'recycled': self.recycled,
+        }
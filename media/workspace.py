@@ -0,0 +1,270 @@
+"""
+Рабочие папки для файлов медиа-заданий
+
+Каждое задание (скачанный крупный файл, mp4 для ffmpeg) получает собственную
+папку с уникальным именем - файлы параллельных заданий не пересекаются.
+Папка удаляется при выходе из задания: после успеха, ошибки и отмены.
+
+- По возможности папки создаются в /dev/shm (tmpfs - в памяти, без записи на
+  диск), если там достаточно свободного места; иначе - в AUDIO_TEMP_DIR или
+  системной временной папке.
+- Общий объем файлов ограничен квотой: задание, которому не хватает места,
+  ждет, пока другие освободят его.
+- В имени папки - PID процесса. При запуске папки завершившихся (упавших)
+  процессов удаляются.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Имя общей папки внутри /dev/shm и временной папки
+WORKSPACE_DIRNAME = "assistant_bot_media"
+SHM_PATH = Path("/dev/shm")
+
+# Параметры по умолчанию (переопределяются переменными окружения)
+DEFAULT_QUOTA_MB = 1024
+DEFAULT_SHM_MIN_FREE_MB = 256
+# Папки работающих процессов старше этого срока тоже считаются брошенными
+ORPHAN_MAX_AGE_SEC = 24 * 3600
+
+
+def _pid_alive(pid: int) -> bool:
+    """Существует ли процесс (без прав на него - тоже считается живым)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _free_bytes(path: Path) -> int:
+    stats = os.statvfs(path)
+    return stats.f_bavail * stats.f_frsize
+
+
+class Workspace:
+    """Папка одного задания"""
+
+    def __init__(self, manager: "WorkspaceManager", root: Path):
+        self.manager = manager
+        self.root = root
+        self.path: Optional[Path] = None
+        self.reserved = 0
+
+    def file(self, suffix: str = "") -> Path:
+        """Уникальный путь для нового файла задания (папка создается при первом вызове)"""
+        if self.path is None:
+            self.path = self.root / f"job-{os.getpid()}-{uuid.uuid4().hex}"
+            self.path.mkdir(parents=True)
+        return self.path / f"{uuid.uuid4().hex}{suffix}"
+
+    async def reserve(self, size: int):
+        """Резервирует место под файл в пределах общей квоты (ждет, если квота занята)"""
+        await self.manager.reserve(size)
+        self.reserved += size
+
+    def cleanup(self):
+        """Удаляет папку задания и возвращает зарезервированное место"""
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+        if self.reserved:
+            self.manager.release(self.reserved)
+            self.reserved = 0
+
+
+class WorkspaceManager:
+    """Выдает папки заданиям: /dev/shm или диск, общая квота, очистка брошенных папок"""
+
+    def __init__(self, disk_root: Path, quota_bytes: int, use_shm: bool = True,
+                 shm_min_free_bytes: int = DEFAULT_SHM_MIN_FREE_MB * 1024 * 1024, keep_files: bool = False):
+        self.disk_root = disk_root
+        self.shm_root = SHM_PATH / WORKSPACE_DIRNAME if use_shm and self._shm_usable() else None
+        self.quota_bytes = quota_bytes
+        self.shm_min_free_bytes = shm_min_free_bytes
+        self.keep_files = keep_files
+        self._used = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+        # Статистика
+        self.jobs = 0
+        self.shm_jobs = 0
+        self.quota_waits = 0
+
+    @staticmethod
+    def _shm_usable() -> bool:
+        return SHM_PATH.is_dir() and os.access(SHM_PATH, os.W_OK)
+
+    @property
+    def roots(self) -> List[Path]:
+        return [root for root in (self.shm_root, self.disk_root) if root]
+
+    def _choose_root(self, expected_bytes: int) -> Path:
+        """tmpfs, если после файла там останется запас; иначе диск"""
+        if self.shm_root:
+            try:
+                if _free_bytes(SHM_PATH) - expected_bytes >= self.shm_min_free_bytes:
+                    return self.shm_root
+            except OSError:
+                pass
+        return self.disk_root
+
+    @asynccontextmanager
+    async def workspace(self, expected_bytes: int = 0) -> AsyncIterator[Workspace]:
+        """
+        Папка на время задания
+
+        Использование:
+            async with manager.workspace(file_size) as workspace:
+                await workspace.reserve(file_size)
+                path = workspace.file(".mp4")
+        """
+        root = self._choose_root(expected_bytes)
+        workspace = Workspace(self, root)
+        self.jobs += 1
+        if root == self.shm_root:
+            self.shm_jobs += 1
+        try:
+            yield workspace
+        finally:
+            if self.keep_files and workspace.path is not None:
+                # Файлы остаются для отладки и удаляются при следующем запуске
+                workspace.path = None
+            workspace.cleanup()
+
+    def scratch_dir(self) -> Path:
+        """
+        Папка на диске, не принадлежащая ни одному заданию (удаляет тот, кто ее создал)
+
+        Имя - как у папок заданий, поэтому брошенные после падения процесса
+        папки удаляются при следующем запуске.
+        """
+        self.disk_root.mkdir(parents=True, exist_ok=True)
+        return Path(tempfile.mkdtemp(prefix=f"job-{os.getpid()}-", dir=self.disk_root))
+
+    def _fits(self, size: int) -> bool:
+        # Файл больше всей квоты допускается, когда других файлов нет
+        return self._used == 0 or self._used + size <= self.quota_bytes
+
+    async def reserve(self, size: int):
+        """Ждет, пока в квоте освободится место (по очереди)"""
+        if not self._waiters and self._fits(size):
+            self._used += size
+            return
+        self.quota_waits += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((size, future))
+        try:
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release(size)
+            else:
+                future.cancel()
+                try:
+                    self._waiters.remove((size, future))
+                except ValueError:
+                    pass
+                self._wake()
+            raise
+
+    def release(self, size: int):
+        """Возвращает место в квоту и пропускает ожидающих"""
+        self._used = max(self._used - size, 0)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            size, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(size):
+                break
+            self._waiters.popleft()
+            self._used += size
+            future.set_result(None)
+
+    def sweep_orphans(self) -> int:
+        """
+        Удаляет папки завершившихся процессов (и слишком старые); возвращает их число
+
+        Вызывается при создании менеджера, до первого задания: папки с PID
+        текущего процесса оставлены прошлым запуском (в контейнере перезапущенный
+        процесс обычно получает тот же PID) и тоже удаляются.
+        """
+        removed = 0
+        now = time.time()
+        for root in self.roots:
+            if not root.is_dir():
+                continue
+            for path in root.glob("job-*"):
+                try:
+                    pid = int(path.name.split("-")[1])
+                except (IndexError, ValueError):
+                    continue
+                try:
+                    too_old = now - path.stat().st_mtime > ORPHAN_MAX_AGE_SEC
+                except OSError:
+                    continue
+                if pid != os.getpid() and _pid_alive(pid) and not too_old:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Заданий, из них в /dev/shm, занятая квота и ожидания квоты"""
+        return {
+            'jobs': self.jobs,
+            'shm_jobs': self.shm_jobs,
+            'used_mb': round(self._used / 1024 / 1024, 1),
+            'quota_mb': round(self.quota_bytes / 1024 / 1024),
+            'quota_waits': self.quota_waits,
+            'shm': str(self.shm_root) if self.shm_root else None,
+        }
+
+
+# Общий менеджер для всех модулей (создается при первом использовании)
+_workspace_manager: Optional[WorkspaceManager] = None
+
+
+def get_workspace_manager() -> WorkspaceManager:
+    """
+    Общий менеджер рабочих папок
+
+    AUDIO_TEMP_DIR - папка на диске (пусто - системная временная папка),
+    MEDIA_WORKSPACE_SHM - использовать /dev/shm,
+    MEDIA_WORKSPACE_SHM_MIN_FREE_MB - сколько оставлять свободным в /dev/shm,
+    MEDIA_WORKSPACE_QUOTA_MB - общий объем файлов заданий,
+    AUTO_CLEANUP_TEMP_FILES=false - оставлять файлы до следующего запуска.
+    """
+    global _workspace_manager
+    if _workspace_manager is None:
+        temp_dir = os.getenv("AUDIO_TEMP_DIR", "").strip()
+        project_dir = Path(__file__).resolve().parent.parent
+        disk_root = project_dir / temp_dir if temp_dir else Path(tempfile.gettempdir()) / WORKSPACE_DIRNAME
+        _workspace_manager = WorkspaceManager(
+            disk_root=disk_root,
+            quota_bytes=int(float(os.getenv("MEDIA_WORKSPACE_QUOTA_MB", str(DEFAULT_QUOTA_MB))) * 1024 * 1024),
+            use_shm=os.getenv("MEDIA_WORKSPACE_SHM", "true").lower() == "true",
+            shm_min_free_bytes=int(float(os.getenv("MEDIA_WORKSPACE_SHM_MIN_FREE_MB",
+                                                   str(DEFAULT_SHM_MIN_FREE_MB))) * 1024 * 1024),
+            keep_files=os.getenv("AUTO_CLEANUP_TEMP_FILES", "true").lower() != "true"
+        )
+        removed = _workspace_manager.sweep_orphans()
+        if removed:
+            logger.info(f"Удалено брошенных рабочих папок: {removed}")
+    return _workspace_manager
@@ -0,0 +1,77 @@
+"""
+Пакетная транскрипция пересланных голосовых
+
+Пересланная переписка приходит пачкой отдельных сообщений. Они собираются
+по короткому окну (MessageCoalescer), распознаются параллельно с ограничением
+и возвращаются одним текстом в исходном порядке с заголовками: кто говорил
+и когда было отправлено исходное сообщение.
+"""
+import html
+from dataclasses import dataclass
+from typing import List, Optional
+
+from aiogram.types import Message
+
+# Лимит длины сообщения Telegram (с запасом на разметку)
+MESSAGE_LIMIT = 4000
+
+
+@dataclass
+class BatchItem:
+    """Аудио из пачки пересланных сообщений"""
+    message: Message
+    file_id: str
+    filename: str
+    file_size: int
+    file_unique_id: Optional[str] = None
+    duration: Optional[int] = None
+
+
+def forward_sender(message: Message) -> str:
+    """Автор исходного сообщения (по forward_origin, иначе по устаревшим полям)"""
+    origin = message.forward_origin
+    name = None
+    if origin is not None:
+        if origin.type == "user":
+            name = origin.sender_user.full_name
+        elif origin.type == "hidden_user":
+            name = origin.sender_user_name
+        elif origin.type == "chat":
+            name = origin.sender_chat.title
+            if origin.author_signature:
+                name = f"{name} ({origin.author_signature})"
+        elif origin.type == "channel":
+            name = origin.chat.title
+            if origin.author_signature:
+                name = f"{name} ({origin.author_signature})"
+    elif message.forward_from:
+        name = message.forward_from.full_name
+    elif message.forward_sender_name:
+        name = message.forward_sender_name
+    return html.escape(name or "Неизвестный отправитель")
+
+
+def forward_header(index: int, item: BatchItem) -> str:
+    """Заголовок фрагмента: номер, автор и время исходного сообщения"""
+    message = item.message
+    sent_at = message.forward_origin.date if message.forward_origin else message.forward_date
+    when = f", {sent_at.strftime('%d.%m %H:%M')}" if sent_at else ""
+    return f"🗣 {index}. {forward_sender(message)}{when}"
+
+
+def split_text(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Делит длинный текст на части для отдельных сообщений (по абзацам, строкам, пробелам)"""
+    parts = []
+    while len(text) > limit:
+        cut = -1
+        for separator in ("\n\n", "\n", " "):
+            cut = text.rfind(separator, 0, limit)
+            if cut > limit // 2:
+                break
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
@@ -38,10 +38,13 @@ else:
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
 # Конфигурация модуля
+# Модель, язык, обработка аудио и кэш - общие с ChatGPT модулем (media.transcription):
+# WHISPER_MODEL, WHISPER_LANGUAGE, WHISPER_TEMPERATURE, WHISPER_MODE, AUDIO_*, TRANSCRIPTION_*
+# Лимит размера файла - MAX_AUDIO_SIZE_MB, но не больше лимита скачивания Bot API
+# (20 МБ, с локальным сервером telegram-bot-api - 2000 МБ)
 MODULE_CONFIG = {
-    'model': os.getenv('WHISPER_MODEL', 'whisper-1'),
-    'language': os.getenv('WHISPER_LANGUAGE', 'auto'),  # 'auto' для автоопределения
-    'temperature': float(os.getenv('WHISPER_TEMPERATURE', '0')),
-    'max_file_size': 25 * 1024 * 1024,  # 25MB - лимит Telegram для аудио
+    # Пересланные сообщения, пришедшие в пределах окна, распознаются одной пачкой (0 - по отдельности)
+    'batch_window_ms': int(os.getenv('AUDIO_BATCH_WINDOW_MS', '1500')),
+    'batch_concurrency': max(int(os.getenv('AUDIO_BATCH_CONCURRENCY', '4')), 1),  # Файлов пачки одновременно
     'supported_formats': ['.mp3', '.mp4', '.mpeg', '.mpga', '.m4a', '.wav', '.webm', '.ogg']
 } 
\ No newline at end of file
@@ -9,7 +9,7 @@ MESSAGES = {
 
 Отправьте мне:
 • 🎵 Голосовое сообщение
-• 📎 Аудиофайл (до 25МБ)
+• 📎 Аудиофайл (до 20МБ)
 
 Поддерживаемые форматы:
 MP3, MP4, MPEG, M4A, WAV, WebM, OGG
@@ -33,6 +33,28 @@ MP3, MP4, MPEG, M4A, WAV, WebM, OGG
     "processing": "🎧 Обрабатываю аудио...",
     
     "transcribing": "🤖 Распознаю речь через Whisper...",
+    
+    "queued": "⏳ Файл в очереди на распознавание: {position}-й, ожидание {wait}",
+    
+    "cancelled": "⛔ **Транскрипция отменена**",
+    
+    # Пачка пересланных голосовых
+    "batch_processing": "🎧 Распознаю пересланные сообщения: {total} шт...",
+    
+    "batch_progress": "🎧 Распознано {done} из {total} пересланных сообщений...",
+    
+    "batch_success": """
+📝 **Транскрипция переписки ({count} сообщ.):**
+
+{transcription}
+
+---
+⏱️ Время обработки: {duration}сек
+""",
+    
+    "batch_item_error": "❌ Не распознано: {error}",
+    
+    "batch_item_no_speech": "🔇 Речь не обнаружена",
 
     "success": """
 📝 **Транскрипция готова:**
@@ -55,7 +77,7 @@ MP3, MP4, MPEG, M4A, WAV, WebM, OGG
     "file_too_large": """
 📦 **Файл слишком большой**
 
-Максимальный размер: 25МБ
+Максимальный размер: {max_size}МБ
 Размер вашего файла: {size}МБ
 
 💡 Сожмите файл или разделите на части
@@ -117,8 +139,11 @@ MP3, MP4, MPEG, M4A, WAV, WebM, OGG
 2. Отправьте голосовое сообщение или аудиофайл
 3. Получите текст через несколько секунд
 
+Перешлите сразу несколько голосовых - придет одна расшифровка
+всей переписки с именами отправителей.
+
 **Ограничения:**
-• Размер файла: до 25МБ
+• Размер файла: до 20МБ (с локальным сервером Bot API - больше)
 • Только аудиофайлы
 • Качественная запись для лучшего результата
 
@@ -2,19 +2,26 @@
 Модуль транскрипции аудио через OpenAI Whisper
 """
 import asyncio
-import os
-import tempfile
 import time
 from pathlib import Path
-from aiogram import Router, F
+from typing import List, Optional
+from aiogram import Bot, Router, F
 from aiogram.types import CallbackQuery, Message, Audio, Voice, VideoNote, Document
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from .config import MODULE_CONFIG, OPENAI_API_KEY
+from .config import MODULE_CONFIG
 from .messages import MESSAGES
+from .batch import BatchItem, forward_header, split_text
+from media.telegram_files import max_download_bytes
+from media.transcription import get_transcription_engine
+from utils.coalescer import MessageCoalescer
+from utils.fair_queue import format_wait
+from utils.progress import ProgressMessage
+from utils.tasks import task_registry, get_cancel_reason
+from keyboards.cancel import get_cancel_menu
 
 # Состояния модуля
 class AudioStates(StatesGroup):
@@ -22,18 +29,23 @@ class AudioStates(StatesGroup):
 
 audio_router = Router()
 
-# Проверяем наличие OpenAI
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = bool(OPENAI_API_KEY)
-    if OPENAI_API_KEY:
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
-    else:
-        openai_client = None
-except ImportError:
-    OPENAI_AVAILABLE = False
-    openai_client = None
-    print("⚠️ OpenAI library not installed. Run: pip install openai")
+# Сбор пересланных аудио в пачки
+batch_collector = MessageCoalescer(MODULE_CONFIG['batch_window_ms'])
+
+@audio_router.startup()
+async def on_startup():
+    """Фоновая предзагрузка локального Whisper общего движка"""
+    get_transcription_engine().start()
+
+@audio_router.shutdown()
+async def on_shutdown():
+    """Остановка воркеров локального Whisper (повторный вызов безопасен)"""
+    await get_transcription_engine().close()
+
+def is_available() -> bool:
+    """Есть ли чем распознавать: Whisper API или локальный Whisper"""
+    engine = get_transcription_engine()
+    return engine.api_available or engine.local_available
 
 def get_back_menu():
     """Клавиатура для возврата в главное меню"""
@@ -45,6 +57,10 @@ def format_file_size(size_bytes: int) -> float:
     """Форматирует размер файла в МБ"""
     return round(size_bytes / (1024 * 1024), 2)
 
+def max_file_size(bot: Bot) -> int:
+    """Лимит размера файла: настройка движка и лимит скачивания Bot API (20 МБ без локального сервера)"""
+    return min(get_transcription_engine().settings.max_audio_size_mb * 1024 * 1024, max_download_bytes(bot))
+
 def get_file_extension(filename: str) -> str:
     """Получает расширение файла"""
     return Path(filename).suffix.lower() if filename else ''
@@ -55,7 +71,7 @@ async def activate_transcription(callback: CallbackQuery, state: FSMContext):
     if not callback.message:
         return
         
-    if not OPENAI_AVAILABLE:
+    if not is_available():
         await callback.message.edit_text(  # type: ignore
             MESSAGES["not_configured"], 
             reply_markup=get_back_menu()
@@ -75,22 +91,23 @@ async def activate_transcription(callback: CallbackQuery, state: FSMContext):
 @audio_router.message(StateFilter(AudioStates.waiting_for_audio), F.voice)
 async def handle_voice_message(message: Message, state: FSMContext):
     """Обработка голосовых сообщений"""
-    if not OPENAI_AVAILABLE or not openai_client or not message.voice:
+    if not is_available() or not message.voice:
         return
     
-    await process_audio_file(message, message.voice.file_id, "voice.ogg", message.voice.file_size)
+    await process_audio_file(message, message.voice.file_id, "voice.ogg", message.voice.file_size,
+                             message.voice.file_unique_id, message.voice.duration)
 
 @audio_router.message(StateFilter(AudioStates.waiting_for_audio), F.audio)
 async def handle_audio_file(message: Message, state: FSMContext):
     """Обработка аудиофайлов"""
-    if not OPENAI_AVAILABLE or not openai_client or not message.audio:
+    if not is_available() or not message.audio:
         return
     
     # Проверяем размер файла
-    if message.audio.file_size and message.audio.file_size > MODULE_CONFIG['max_file_size']:
+    if message.audio.file_size and message.audio.file_size > max_file_size(message.bot):
         size_mb = format_file_size(message.audio.file_size)
         await message.reply(
-            MESSAGES["file_too_large"].format(size=size_mb),
+            MESSAGES["file_too_large"].format(size=size_mb, max_size=format_file_size(max_file_size(message.bot))),
             reply_markup=get_back_menu()
         )
         return
@@ -105,20 +122,22 @@ async def handle_audio_file(message: Message, state: FSMContext):
         )
         return
     
-    await process_audio_file(message, message.audio.file_id, filename, message.audio.file_size or 0)
+    await process_audio_file(message, message.audio.file_id, filename, message.audio.file_size or 0,
+                             message.audio.file_unique_id, message.audio.duration)
 
 @audio_router.message(StateFilter(AudioStates.waiting_for_audio), F.video_note)
 async def handle_video_note(message: Message, state: FSMContext):
     """Обработка кружочков (видеосообщений)"""
-    if not OPENAI_AVAILABLE or not openai_client or not message.video_note:
+    if not is_available() or not message.video_note:
         return
     
-    await process_audio_file(message, message.video_note.file_id, "video_note.mp4", message.video_note.file_size or 0)
+    await process_audio_file(message, message.video_note.file_id, "video_note.mp4", message.video_note.file_size or 0,
+                             message.video_note.file_unique_id, message.video_note.duration)
 
 @audio_router.message(StateFilter(AudioStates.waiting_for_audio), F.document)
 async def handle_document_audio(message: Message, state: FSMContext):
     """Обработка аудиофайлов как документов"""
-    if not OPENAI_AVAILABLE or not openai_client or not message.document:
+    if not is_available() or not message.document:
         return
     
     # Проверяем, что это аудиофайл
@@ -132,114 +151,172 @@ async def handle_document_audio(message: Message, state: FSMContext):
         return
     
     # Проверяем размер файла
-    if message.document.file_size and message.document.file_size > MODULE_CONFIG['max_file_size']:
+    if message.document.file_size and message.document.file_size > max_file_size(message.bot):
         size_mb = format_file_size(message.document.file_size)
         await message.reply(
-            MESSAGES["file_too_large"].format(size=size_mb),
+            MESSAGES["file_too_large"].format(size=size_mb, max_size=format_file_size(max_file_size(message.bot))),
             reply_markup=get_back_menu()
         )
         return
     
-    await process_audio_file(message, message.document.file_id, filename, message.document.file_size or 0)
+    await process_audio_file(message, message.document.file_id, filename, message.document.file_size or 0,
+                             message.document.file_unique_id)
+
+async def process_audio_file(message: Message, file_id: str, filename: str, file_size: int,
+                             file_unique_id: Optional[str] = None, duration: Optional[int] = None):
+    """Основная функция обработки аудиофайла (отменяемая задача пользователя)"""
+    user_id = str(message.from_user.id) if message.from_user else str(message.chat.id)
+    
+    # Пересланные сообщения собираются в пачку и распознаются вместе
+    if batch_collector.enabled and (message.forward_origin or message.forward_date):
+        item = BatchItem(message, file_id, filename, file_size, file_unique_id, duration)
+        task = batch_collector.submit(user_id, item, _transcribe_batch)
+        task_registry.track(user_id, task, kind="transcription")
+        return
+    
+    await task_registry.run(
+        user_id,
+        _transcribe_audio_file(message, file_id, filename, file_size, file_unique_id, duration),
+        kind="transcription"
+    )
 
-async def process_audio_file(message: Message, file_id: str, filename: str, file_size: int):
-    """Основная функция обработки аудиофайла"""
+async def _transcribe_audio_file(message: Message, file_id: str, filename: str, file_size: int,
+                                 file_unique_id: Optional[str] = None, duration: Optional[int] = None):
+    """Скачивание и транскрипция аудиофайла"""
+    # Статус «печатает...»; сообщение с кнопкой отмены - только для долгих файлов
+    async with ProgressMessage(message, MESSAGES["processing"], reply_markup=get_cancel_menu()) as progress:
+        await _run_transcription(message, file_id, filename, file_size, progress, file_unique_id, duration)
+
+async def _send_result(progress: ProgressMessage, text: str, language: Optional[str],
+                       start_time: float, file_size: int):
+    """Ответ с распознанным текстом (или сообщение, что речи нет)"""
+    if not text:
+        await progress.finish(
+            MESSAGES["no_speech"],
+            reply_markup=get_back_menu()
+        )
+        return
+    
+    result_text = MESSAGES["success"].format(
+        transcription=text,
+        duration=round(time.time() - start_time, 1),
+        language=language or 'неизвестно',
+        file_size=format_file_size(file_size)
+    )
+    
+    # Отправляем результат (в сообщение "Обрабатываю...", если оно показано)
+    await progress.finish(result_text, reply_markup=get_back_menu())
+
+async def _run_transcription(message: Message, file_id: str, filename: str, file_size: int,
+                             progress: ProgressMessage, file_unique_id: Optional[str] = None,
+                             duration: Optional[int] = None):
+    """Распознавание общим движком (кэш, скачивание, Whisper) и ответ с результатом"""
     start_time = time.time()
+    engine = get_transcription_engine()
+    
+    async def on_progress(done: int, total: int):
+        await progress.update(f"{MESSAGES['transcribing']} ({done}/{total})")
     
-    # Показываем что обрабатываем
-    processing_msg = await message.reply(MESSAGES["processing"])
+    # Позиция в общей очереди: десять файлов одного пользователя не задерживают остальных
+    async def on_queue(position: int, eta: Optional[float]):
+        await progress.update(MESSAGES["queued"].format(position=position, wait=format_wait(eta)))
     
     try:
-        # Получаем файл от Telegram
-        file_info = await message.bot.get_file(file_id)
-        if not file_info.file_path:
-            raise Exception("Не удалось получить путь к файлу")
-        
-        # Создаем временный файл
-        file_ext = get_file_extension(filename)
-        with tempfile.NamedTemporaryFile(suffix=file_ext, delete=False) as temp_file:
-            temp_path = temp_file.name
-            
-            # Скачиваем файл
-            await message.bot.download_file(file_info.file_path, temp_path)
-        
-        # Обновляем сообщение
-        await processing_msg.edit_text(MESSAGES["transcribing"])
-        
-        # Отправляем в Whisper API
-        with open(temp_path, 'rb') as audio_file:
-            language = MODULE_CONFIG['language'] if MODULE_CONFIG['language'] != 'auto' else None
-            
-            transcription = await asyncio.to_thread(
-                openai_client.audio.transcriptions.create,  # type: ignore
-                model=MODULE_CONFIG['model'],
-                file=audio_file,
-                language=language,
-                temperature=MODULE_CONFIG['temperature']
-            )
-        
-        # Удаляем временный файл
-        os.unlink(temp_path)
+        result = await engine.transcribe_telegram_file(
+            message.bot, file_id, filename,
+            file_unique_id=file_unique_id,
+            file_size=file_size,
+            duration=duration,
+            on_progress=on_progress,
+            user_id=str(message.from_user.id) if message.from_user else str(message.chat.id),
+            on_queue=on_queue,
+            label="transcription"
+        )
         
-        # Проверяем результат
-        if not transcription.text or transcription.text.strip() == "":
-            await processing_msg.edit_text(
-                MESSAGES["no_speech"],
+        if result.error:
+            await progress.finish(
+                MESSAGES["error_general"].format(error=result.error),
                 reply_markup=get_back_menu()
             )
             return
         
-        # Готовим результат
-        duration = round(time.time() - start_time, 1)
-        file_size_mb = format_file_size(file_size)
-        detected_language = getattr(transcription, 'language', 'неизвестно')
-        
-        result_text = MESSAGES["success"].format(
-            transcription=transcription.text.strip(),
-            duration=duration,
-            language=detected_language,
-            file_size=file_size_mb
-        )
-        
-        # Удаляем сообщение "Обрабатываю..."
-        await processing_msg.delete()
-        
-        # Отправляем результат
-        await message.reply(
-            result_text,
-            reply_markup=get_back_menu()
-        )
-        
-    except asyncio.TimeoutError:
-        await processing_msg.edit_text(
-            MESSAGES["error_timeout"],
-            reply_markup=get_back_menu()
-        )
+        # Язык известен, только если он задан в настройках (иначе - автоопределение)
+        language = result.language
+        if not language and engine.settings.whisper_language.lower() != 'auto':
+            language = engine.settings.whisper_language
+        await _send_result(progress, result.text, language, start_time, file_size)
         
-    except Exception as e:
-        # Удаляем временный файл в случае ошибки
-        try:
-            if 'temp_path' in locals():
-                os.unlink(temp_path)
-        except:
-            pass
-        
-        error_text = str(e)
-        if "download" in error_text.lower():
-            await processing_msg.edit_text(
-                MESSAGES["error_download"].format(error=error_text),
-                reply_markup=get_back_menu()
-            )
-        elif "api" in error_text.lower() or "openai" in error_text.lower():
-            await processing_msg.edit_text(
-                MESSAGES["error_api"].format(error=error_text),
-                reply_markup=get_back_menu()
+    except asyncio.CancelledError as error:
+        # Сообщаем об отмене
+        await progress.cancelled(get_cancel_reason(error), MESSAGES["cancelled"], reply_markup=get_back_menu())
+        raise
+
+async def _transcribe_batch(items: List[BatchItem], commit):
+    """Пачка пересланных аудио: одна расшифровка в исходном порядке"""
+    # Сообщения, пришедшие после окна, составят следующую пачку
+    commit()
+    items = sorted(items, key=lambda item: item.message.message_id)
+    if len(items) == 1:
+        item = items[0]
+        await _transcribe_audio_file(item.message, item.file_id, item.filename, item.file_size,
+                                     item.file_unique_id, item.duration)
+        return
+    
+    message = items[0].message
+    async with ProgressMessage(message, MESSAGES["batch_processing"].format(total=len(items)),
+                               reply_markup=get_cancel_menu()) as progress:
+        await _run_batch(message, items, progress)
+
+async def _run_batch(message: Message, items: List[BatchItem], progress: ProgressMessage):
+    """Параллельная транскрипция пачки (с ограничением) и ответ одним текстом"""
+    start_time = time.time()
+    engine = get_transcription_engine()
+    user_id = str(message.from_user.id) if message.from_user else str(message.chat.id)
+    semaphore = asyncio.Semaphore(MODULE_CONFIG['batch_concurrency'])
+    done = 0
+    
+    async def transcribe(item: BatchItem):
+        nonlocal done
+        async with semaphore:
+            result = await engine.transcribe_telegram_file(
+                message.bot, item.file_id, item.filename,
+                file_unique_id=item.file_unique_id,
+                file_size=item.file_size,
+                duration=item.duration,
+                user_id=user_id,
+                label="transcription"
             )
+        done += 1
+        await progress.update(MESSAGES["batch_progress"].format(done=done, total=len(items)))
+        return result
+    
+    try:
+        results = await asyncio.gather(*(transcribe(item) for item in items))
+    except asyncio.CancelledError as error:
+        await progress.cancelled(get_cancel_reason(error), MESSAGES["cancelled"], reply_markup=get_back_menu())
+        raise
+    
+    sections = []
+    for index, (item, result) in enumerate(zip(items, results), 1):
+        if result.error:
+            body = MESSAGES["batch_item_error"].format(error=result.error)
+        elif not result.text:
+            body = MESSAGES["batch_item_no_speech"]
         else:
-            await processing_msg.edit_text(
-                MESSAGES["error_general"].format(error=error_text),
-                reply_markup=get_back_menu()
-            )
+            body = result.text
+        sections.append(f"{forward_header(index, item)}\n{body}")
+    
+    text = MESSAGES["batch_success"].format(
+        count=len(items),
+        transcription="\n\n".join(sections),
+        duration=round(time.time() - start_time, 1)
+    )
+    
+    # Длинная расшифровка - несколькими сообщениями, кнопка меню - под последним
+    parts = split_text(text)
+    await progress.finish(parts[0], reply_markup=get_back_menu() if len(parts) == 1 else None)
+    for number, part in enumerate(parts[1:], 2):
+        await message.answer(part, reply_markup=get_back_menu() if number == len(parts) else None)
 
 @audio_router.message(StateFilter(AudioStates.waiting_for_audio))
 async def handle_non_audio_message(message: Message):
@@ -255,8 +332,9 @@ async def exit_transcription_mode(callback: CallbackQuery, state: FSMContext):
     if not callback.message:
         return
     
-    # Очищаем состояние
+    # Очищаем состояние и отменяем незавершенные транскрипции
     await state.clear()
+    task_registry.cancel(str(callback.from_user.id))
     
     # Импортируем главное меню
     from keyboards.main_menu import get_main_menu
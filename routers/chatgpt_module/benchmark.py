@@ -0,0 +1,142 @@
+"""
+Бенчмарк задержки ответа: OpenAI и локальный OpenAI-совместимый сервер
+
+Отправляет одни и те же короткие вопросы обоим бэкендам (по очереди, без
+параллельных запросов) и сравнивает время полного ответа: среднее, медиану,
+95-й перцентиль и долю ошибок. Первый запрос к каждому бэкенду - прогрев
+(соединение, загрузка модели сервером) и в итоги не входит.
+
+Настройки берутся из .env модуля (OPENAI_*, LOCAL_LLM_*).
+
+Запуск:
+    python -m routers.chatgpt_module.benchmark --runs 5
+    python -m routers.chatgpt_module.benchmark --prompts questions.txt --max-tokens 64 --json bench.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .completions import (
+    BACKEND_LOCAL, BACKEND_OPENAI, local_client, openai_client, request_local_completion,
+    request_openai_completion
+)
+from .config import MODULE_CONFIG
+
+DEFAULT_PROMPTS = [
+    "Привет! Как дела?",
+    "Переведи на английский: доброе утро",
+    "Сколько будет 17 умножить на 23?",
+    "Придумай название для кофейни",
+    "Что такое фотосинтез? Одним предложением.",
+]
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Перцентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+async def _ask(backend: str, prompt: str, max_tokens: int) -> float:
+    """Один запрос; время полного ответа в секундах"""
+    messages = [{"role": "user", "content": prompt}]
+    started = time.perf_counter()
+    if backend == BACKEND_LOCAL:
+        await request_local_completion(messages, max_tokens)
+    else:
+        await request_openai_completion(messages, MODULE_CONFIG['fast_model'] or MODULE_CONFIG['model'],
+                                        max_tokens, MODULE_CONFIG['timeout'], None)
+    return time.perf_counter() - started
+
+
+async def run_backend(backend: str, prompts: List[str], runs: int, max_tokens: int) -> Dict:
+    """Прогон бэкенда: прогрев, затем каждый вопрос runs раз"""
+    try:
+        await _ask(backend, prompts[0], max_tokens)
+    except Exception as e:
+        return {'backend': backend, 'error': str(e)}
+
+    latencies = []
+    errors = 0
+    for _ in range(runs):
+        for prompt in prompts:
+            try:
+                latencies.append(await _ask(backend, prompt, max_tokens))
+            except Exception:
+                errors += 1
+    return {'backend': backend, 'latencies': latencies, 'errors': errors}
+
+
+def summarize(run: Dict) -> Optional[Dict]:
+    """Итоги бэкенда в миллисекундах"""
+    latencies = run.get('latencies')
+    if not latencies:
+        return None
+    return {
+        'backend': run['backend'],
+        'requests': len(latencies) + run['errors'],
+        'mean_ms': round(statistics.mean(latencies) * 1000),
+        'p50_ms': round(statistics.median(latencies) * 1000),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000),
+        'errors': run['errors'],
+    }
+
+
+async def benchmark(prompts: List[str], runs: int, max_tokens: int) -> List[Dict]:
+    backends = []
+    if openai_client is not None:
+        backends.append(BACKEND_OPENAI)
+    if local_client is not None:
+        backends.append(BACKEND_LOCAL)
+
+    results = []
+    for backend in backends:
+        print(f"⏳ {backend}...")
+        run = await run_backend(backend, prompts, runs, max_tokens)
+        if 'error' in run:
+            print(f"❌ {backend}: {run['error']}")
+        results.append(run)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Задержка коротких ответов: OpenAI и локальная модель")
+    parser.add_argument("--prompts", type=Path, default=None, help="Файл с вопросами (по одному в строке)")
+    parser.add_argument("--runs", type=int, default=3, help="Сколько раз задать каждый вопрос")
+    parser.add_argument("--max-tokens", type=int, default=64, help="Лимит ответа")
+    parser.add_argument("--json", type=Path, default=None, help="Сохранить все замеры в JSON")
+    args = parser.parse_args(argv)
+
+    if openai_client is None and local_client is None:
+        print("❌ Не настроены ни OPENAI_API_KEY, ни LOCAL_LLM_BASE_URL")
+        return 1
+
+    prompts = DEFAULT_PROMPTS
+    if args.prompts:
+        prompts = [line.strip() for line in args.prompts.read_text(encoding="utf-8").splitlines() if line.strip()]
+    print(f"💬 Вопросов: {len(prompts)} × {args.runs}, max_tokens {args.max_tokens}")
+
+    runs = asyncio.run(benchmark(prompts, args.runs, args.max_tokens))
+    summaries = [summary for summary in map(summarize, runs) if summary]
+    if not summaries:
+        return 1
+
+    print(f"\n{'Бэкенд':<10}{'Запросов':>10}{'Среднее, мс':>13}{'p50, мс':>9}{'p95, мс':>9}{'Ошибок':>8}")
+    for row in summaries:
+        print(f"{row['backend']:<10}{row['requests']:>10}{row['mean_ms']:>13}{row['p50_ms']:>9}"
+              f"{row['p95_ms']:>9}{row['errors']:>8}")
+
+    if args.json:
+        args.json.write_text(json.dumps({'summary': summaries, 'runs': runs}, ensure_ascii=False, indent=2),
+                             encoding="utf-8")
+        print(f"\n💾 Подробности: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+"""
+Запросы к OpenAI Chat Completions API
+Параметры с учетом особенностей моделей и учет кеширования промптов
+
+Кроме OpenAI может использоваться локальный OpenAI-совместимый сервер
+(llama.cpp, Ollama, vLLM на CPU): как запасной, когда OpenAI не отвечает
+(сработал предохранитель), для коротких текстовых вопросов или как основной в
+развертывании без доступа в интернет.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from .config import MODULE_CONFIG, OPENAI_API_KEY
+from .prompt_builder import prompt_cache_stats
+from utils.deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+BACKEND_OPENAI = "openai"
+BACKEND_LOCAL = "local"
+
+# Проверяем наличие OpenAI
+try:
+    import openai
+    from openai import AsyncOpenAI
+    # Асинхронный клиент: отмена задачи обрывает HTTP запрос к API
+    openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+    # Локальный сервер: без повторов - при отказе сразу переходим на OpenAI
+    local_client = AsyncOpenAI(
+        base_url=MODULE_CONFIG['local_llm_base_url'],
+        api_key=MODULE_CONFIG['local_llm_api_key'],
+        max_retries=0
+    ) if MODULE_CONFIG['local_llm_base_url'] else None
+    # Ошибки, после которых OpenAI считается недоступным (а не ошибка в запросе)
+    TRANSIENT_ERRORS = (openai.APIConnectionError, openai.InternalServerError, openai.RateLimitError,
+                        asyncio.TimeoutError)
+    OPENAI_AVAILABLE = openai_client is not None or local_client is not None
+except ImportError:
+    OPENAI_AVAILABLE = False
+    openai_client = None
+    local_client = None
+    TRANSIENT_ERRORS = (asyncio.TimeoutError,)
+    print("⚠️ OpenAI library not installed. Run: pip install openai")
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для OpenAI: после failures ошибок подряд запросы не
+    отправляются cooldown_sec секунд (сразу идут на локальную модель). По
+    истечении паузы allow() пропускает ровно один пробный запрос, остальные
+    по-прежнему идут на локальную модель: успех закрывает предохранитель,
+    ошибка открывает его снова.
+    """
+
+    def __init__(self, failures: int = 3, cooldown_sec: float = 60):
+        self.failures = max(failures, 1)
+        self.cooldown_sec = cooldown_sec
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial_at: Optional[float] = None
+        self.opened = 0
+
+    @property
+    def is_open(self) -> bool:
+        """OpenAI считается недоступным (пауза или ожидание пробного запроса)"""
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос в OpenAI (после паузы - только пробный)"""
+        if self._opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self._opened_at < self.cooldown_sec:
+            return False
+        # Пробный запрос уже идет; прерванный (отмена, ошибка запроса) не держит
+        # предохранитель дольше еще одной паузы
+        if self._trial_at is not None and now - self._trial_at < self.cooldown_sec:
+            return False
+        self._trial_at = now
+        return True
+
+    def record_success(self):
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial_at = None
+
+    def record_failure(self):
+        self._trial_at = None
+        self._consecutive += 1
+        if self._consecutive >= self.failures:
+            if not self.is_open:
+                self.opened += 1
+                logger.warning(f"OpenAI недоступен ({self._consecutive} ошибок подряд), пауза {self.cooldown_sec:.0f} сек")
+            self._opened_at = time.monotonic()
+
+
+class BackendStats:
+    """Запросы и средняя задержка по бэкендам, переходы на запасной"""
+
+    def __init__(self):
+        self.requests: Dict[str, int] = {}
+        self.total_sec: Dict[str, float] = {}
+        self.fallbacks = 0
+
+    def record(self, backend: str, latency_sec: float):
+        self.requests[backend] = self.requests.get(backend, 0) + 1
+        self.total_sec[backend] = self.total_sec.get(backend, 0.0) + latency_sec
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'requests': dict(self.requests),
+            'avg_ms': {backend: round(self.total_sec[backend] / count * 1000)
+                       for backend, count in self.requests.items()},
+            'fallbacks': self.fallbacks,
+        }
+
+
+openai_breaker = CircuitBreaker(MODULE_CONFIG['breaker_failures'], MODULE_CONFIG['breaker_cooldown_sec'])
+backend_stats = BackendStats()
+
+REASONING_MODEL_PREFIXES = ['o1-', 'o3-', 'o4-']
+
+
+def is_reasoning_model(model: str) -> bool:
+    """Reasoning-модели (o1, o3, o4 серии)"""
+    return any(model.startswith(prefix) for prefix in REASONING_MODEL_PREFIXES)
+
+
+def get_token_params(model: str, max_tokens: int) -> dict:
+    """
+    Возвращает правильные параметры токенов для разных моделей OpenAI
+
+    Reasoning-модели (o1, o3, o4 серии) используют max_completion_tokens
+    Остальные модели используют max_tokens
+    """
+    # Reasoning-модели (o1, o3, o4 серии)
+    if is_reasoning_model(model):
+        return {'max_completion_tokens': max_tokens}
+    # Все остальные модели (gpt-3.5-turbo, gpt-4, gpt-4o и т.д.)
+    else:
+        return {'max_tokens': max_tokens}
+
+
+def get_api_params(model: str, messages: list, temperature: float, max_tokens: int, timeout: int) -> dict:
+    """
+    Формирует параметры для вызова OpenAI API с учетом особенностей модели
+
+    Reasoning-модели (o1, o3, o4 серии) не поддерживают system сообщения и параметр temperature
+    """
+    base_params = {
+        'model': model,
+        'timeout': timeout
+    }
+
+    # Reasoning-модели имеют ограничения
+    if is_reasoning_model(model):
+        # system сообщения не поддерживаются: превращаем их в user сообщения на тех же местах,
+        # чтобы стабильный префикс промпта сохранился и попадал в кеш
+        user_messages = [
+            {'role': 'user', 'content': msg['content']} if msg.get('role') == 'system' else msg
+            for msg in messages
+        ]
+
+        base_params.update({
+            'messages': user_messages,
+            **get_token_params(model, max_tokens)
+            # temperature не поддерживается для reasoning-моделей
+        })
+    else:
+        # Стандартные модели поддерживают все параметры
+        base_params.update({
+            'messages': messages,
+            'temperature': temperature,
+            **get_token_params(model, max_tokens)
+        })
+
+    return base_params
+
+
+def select_completion_profile(deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+    """
+    Выбирает модель и лимиты запроса с учетом оставшегося бюджета времени
+
+    Пока времени достаточно - обычная модель и таймаут модуля. Когда бюджет
+    почти исчерпан - быстрая модель с меньшим max_tokens (или низкий
+    reasoning_effort, если быстрая модель не задана).
+    """
+    profile: Dict[str, Any] = {
+        'model': MODULE_CONFIG['model'],
+        'max_tokens': MODULE_CONFIG['max_tokens'],
+        'timeout': MODULE_CONFIG['timeout'],
+        'reasoning_effort': None,
+    }
+    if deadline is None:
+        return profile
+
+    profile['timeout'] = deadline.timeout(cap=MODULE_CONFIG['timeout'], stage="ChatGPT")
+
+    if deadline.is_short(MODULE_CONFIG['deadline_fast_mode_sec']):
+        if MODULE_CONFIG['fast_model']:
+            profile['model'] = MODULE_CONFIG['fast_model']
+        if is_reasoning_model(profile['model']):
+            # Урезать max_completion_tokens опасно: уйдут на рассуждения
+            profile['reasoning_effort'] = 'low'
+        else:
+            profile['max_tokens'] = min(profile['max_tokens'], MODULE_CONFIG['fast_max_tokens'])
+        logger.info(f"Мало времени ({deadline.remaining():.1f} сек): быстрый профиль {profile['model']}")
+
+    return profile
+
+
+def _is_text_only(messages: List[Dict[str, Any]]) -> bool:
+    """В сообщениях только текст (изображения локальная модель не поддерживает)"""
+    return all(isinstance(msg.get('content'), str) for msg in messages)
+
+
+def fits_local_model(messages: List[Dict[str, Any]]) -> bool:
+    """Запрос можно отправить локальной модели: только текст и помещается в ее контекст"""
+    if local_client is None or not _is_text_only(messages):
+        return False
+    from .long_input import count_tokens
+    prompt_tokens = sum(count_tokens(msg['content']) for msg in messages)
+    return prompt_tokens + MODULE_CONFIG['local_llm_max_tokens'] <= MODULE_CONFIG['local_llm_context_tokens']
+
+
+def is_simple_prompt(messages: List[Dict[str, Any]]) -> bool:
+    """Короткий текстовый вопрос - по нему достаточно локальной модели (режим simple)"""
+    question = messages[-1].get('content') if messages else None
+    return isinstance(question, str) and len(question) <= MODULE_CONFIG['local_llm_simple_max_chars']
+
+
+def choose_backend(messages: List[Dict[str, Any]]) -> str:
+    """Бэкенд для запроса: OpenAI или локальный сервер (по режиму и состоянию предохранителя)"""
+    if not fits_local_model(messages):
+        return BACKEND_OPENAI
+    mode = MODULE_CONFIG['local_llm_mode']
+    if openai_client is None or mode == "primary":
+        return BACKEND_LOCAL
+    if mode == "simple" and is_simple_prompt(messages):
+        return BACKEND_LOCAL
+    # Последним: allow() после паузы отдает единственный пробный запрос
+    if not openai_breaker.allow():
+        return BACKEND_LOCAL
+    return BACKEND_OPENAI
+
+
+async def request_openai_completion(messages: List[Dict[str, Any]], model: str, max_tokens: int, timeout: float,
+                                    reasoning_effort: Optional[str], bounded: bool = False) -> Optional[str]:
+    """
+    Запрос к OpenAI с учетом закешированных токенов
+
+    bounded - timeout задан бюджетом времени: без повторов клиента (каждый
+    повтор получил бы весь timeout заново) и с пределом на весь запрос
+    """
+    api_params = get_api_params(
+        model=model,
+        messages=messages,
+        temperature=MODULE_CONFIG['temperature'],
+        max_tokens=max_tokens,
+        timeout=timeout
+    )
+    if reasoning_effort and is_reasoning_model(model):
+        api_params['reasoning_effort'] = reasoning_effort
+
+    if bounded:
+        client = openai_client.with_options(max_retries=0)
+        response = await asyncio.wait_for(client.chat.completions.create(**api_params), timeout)
+    else:
+        response = await openai_client.chat.completions.create(**api_params)
+
+    usage = getattr(response, 'usage', None)
+    cached_tokens = prompt_cache_stats.record(usage)
+    if usage is not None:
+        logger.info(
+            f"Completion {model}: prompt={usage.prompt_tokens} cached={cached_tokens} "
+            f"(hit rate {prompt_cache_stats.hit_rate:.0%})"
+        )
+
+    content = response.choices[0].message.content
+    return content.strip() if content else None
+
+
+async def request_local_completion(messages: List[Dict[str, Any]], max_tokens: int,
+                                   timeout: Optional[float] = None) -> Optional[str]:
+    """Запрос к локальному OpenAI-совместимому серверу (своя модель и лимиты, не дольше timeout)"""
+    timeout = min(timeout, MODULE_CONFIG['local_llm_timeout']) if timeout else MODULE_CONFIG['local_llm_timeout']
+    api_params = get_api_params(
+        model=MODULE_CONFIG['local_llm_model'],
+        messages=messages,
+        temperature=MODULE_CONFIG['temperature'],
+        max_tokens=min(max_tokens, MODULE_CONFIG['local_llm_max_tokens']),
+        timeout=timeout
+    )
+    response = await asyncio.wait_for(local_client.chat.completions.create(**api_params), timeout)
+    content = response.choices[0].message.content
+    return content.strip() if content else None
+
+
+async def request_completion(
+    messages: List[Dict[str, Any]],
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    timeout: Optional[float] = None,
+    reasoning_effort: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Выполняет запрос к Chat Completions API (OpenAI или локальный сервер)
+
+    Если OpenAI не ответил (сеть, 5xx, лимиты, таймаут), а запрос подходит
+    локальной модели - ответ берется у нее. Для локального сервера model и
+    reasoning_effort не используются: у него своя модель из LOCAL_LLM_MODEL.
+
+    Явный timeout (остаток бюджета времени) ограничивает весь вызов, включая
+    переход на запасной бэкенд.
+
+    Returns:
+        Optional[str]: Текст ответа (без пробелов по краям) или None, если ответ пустой
+    """
+    if not OPENAI_AVAILABLE:
+        raise RuntimeError("OpenAI клиент не настроен")
+
+    model = model or MODULE_CONFIG['model']
+    max_tokens = max_tokens or MODULE_CONFIG['max_tokens']
+    bounded = timeout is not None
+    timeout = timeout or MODULE_CONFIG['timeout']
+    expires = time.monotonic() + timeout
+    backend = choose_backend(messages)
+
+    def remaining() -> Optional[float]:
+        """Остаток бюджета для следующей попытки (None - без бюджета)"""
+        return max(expires - time.monotonic(), 0.0) if bounded else None
+
+    if backend == BACKEND_LOCAL:
+        started = time.monotonic()
+        try:
+            result = await request_local_completion(messages, max_tokens, remaining())
+            backend_stats.record(BACKEND_LOCAL, time.monotonic() - started)
+            return result
+        except TRANSIENT_ERRORS as e:
+            if openai_client is None or remaining() == 0 or not openai_breaker.allow():
+                raise
+            # Локальный сервер в режиме primary/simple не ответил - пробуем OpenAI
+            logger.warning(f"Локальная модель недоступна, запрос к OpenAI: {e}")
+            backend_stats.fallbacks += 1
+
+    if openai_client is None:
+        raise RuntimeError("OpenAI клиент не настроен")
+
+    started = time.monotonic()
+    try:
+        result = await request_openai_completion(
+            messages, model, max_tokens, remaining() if bounded else timeout, reasoning_effort, bounded
+        )
+    except TRANSIENT_ERRORS as e:
+        openai_breaker.record_failure()
+        if backend == BACKEND_LOCAL or not fits_local_model(messages) or remaining() == 0:
+            raise
+        logger.warning(f"OpenAI не ответил, запрос к локальной модели: {e}")
+        backend_stats.fallbacks += 1
+        started = time.monotonic()
+        result = await request_local_completion(messages, max_tokens, remaining())
+        backend_stats.record(BACKEND_LOCAL, time.monotonic() - started)
+        return result
+
+    openai_breaker.record_success()
+    backend_stats.record(BACKEND_OPENAI, time.monotonic() - started)
+    return result
@@ -30,17 +30,96 @@ else:
     # Для остальных моделей используем max_tokens
     EFFECTIVE_MAX_TOKENS = OPENAI_MAX_TOKENS
 
-# ===== WHISPER НАСТРОЙКИ =====
-WHISPER_MODE = os.getenv("WHISPER_MODE", "api").lower()  # "api" или "local"
-WHISPER_MODEL = os.getenv("WHISPER_MODEL", "whisper-1")  # Для API
-LOCAL_WHISPER_MODEL = os.getenv("LOCAL_WHISPER_MODEL", "base")  # Для локального
-WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "ru")  # Язык распознавания
-
-# ===== АУДИО НАСТРОЙКИ =====
-MAX_AUDIO_SIZE_MB = int(os.getenv("MAX_AUDIO_SIZE_MB", "25"))
-MAX_AUDIO_DURATION_SEC = int(os.getenv("MAX_AUDIO_DURATION_SEC", "300"))
-AUDIO_TEMP_DIR = os.getenv("AUDIO_TEMP_DIR", "temp_audio")
-AUTO_CLEANUP_TEMP_FILES = os.getenv("AUTO_CLEANUP_TEMP_FILES", "true").lower() == "true"
+# Быстрый профиль для ответов, когда бюджет времени почти исчерпан
+OPENAI_FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+OPENAI_FAST_MAX_TOKENS = int(os.getenv("OPENAI_FAST_MAX_TOKENS", "500"))
+
+# ===== ЛОКАЛЬНАЯ МОДЕЛЬ (OpenAI-совместимый сервер: llama.cpp, Ollama, vLLM) =====
+# Адрес API, например http://127.0.0.1:8080/v1 (пусто - не используется)
+LOCAL_LLM_BASE_URL = os.getenv("LOCAL_LLM_BASE_URL", "")
+LOCAL_LLM_API_KEY = os.getenv("LOCAL_LLM_API_KEY", "local")
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "local-model")
+LOCAL_LLM_MAX_TOKENS = int(os.getenv("LOCAL_LLM_MAX_TOKENS", "512"))
+LOCAL_LLM_TIMEOUT = float(os.getenv("LOCAL_LLM_TIMEOUT", "60"))
+# fallback - только когда OpenAI недоступен; simple - еще и короткие текстовые вопросы;
+# primary - всегда локально (OpenAI - запасной, если задан ключ)
+LOCAL_LLM_MODE = os.getenv("LOCAL_LLM_MODE", "fallback").lower()
+# «Короткий вопрос» для режима simple (символов) и лимит всего промпта для локальной модели (токены)
+LOCAL_LLM_SIMPLE_MAX_CHARS = int(os.getenv("LOCAL_LLM_SIMPLE_MAX_CHARS", "300"))
+LOCAL_LLM_CONTEXT_TOKENS = int(os.getenv("LOCAL_LLM_CONTEXT_TOKENS", "4096"))
+
+# Предохранитель: после стольких ошибок OpenAI подряд запросы не отправляются COOLDOWN секунд
+OPENAI_BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "3"))
+OPENAI_BREAKER_COOLDOWN_SEC = float(os.getenv("OPENAI_BREAKER_COOLDOWN_SEC", "60"))
+
+# ===== БЮДЖЕТ ВРЕМЕНИ (DEADLINE) =====
+# Общий бюджет на голосовое: скачивание → транскрипция → ChatGPT (секунды)
+VOICE_PIPELINE_DEADLINE_SEC = float(os.getenv("VOICE_PIPELINE_DEADLINE_SEC", "90"))
+# Если осталось меньше - используем быстрый профиль и не ждем локальный Whisper
+DEADLINE_FAST_MODE_SEC = float(os.getenv("DEADLINE_FAST_MODE_SEC", "20"))
+
+# Окно склейки быстрых сообщений пользователя (мс, 0 = выключено)
+CHATGPT_COALESCE_WINDOW_MS = int(os.getenv("CHATGPT_COALESCE_WINDOW_MS", "0"))
+# Новое сообщение отменяет еще не отправленный ответ на предыдущее
+CHATGPT_SUPERSEDE_INFLIGHT = os.getenv("CHATGPT_SUPERSEDE_INFLIGHT", "true").lower() == "true"
+
+# Быстрые ответы по шаблону на «привет», «спасибо», «ок» - без запроса к ChatGPT и памяти
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+# Включенные намерения: greeting, thanks, ack, goodbye
+FAST_PATH_INTENTS = [intent.strip() for intent in os.getenv("FAST_PATH_INTENTS", "greeting,thanks,ack,goodbye").split(",") if intent.strip()]
+# Более длинные сообщения всегда идут в ChatGPT (символы)
+FAST_PATH_MAX_CHARS = int(os.getenv("FAST_PATH_MAX_CHARS", "40"))
+
+# Индикация прогресса: сначала только «печатает...», заглушка - если обработка затянулась
+PROGRESS_PLACEHOLDER_DELAY_SEC = float(os.getenv("PROGRESS_PLACEHOLDER_DELAY_SEC", "3"))
+# Минимальный интервал между промежуточными правками статуса (секунды)
+PROGRESS_EDIT_INTERVAL_SEC = float(os.getenv("PROGRESS_EDIT_INTERVAL_SEC", "1.5"))
+
+# ===== WHISPER И АУДИО НАСТРОЙКИ =====
+# Распознавание выполняет общий движок media.transcription (вместе с модулем транскрипции):
+# WHISPER_*, LOCAL_WHISPER_*, AUDIO_*, LONG_AUDIO_*, ROUTING_* читаются им из окружения.
+# Здесь - только то, что касается ответа ChatGPT на голосовое.
+# После последнего сегмента сразу запрашивать ответ ChatGPT (false - только расшифровка)
+LOCAL_STREAMING_COMPLETE = os.getenv("LOCAL_STREAMING_COMPLETE", "true").lower() == "true"
+# Бюджет времени на длинную запись (распознается по сегментам)
+LONG_AUDIO_DEADLINE_SEC = float(os.getenv("LONG_AUDIO_DEADLINE_SEC", "600"))
+
+# ===== ДЛИННЫЕ ТЕКСТЫ (MAP-REDUCE) =====
+# Расшифровка длиннее порога (токены) конспектируется по частям параллельно (0 - всегда целиком)
+LONG_INPUT_THRESHOLD_TOKENS = int(os.getenv("LONG_INPUT_THRESHOLD_TOKENS", "3000"))
+# Размер части (токены)
+LONG_INPUT_CHUNK_TOKENS = int(os.getenv("LONG_INPUT_CHUNK_TOKENS", "1500"))
+# Частей в обработке одновременно
+LONG_INPUT_MAX_PARALLEL = int(os.getenv("LONG_INPUT_MAX_PARALLEL", "4"))
+# Модель для конспектов частей (пусто - быстрая модель OPENAI_FAST_MODEL)
+LONG_INPUT_MAP_MODEL = os.getenv("LONG_INPUT_MAP_MODEL", "")
+LONG_INPUT_MAP_MAX_TOKENS = int(os.getenv("LONG_INPUT_MAP_MAX_TOKENS", "600"))
+# Сколько минут конспект записи подставляется в ответы на вопросы о ней
+LONG_INPUT_FOLLOWUP_MIN = float(os.getenv("LONG_INPUT_FOLLOWUP_MIN", "60"))
+
+# ===== ДОКУМЕНТЫ (ВОПРОСЫ ПО ТЕКСТУ) =====
+# Прием TXT, Markdown и PDF (для PDF нужен pypdf): в запрос попадают только нужные фрагменты
+DOCUMENTS_ENABLED = os.getenv("DOCUMENTS_ENABLED", "true").lower() == "true"
+DOCUMENT_MAX_SIZE_MB = float(os.getenv("DOCUMENT_MAX_SIZE_MB", "20"))
+# Размер фрагмента (токены)
+DOCUMENT_CHUNK_TOKENS = int(os.getenv("DOCUMENT_CHUNK_TOKENS", "400"))
+# Фрагментов на вопрос и их общий бюджет (токены)
+DOCUMENT_TOP_K = int(os.getenv("DOCUMENT_TOP_K", "5"))
+DOCUMENT_CONTEXT_TOKENS = int(os.getenv("DOCUMENT_CONTEXT_TOKENS", "2500"))
+# Сколько последних документов пользователя участвует в ответах
+DOCUMENTS_PER_USER = int(os.getenv("DOCUMENTS_PER_USER", "3"))
+# Индексов в общем кэше (по file_unique_id)
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", "20"))
+# Модель эмбеддингов для векторного поиска вместе с BM25 (пусто - только BM25)
+DOCUMENT_EMBEDDING_MODEL = os.getenv("DOCUMENT_EMBEDDING_MODEL", "")
+
+# ===== СЕССИОННАЯ ПАМЯТЬ (RAM) =====
+# Сколько пар диалогов хранится в сессии
+SESSION_HISTORY_SIZE = int(os.getenv("SESSION_HISTORY_SIZE", "20"))
+# Последние пары в контексте всегда, остальные - по релевантности вопросу (BM25)
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", "2"))
+# Бюджет сессионного контекста (токены)
+SESSION_CONTEXT_TOKENS = int(os.getenv("SESSION_CONTEXT_TOKENS", "1500"))
 
 # ===== VISION API НАСТРОЙКИ (Изображения) =====
 VISION_ENABLED = os.getenv("VISION_ENABLED", "true").lower() == "true"
@@ -60,22 +139,23 @@ REQUIRED_VARS = {
 }
 
 missing_vars = [name for name, value in REQUIRED_VARS.items() if not value]
-if missing_vars:
+# С локальной моделью в режиме primary модуль работает и без ключа OpenAI
+if missing_vars and not (LOCAL_LLM_BASE_URL and LOCAL_LLM_MODE == "primary"):
     print(f"❌ Отсутствуют переменные в .env: {', '.join(missing_vars)}")
     print(f"📋 Скопируйте env.example в .env и заполните значения")
 
-# Валидация WHISPER_MODE
-if WHISPER_MODE not in ["api", "local"]:
-    print(f"⚠️  Неверное значение WHISPER_MODE: {WHISPER_MODE}")
-    print("📋 Допустимые значения: 'api' или 'local'")
-    WHISPER_MODE = "api"  # Fallback на API
-
 # Валидация VISION настроек
 if VISION_QUALITY not in ["low", "high"]:
     print(f"⚠️  Неверное значение VISION_QUALITY: {VISION_QUALITY}")
     print("📋 Допустимые значения: 'low' или 'high'")
     VISION_QUALITY = "low"  # Fallback на экономичный режим
 
+# Валидация режима локальной модели
+if LOCAL_LLM_MODE not in ["fallback", "simple", "primary"]:
+    print(f"⚠️  Неверное значение LOCAL_LLM_MODE: {LOCAL_LLM_MODE}")
+    print("📋 Допустимые значения: 'fallback', 'simple' или 'primary'")
+    LOCAL_LLM_MODE = "fallback"
+
 # Проверка поддержки Vision API моделью
 # Базовые модели с Vision поддержкой
 VISION_SUPPORTED_MODELS = ["gpt-4-vision-preview", "gpt-4o", "gpt-4o-mini", "gpt-4-turbo"]
@@ -109,18 +189,54 @@ MODULE_CONFIG = {
     'max_completion_tokens': OPENAI_MAX_COMPLETION_TOKENS,  # Для o1-моделей
     'temperature': OPENAI_TEMPERATURE,
     'timeout': 30,  # секунды для запросов
+    'fast_model': OPENAI_FAST_MODEL,
+    'fast_max_tokens': OPENAI_FAST_MAX_TOKENS,
+    'local_llm_base_url': LOCAL_LLM_BASE_URL,
+    'local_llm_api_key': LOCAL_LLM_API_KEY,
+    'local_llm_model': LOCAL_LLM_MODEL,
+    'local_llm_max_tokens': LOCAL_LLM_MAX_TOKENS,
+    'local_llm_timeout': LOCAL_LLM_TIMEOUT,
+    'local_llm_mode': LOCAL_LLM_MODE,
+    'local_llm_simple_max_chars': LOCAL_LLM_SIMPLE_MAX_CHARS,
+    'local_llm_context_tokens': LOCAL_LLM_CONTEXT_TOKENS,
+    'breaker_failures': OPENAI_BREAKER_FAILURES,
+    'breaker_cooldown_sec': OPENAI_BREAKER_COOLDOWN_SEC,
+    'coalesce_window_ms': CHATGPT_COALESCE_WINDOW_MS,
+    'supersede_inflight': CHATGPT_SUPERSEDE_INFLIGHT,
+    'fast_path_enabled': FAST_PATH_ENABLED,
+    'fast_path_intents': FAST_PATH_INTENTS,
+    'fast_path_max_chars': FAST_PATH_MAX_CHARS,
+    'placeholder_delay_sec': PROGRESS_PLACEHOLDER_DELAY_SEC,
+    'progress_edit_interval_sec': PROGRESS_EDIT_INTERVAL_SEC,
+    
+    # Голосовые сообщения
+    'local_streaming_complete': LOCAL_STREAMING_COMPLETE,
+    'long_audio_deadline_sec': LONG_AUDIO_DEADLINE_SEC,
     
-    # Whisper настройки
-    'whisper_mode': WHISPER_MODE,
-    'whisper_model': WHISPER_MODEL,
-    'local_whisper_model': LOCAL_WHISPER_MODEL,
-    'whisper_language': WHISPER_LANGUAGE,
+    # Длинные тексты (map-reduce)
+    'long_input_threshold_tokens': LONG_INPUT_THRESHOLD_TOKENS,
+    'long_input_chunk_tokens': LONG_INPUT_CHUNK_TOKENS,
+    'long_input_max_parallel': LONG_INPUT_MAX_PARALLEL,
+    'long_input_map_model': LONG_INPUT_MAP_MODEL,
+    'long_input_map_max_tokens': LONG_INPUT_MAP_MAX_TOKENS,
+    'long_input_followup_min': LONG_INPUT_FOLLOWUP_MIN,
     
-    # Аудио настройки
-    'max_audio_size_mb': MAX_AUDIO_SIZE_MB,
-    'max_audio_duration_sec': MAX_AUDIO_DURATION_SEC,
-    'audio_temp_dir': AUDIO_TEMP_DIR,
-    'auto_cleanup_temp_files': AUTO_CLEANUP_TEMP_FILES,
+    # Документы
+    'documents_enabled': DOCUMENTS_ENABLED,
+    'document_max_size_mb': DOCUMENT_MAX_SIZE_MB,
+    'document_chunk_tokens': DOCUMENT_CHUNK_TOKENS,
+    'document_top_k': DOCUMENT_TOP_K,
+    'document_context_tokens': DOCUMENT_CONTEXT_TOKENS,
+    'documents_per_user': DOCUMENTS_PER_USER,
+    'document_cache_size': DOCUMENT_CACHE_SIZE,
+    'document_embedding_model': DOCUMENT_EMBEDDING_MODEL,
+    'session_history_size': SESSION_HISTORY_SIZE,
+    'session_recent_turns': SESSION_RECENT_TURNS,
+    'session_context_tokens': SESSION_CONTEXT_TOKENS,
+    
+    # Бюджет времени
+    'voice_deadline_sec': VOICE_PIPELINE_DEADLINE_SEC,
+    'deadline_fast_mode_sec': DEADLINE_FAST_MODE_SEC,
     
     # Vision API настройки
     'vision_enabled': VISION_ENABLED,
@@ -134,10 +250,3 @@ MODULE_CONFIG = {
     'mem0_enabled': MEM0_ENABLED,
     'mem0_api_key': MEM0_API_KEY,
 }
-
-# Создаем папку для временных аудио файлов
-TEMP_AUDIO_PATH = module_dir / AUDIO_TEMP_DIR
-TEMP_AUDIO_PATH.mkdir(exist_ok=True)
-
-# Конвертируем относительные пути в абсолютные для использования в модуле
-MODULE_CONFIG['temp_audio_path'] = TEMP_AUDIO_PATH 
\ No newline at end of file
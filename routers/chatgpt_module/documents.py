@@ -0,0 +1,290 @@
+"""
+Вопросы по документам: локальный индекс фрагментов вместо документа в промпте
+
+Документ (TXT, Markdown, PDF) делится на фрагменты и индексируется BM25 в
+отдельном потоке - страница за страницей, фрагмент за фрагментом. В запрос к
+ChatGPT попадают только самые релевантные вопросу фрагменты в пределах
+бюджета токенов, поэтому документ на 200 страниц обходится запросами обычного
+размера.
+
+Индексы кэшируются по file_unique_id: тот же файл, присланный повторно (или
+другим пользователем), не разбирается заново. Если задана модель эмбеддингов
+(DOCUMENT_EMBEDDING_MODEL), к BM25 добавляется векторный поиск, а списки
+объединяются по рангам (reciprocal rank fusion).
+"""
+import asyncio
+import io
+import logging
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .completions import openai_client
+from .config import MODULE_CONFIG
+from .long_input import count_tokens, split_into_chunks
+from .retrieval import BM25Index
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pypdf import PdfReader
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown"}
+PDF_EXTENSIONS = {".pdf"}
+
+# Константа reciprocal rank fusion
+RRF_K = 60
+# Фрагментов в одном запросе к API эмбеддингов
+EMBEDDING_BATCH = 64
+
+# Вопрос о документе целиком: без общих слов с ним, но ответ - по его началу
+OVERVIEW_PATTERN = re.compile(
+    r"о\s+ч[её]м|про\s+что|перескажи|краткое\s+содержание|резюмируй|summar|what.{0,20}\babout\b",
+    re.IGNORECASE
+)
+
+
+class DocumentError(Exception):
+    """Документ не удалось прочитать"""
+
+
+def supported_extensions() -> List[str]:
+    """Расширения документов, которые можно загрузить"""
+    return sorted(TEXT_EXTENSIONS | (PDF_EXTENSIONS if PDF_AVAILABLE else set()))
+
+
+def _decode_text(data: bytes) -> str:
+    for encoding in ("utf-8-sig", "cp1251"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace")
+
+
+def extract_pages(filename: str, data: bytes) -> Iterator[str]:
+    """Текст документа по страницам (текстовый файл - одна страница)"""
+    extension = Path(filename).suffix.lower()
+    if extension in TEXT_EXTENSIONS:
+        yield _decode_text(data)
+    elif extension in PDF_EXTENSIONS and PDF_AVAILABLE:
+        try:
+            reader = PdfReader(io.BytesIO(data))
+            for page in reader.pages:
+                yield page.extract_text() or ""
+        except Exception as e:
+            raise DocumentError(f"не удалось прочитать PDF: {e}")
+    else:
+        raise DocumentError(f"формат {extension or 'без расширения'} не поддерживается")
+
+
+@dataclass
+class IndexedDocument:
+    """Документ, разбитый на фрагменты, с индексом"""
+    name: str
+    chunks: List[str] = field(default_factory=list)
+    pages: List[int] = field(default_factory=list)
+    index: BM25Index = field(default_factory=BM25Index)
+    embeddings: Optional["np.ndarray"] = None
+
+    @property
+    def tokens(self) -> int:
+        return sum(count_tokens(chunk) for chunk in self.chunks)
+
+
+def build_document(name: str, data: bytes, chunk_tokens: int) -> IndexedDocument:
+    """Разбор и индексация (в отдельном потоке): страницы читаются и индексируются по очереди"""
+    document = IndexedDocument(name)
+    for page_number, page in enumerate(extract_pages(name, data), 1):
+        if not page.strip():
+            continue
+        for chunk in split_into_chunks(page, chunk_tokens):
+            document.index.add(len(document.chunks), chunk)
+            document.chunks.append(chunk)
+            document.pages.append(page_number)
+    if not document.chunks:
+        raise DocumentError("в документе нет текста (возможно, это скан)")
+    return document
+
+
+class DocumentStore:
+    """Документы пользователей: общий кэш индексов и поиск фрагментов под вопрос"""
+
+    def __init__(self, chunk_tokens: int = 400, top_k: int = 5, context_tokens: int = 2500,
+                 per_user: int = 3, cache_size: int = 20, embedding_model: Optional[str] = None):
+        self.chunk_tokens = chunk_tokens
+        self.top_k = top_k
+        self.context_tokens = context_tokens
+        self.per_user = max(per_user, 1)
+        self.cache_size = max(cache_size, 1)
+        self.embedding_model = embedding_model if embedding_model and NUMPY_AVAILABLE and openai_client else None
+        # file_unique_id -> документ
+        self._cache: "OrderedDict[str, IndexedDocument]" = OrderedDict()
+        # user_id -> file_unique_id документов (последний - в конце)
+        self._user_documents: Dict[str, List[str]] = {}
+        self._building: Dict[str, asyncio.Task] = {}
+
+        # Статистика
+        self.indexed = 0
+        self.cache_hits = 0
+        self.questions = 0
+
+    async def add(self, user_id: str, file_unique_id: str, name: str, data: bytes) -> IndexedDocument:
+        """
+        Подключает документ к пользователю (индекс из кэша или построенный заново)
+
+        Raises:
+            DocumentError: если документ не удалось прочитать
+        """
+        document = self._cache.get(file_unique_id)
+        if document is not None:
+            self.cache_hits += 1
+            self._cache.move_to_end(file_unique_id)
+        else:
+            # Одновременная загрузка того же файла ждет одну индексацию
+            task = self._building.get(file_unique_id)
+            if task is None:
+                task = asyncio.create_task(self._build(name, data))
+                self._building[file_unique_id] = task
+                task.add_done_callback(lambda _: self._building.pop(file_unique_id, None))
+            document = await asyncio.shield(task)
+            self._cache[file_unique_id] = document
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        documents = [key for key in self._user_documents.get(user_id, []) if key != file_unique_id]
+        documents.append(file_unique_id)
+        self._user_documents[user_id] = documents[-self.per_user:]
+        return document
+
+    async def _build(self, name: str, data: bytes) -> IndexedDocument:
+        document = await asyncio.to_thread(build_document, name, data, self.chunk_tokens)
+        self.indexed += 1
+        logger.info(f"Документ «{name}»: {len(document.chunks)} фрагментов, ~{document.tokens} токенов")
+        if self.embedding_model:
+            try:
+                document.embeddings = await self._embed(document.chunks)
+            except Exception as e:
+                logger.warning(f"Эмбеддинги документа не построены, только BM25: {e}")
+        return document
+
+    async def _embed(self, texts: List[str]) -> "np.ndarray":
+        """Нормированные эмбеддинги текстов"""
+        vectors = []
+        for start in range(0, len(texts), EMBEDDING_BATCH):
+            response = await openai_client.embeddings.create(
+                model=self.embedding_model, input=texts[start:start + EMBEDDING_BATCH]
+            )
+            vectors.extend(item.embedding for item in response.data)
+        matrix = np.asarray(vectors, dtype=np.float32)
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-8)
+
+    def documents(self, user_id: str) -> List[IndexedDocument]:
+        """Документы пользователя, еще остающиеся в кэше"""
+        return [self._cache[key] for key in self._user_documents.get(user_id, []) if key in self._cache]
+
+    def clear(self, user_id: str):
+        """Отключает документы пользователя (индексы остаются в общем кэше)"""
+        self._user_documents.pop(user_id, None)
+
+    async def _embed_question(self, question: str) -> Optional["np.ndarray"]:
+        """Эмбеддинг вопроса или None, если API недоступен"""
+        try:
+            return (await self._embed([question]))[0]
+        except Exception as e:
+            logger.warning(f"Векторный поиск недоступен: {e}")
+            return None
+
+    def _rank(self, document: IndexedDocument, bm25: List[Tuple[int, float]],
+              query: Optional["np.ndarray"]) -> List[Tuple[int, float]]:
+        """Фрагменты документа по релевантности: BM25, а с эмбеддингами - слияние рангов"""
+        if document.embeddings is None or query is None:
+            return bm25
+        similarity = document.embeddings @ query
+        vector = np.argsort(-similarity)[:self.top_k * 4]
+        fused: Dict[int, float] = {}
+        for ranking in ([chunk for chunk, _ in bm25], [int(chunk) for chunk in vector]):
+            for rank, chunk in enumerate(ranking):
+                fused[chunk] = fused.get(chunk, 0.0) + 1.0 / (RRF_K + rank)
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+    async def context(self, user_id: str, question: str) -> str:
+        """Фрагменты документов пользователя для вопроса (в пределах бюджета токенов) или пустая строка"""
+        documents = self.documents(user_id)
+        if not documents:
+            return ""
+
+        # Документы без общих слов с вопросом в поиск не попадают
+        matched = [(document, document.index.search(question, self.top_k * 4)) for document in documents]
+        matched = [(document, bm25) for document, bm25 in matched if bm25]
+
+        candidates = []
+        if matched:
+            # Вопрос встраивается один раз на все документы
+            query = None
+            if any(document.embeddings is not None for document, _ in matched):
+                query = await self._embed_question(question)
+            for document, bm25 in matched:
+                ranked = self._rank(document, bm25, query)
+                # Оценки разных документов несравнимы - нормируем на лучшую в документе
+                best = ranked[0][1] or 1.0
+                candidates.extend((score / best, document, chunk) for chunk, score in ranked[:self.top_k])
+        elif OVERVIEW_PATTERN.search(question):
+            # «О чем документ?» - начало последнего документа
+            document = documents[-1]
+            candidates = [(1.0, document, chunk) for chunk in range(min(self.top_k, len(document.chunks)))]
+        else:
+            # Сообщение не о документах - фрагменты не добавляются
+            return ""
+        self.questions += 1
+
+        selected = []
+        budget = self.context_tokens
+        for _, document, chunk in sorted(candidates, key=lambda item: item[0], reverse=True)[:self.top_k]:
+            tokens = count_tokens(document.chunks[chunk])
+            if tokens > budget:
+                continue
+            budget -= tokens
+            selected.append((document, chunk))
+        # В промпте - в порядке документа, чтобы связный текст читался подряд
+        selected.sort(key=lambda item: (documents.index(item[0]), item[1]))
+        return "\n\n".join(f"[{self._source(document, chunk)}]\n{document.chunks[chunk]}" for document, chunk in selected)
+
+    @staticmethod
+    def _source(document: IndexedDocument, chunk: int) -> str:
+        """Подпись фрагмента: имя документа и страница (если страниц несколько)"""
+        if document.pages[-1] > 1:
+            return f"{document.name}, стр. {document.pages[chunk]}"
+        return document.name
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Проиндексировано документов, из кэша и вопросов по документам"""
+        return {
+            'indexed': self.indexed,
+            'cache_hits': self.cache_hits,
+            'questions': self.questions,
+            'cached_documents': len(self._cache),
+            'vectors': bool(self.embedding_model),
+        }
+
+
+# Общее хранилище документов модуля
+document_store = DocumentStore(
+    chunk_tokens=MODULE_CONFIG['document_chunk_tokens'],
+    top_k=MODULE_CONFIG['document_top_k'],
+    context_tokens=MODULE_CONFIG['document_context_tokens'],
+    per_user=MODULE_CONFIG['documents_per_user'],
+    cache_size=MODULE_CONFIG['document_cache_size'],
+    embedding_model=MODULE_CONFIG['document_embedding_model'] or None
+)
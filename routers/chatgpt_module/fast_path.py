@@ -0,0 +1,156 @@
+"""
+Быстрые ответы на служебные сообщения без запроса к ChatGPT
+
+Заметная часть сообщений в режиме ChatGPT - «привет», «спасибо», «ок». На них
+не нужен ни запрос к модели (для reasoning-модели - несколько секунд), ни поиск
+по памяти: намерение определяется локально, а ответ берется из шаблона.
+
+Классификатор двухступенчатый:
+1. Общее скомпилированное регулярное выражение по всем включенным намерениям
+   (сообщение целиком должно состоять из фраз одного намерения).
+2. Для однословных сообщений с опечатками («спасиб», «привед») - сходство по
+   символьным триграммам с эталонными словами.
+
+Сообщение с вопросом или просьбой («спасибо, а как...», «привет?») под шаблон
+не попадает и уходит в ChatGPT как обычно.
+"""
+import random
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from .config import MODULE_CONFIG
+
+# Намерение: фразы (регулярные выражения по нормализованному тексту) и ответы
+INTENTS: Dict[str, Dict[str, List[str]]] = {
+    'greeting': {
+        'phrases': [
+            r"привет(ик|ствую)?", r"здравствуй(те)?", r"здрасьте", r"добр(ый|ого) (день|вечер|дня|вечера)",
+            r"доброе утро", r"доброго утра", r"хай", r"салют", r"хеллоу?", r"hi", r"hello", r"hey", r"йо",
+        ],
+        'answers': [
+            "👋 Привет! Чем могу помочь?",
+            "👋 Здравствуйте! Спрашивайте - текстом, голосом или картинкой.",
+        ],
+    },
+    'thanks': {
+        'phrases': [
+            r"спасибо( (большое|огромное|тебе|вам))?", r"спс", r"пасиб[оа]?", r"благодарю", r"мерси",
+            r"thanks?( you)?", r"thx", r"ty",
+        ],
+        'answers': [
+            "😊 Пожалуйста! Обращайтесь.",
+            "Рад помочь! 🙌",
+        ],
+    },
+    'ack': {
+        'phrases': [
+            r"ок(ей|и)?", r"ok(ay)?", r"понятно", r"понял[аи]?", r"ясно", r"хорошо", r"ладно", r"угу", r"ага",
+            r"принято", r"отлично", r"супер", r"класс", r"круто", r"норм", r"good", r"cool", r"got it",
+        ],
+        'answers': [
+            "👍",
+            "👍 Если появятся вопросы - пишите.",
+        ],
+    },
+    'goodbye': {
+        'phrases': [
+            r"пока", r"до свидания", r"до встречи", r"до завтра", r"спокойной ночи", r"bye", r"goodbye",
+        ],
+        'answers': [
+            "👋 До встречи!",
+        ],
+    },
+}
+
+# Эталонные слова для сравнения по триграммам (однословные сообщения с опечатками)
+PROTOTYPES: Dict[str, List[str]] = {
+    'greeting': ["привет", "здравствуйте"],
+    'thanks': ["спасибо", "благодарю"],
+    'ack': ["окей", "понятно", "хорошо", "отлично"],
+    'goodbye': ["досвидания"],
+}
+
+# Повтор буквы 3+ раз («привееет») сводится к одной
+REPEATS = re.compile(r"(\w)\1{2,}")
+NON_WORD = re.compile(r"[^\w\s]|_")
+SPACES = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр, ё = е, без пунктуации и эмодзи, без растянутых букв"""
+    text = NON_WORD.sub(" ", text.lower().replace("ё", "е"))
+    return SPACES.sub(" ", REPEATS.sub(r"\1", text)).strip()
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Символьные триграммы текста с границами слов"""
+    padded = f" {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class FastPath:
+    """Классификатор служебных сообщений и шаблонные ответы на них"""
+
+    def __init__(self, intents: Iterable[str], max_chars: int = 40, similarity: float = 0.6):
+        self.intents = [intent for intent in intents if intent in INTENTS]
+        self.max_chars = max_chars
+        self.similarity = similarity
+        # Одно выражение на все намерения: намерение - имя сработавшей группы
+        alternatives = []
+        for intent in self.intents:
+            phrase = "|".join(INTENTS[intent]['phrases'])
+            alternatives.append(rf"(?P<{intent}>(?:{phrase})(?: (?:{phrase}))*)")
+        self._pattern = re.compile(rf"^(?:{'|'.join(alternatives)})$") if alternatives else None
+        self._prototypes: List[Tuple[str, FrozenSet[str]]] = [
+            (intent, trigrams(phrase)) for intent in self.intents for phrase in PROTOTYPES.get(intent, [])
+        ]
+
+        # Статистика: сколько запросов к ChatGPT не понадобилось
+        self.avoided: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._pattern is not None
+
+    def classify(self, text: str) -> Optional[str]:
+        """Намерение служебного сообщения или None (сообщение для ChatGPT)"""
+        if not self.enabled or len(text) > self.max_chars:
+            return None
+        # Вопросительный знак пропадает при нормализации - проверяем исходный текст («ок?», «привет?!»)
+        if "?" in text:
+            return None
+        normalized = normalize(text)
+        if not normalized:
+            return None
+        match = self._pattern.match(normalized)
+        if match:
+            return match.lastgroup
+        # Опечатки: только одно слово, иначе похожим легко оказаться вопросу («привет как дела»)
+        if " " in normalized:
+            return None
+        grams = trigrams(normalized)
+        best_intent, best_score = None, 0.0
+        for intent, prototype in self._prototypes:
+            score = len(grams & prototype) / len(grams | prototype)
+            if score > best_score:
+                best_intent, best_score = intent, score
+        return best_intent if best_score >= self.similarity else None
+
+    def answer(self, text: str) -> Optional[str]:
+        """Шаблонный ответ на служебное сообщение или None"""
+        intent = self.classify(text)
+        if intent is None:
+            return None
+        self.avoided[intent] = self.avoided.get(intent, 0) + 1
+        return random.choice(INTENTS[intent]['answers'])
+
+    def get_stats(self) -> Dict[str, int]:
+        """Сколько запросов к ChatGPT не понадобилось, по намерениям"""
+        return dict(self.avoided)
+
+
+# Общий классификатор модуля
+fast_path = FastPath(
+    intents=MODULE_CONFIG['fast_path_intents'] if MODULE_CONFIG['fast_path_enabled'] else [],
+    max_chars=MODULE_CONFIG['fast_path_max_chars']
+)
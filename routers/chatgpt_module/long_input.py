@@ -0,0 +1,262 @@
+"""
+Длинные тексты (расшифровки длинных записей) по схеме map-reduce
+
+Расшифровка больше порога не отправляется в ChatGPT целиком: она делится на
+части по границам предложений, части конспектируются параллельно (map), а
+ответ строится по конспектам (reduce). Если конспекты сами не помещаются в
+один запрос, они сворачиваются повторно.
+
+Конспект части не зависит от вопроса и кэшируется по содержимому части
+(пустые ответы не кэшируются), поэтому повторная обработка той же записи
+использует готовые конспекты. Конспект записи добавляется к следующему
+текстовому сообщению, а к более поздним - только если у них есть общие слова
+с конспектом (оценка BM25 по его частям).
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from utils.deadline import Deadline
+from .completions import request_completion
+from .config import MODULE_CONFIG
+from .retrieval import BM25Index
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+    TIKTOKEN_AVAILABLE = True
+except Exception:
+    _encoding = None
+    TIKTOKEN_AVAILABLE = False
+
+# Без tiktoken: в среднем ~3 символа на токен для русского текста
+CHARS_PER_TOKEN = 3
+
+# Прогресс конспектирования: (готово частей, всего частей)
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+MAP_PROMPT = (
+    "Ниже - часть {index} из {total} расшифровки длинной голосовой записи. "
+    "Составьте подробный конспект этой части: факты, числа, имена, договоренности, "
+    "вопросы и просьбы говорящего. Не добавляйте ничего от себя.\n\n{text}"
+)
+COMBINE_PROMPT = (
+    "Ниже - конспекты соседних частей длинной записи. Объедините их в один "
+    "конспект без потери фактов, вопросов и просьб.\n\n{text}"
+)
+REDUCE_PROMPT = (
+    "Пользователь прислал длинную голосовую запись. Она слишком длинная, поэтому "
+    "ниже - конспект ее частей по порядку. Ответьте на запись так, как ответили бы "
+    "на полный текст: если в ней есть вопросы или просьбы - выполните их, иначе "
+    "кратко изложите главное.\n\n{text}"
+)
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов (tiktoken, а без него - оценка по длине)"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """Делит текст на части не больше max_tokens по границам предложений"""
+    chunks = []
+    current: List[str] = []
+    current_tokens = 0
+    for sentence in SENTENCE_END.split(text.strip()):
+        tokens = count_tokens(sentence)
+        # Предложение длиннее части (расшифровка без знаков препинания) - режем по словам
+        if tokens > max_tokens:
+            words = sentence.split()
+            step = max(len(words) * max_tokens // tokens, 1)
+            pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            pieces = [sentence]
+        for piece in pieces:
+            piece_tokens = count_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+class LongInputProcessor:
+    """Map-reduce для длинных текстов с кэшем конспектов частей"""
+
+    def __init__(self, threshold_tokens: int = 3000, chunk_tokens: int = 1500, max_parallel: int = 4,
+                 map_model: Optional[str] = None, map_max_tokens: int = 600,
+                 cache_entries: int = 256, followup_ttl_sec: float = 3600):
+        self.threshold_tokens = threshold_tokens
+        self.chunk_tokens = chunk_tokens
+        self.max_parallel = max(max_parallel, 1)
+        self.map_model = map_model
+        self.map_max_tokens = map_max_tokens
+        self.cache_entries = cache_entries
+        self.followup_ttl_sec = followup_ttl_sec
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        # user_id -> (конспект последней длинной записи, индекс его частей, время)
+        self._recent: Dict[str, Tuple[str, BM25Index, float]] = {}
+        # Пользователи, чье следующее сообщение получит конспект без проверки слов
+        self._followup: Set[str] = set()
+
+        # Статистика
+        self.documents = 0
+        self.chunks = 0
+        self.cache_hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_tokens > 0
+
+    def is_long(self, text: str) -> bool:
+        """Текст нужно обрабатывать по частям"""
+        return self.enabled and count_tokens(text) > self.threshold_tokens
+
+    def _cache_key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self.map_model}|{prompt}".encode()).hexdigest()
+
+    async def _complete(self, prompt: str, deadline: Optional[Deadline]) -> str:
+        """
+        Один запрос map-этапа (из кэша, если такой уже был)
+
+        Таймаут - остаток бюджета на момент запроса, а не общий на все части.
+
+        Raises:
+            DeadlineExceeded: если бюджет времени исчерпан
+        """
+        key = self._cache_key(prompt)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            return cached
+
+        timeout = deadline.timeout(cap=MODULE_CONFIG['timeout'], stage="конспект") if deadline else None
+        result = await request_completion(
+            [{"role": "user", "content": prompt}],
+            model=self.map_model,
+            max_tokens=self.map_max_tokens,
+            timeout=timeout
+        ) or ""
+        # Пустой конспект (сбой, отказ модели) не кэшируем - в следующий раз запросим заново
+        if result and self.cache_entries > 0:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    async def _map(self, prompts: List[str], deadline: Optional[Deadline],
+                   on_progress: Optional[ProgressCallback]) -> List[str]:
+        """
+        Параллельные запросы (не больше max_parallel одновременно) с сохранением порядка
+
+        Первая ошибка (в том числе исчерпанный бюджет) отменяет остальные запросы.
+        """
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        done = 0
+
+        async def run(prompt: str) -> str:
+            nonlocal done
+            async with semaphore:
+                result = await self._complete(prompt, deadline)
+            done += 1
+            if on_progress:
+                await on_progress(done, len(prompts))
+            return result
+
+        tasks = [asyncio.ensure_future(run(prompt)) for prompt in prompts]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def summarize(self, text: str, deadline: Optional[Deadline] = None,
+                        on_progress: Optional[ProgressCallback] = None) -> str:
+        """
+        Конспект длинного текста: конспекты частей, при необходимости свернутые повторно
+
+        Raises:
+            DeadlineExceeded: если бюджет времени кончился до конца конспектирования
+        """
+        chunks = split_into_chunks(text, self.chunk_tokens)
+        self.documents += 1
+        self.chunks += len(chunks)
+        logger.info(f"Длинный текст ({count_tokens(text)} токенов): {len(chunks)} частей")
+
+        notes = await self._map(
+            [MAP_PROMPT.format(index=index, total=len(chunks), text=chunk) for index, chunk in enumerate(chunks, 1)],
+            deadline, on_progress
+        )
+        # Конспекты не помещаются в один запрос - сворачиваем соседние группами
+        while len(notes) > 1 and count_tokens("\n\n".join(notes)) > self.threshold_tokens:
+            groups = split_into_chunks("\n\n".join(notes), self.chunk_tokens)
+            if len(groups) >= len(notes):
+                break
+            notes = await self._map([COMBINE_PROMPT.format(text=group) for group in groups], deadline, None)
+        return "\n\n".join(f"Часть {index}: {note}" for index, note in enumerate(notes, 1))
+
+    def reduce_prompt(self, summary: str) -> str:
+        """Запрос reduce-этапа: ответ на запись по конспекту"""
+        return REDUCE_PROMPT.format(text=summary)
+
+    def remember(self, user_id: str, summary: str):
+        """Конспект последней длинной записи - для вопросов о ней следующими сообщениями"""
+        index = BM25Index()
+        for number, part in enumerate(summary.split("\n\n")):
+            index.add(number, part)
+        self._recent[user_id] = (summary, index, time.monotonic())
+        self._followup.add(user_id)
+
+    def recent_summary(self, user_id: str, question: str) -> Optional[str]:
+        """
+        Конспект недавней длинной записи пользователя, если вопрос может быть о ней
+
+        Следующее после записи сообщение получает конспект всегда («а что там
+        про сроки?»), более поздние - только при общих словах с конспектом.
+        """
+        recent = self._recent.get(user_id)
+        if recent is None:
+            return None
+        summary, index, remembered = recent
+        if time.monotonic() - remembered > self.followup_ttl_sec:
+            del self._recent[user_id]
+            self._followup.discard(user_id)
+            return None
+        if user_id in self._followup:
+            self._followup.discard(user_id)
+            return summary
+        return summary if index.scores(question) else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Обработано длинных текстов, частей и конспектов из кэша"""
+        return {
+            'documents': self.documents,
+            'chunks': self.chunks,
+            'cache_hits': self.cache_hits,
+        }
+
+
+# Общий обработчик длинных текстов модуля
+long_input_processor = LongInputProcessor(
+    threshold_tokens=MODULE_CONFIG['long_input_threshold_tokens'],
+    chunk_tokens=MODULE_CONFIG['long_input_chunk_tokens'],
+    max_parallel=MODULE_CONFIG['long_input_max_parallel'],
+    map_model=MODULE_CONFIG['long_input_map_model'] or MODULE_CONFIG['fast_model'] or None,
+    map_max_tokens=MODULE_CONFIG['long_input_map_max_tokens'],
+    followup_ttl_sec=MODULE_CONFIG['long_input_followup_min'] * 60
+)
@@ -13,6 +13,8 @@ except ImportError:
     MemoryClient = None
     
 from .config import MODULE_CONFIG
+from .long_input import count_tokens
+from .retrieval import BM25Index
 
 class Mem0MemoryService:
     """Сервис памяти на базе Mem0"""
@@ -182,39 +184,93 @@ class HybridMemoryService:
     
     def __init__(self):
         self.mem0_service = Mem0MemoryService()
-        # Сессионная память (в RAM, очищается при перезапуске)
-        self.session_memory = defaultdict(lambda: deque(maxlen=10))  # Последние 10 пар диалогов
+        # Сессионная память (в RAM, очищается при перезапуске): последние пары диалогов
+        history_size = max(MODULE_CONFIG['session_history_size'], 1)
+        self.session_memory = defaultdict(lambda: deque(maxlen=history_size * 2))
+        # Индекс BM25 по парам диалогов пользователя (номер пары -> вопрос и ответ)
+        self.session_index: Dict[str, BM25Index] = {}
+        self.session_turn_count = defaultdict(int)
     
     # === СЕССИОННАЯ ПАМЯТЬ (RAM) ===
     
-    def get_session_context(self, user_id: str, current_message: str = "") -> str:
-        """Получает контекст из сессионной памяти"""
+    def _select_session_entries(self, user_id: str, current_message: str) -> List[str]:
+        """
+        Записи сессии для контекста в пределах бюджета токенов
+        
+        Последние пары диалогов берутся всегда (беседа продолжается), остальные -
+        по релевантности текущему сообщению. Порядок записей - хронологический.
+        """
         history = list(self.session_memory.get(user_id, []))
-        if not history:
-            return ""
+        pairs = [history[i:i + 2] for i in range(0, len(history) - 1, 2)]
+        if not pairs:
+            return []
+        first_turn = self.session_turn_count[user_id] - len(pairs)
+        budget = MODULE_CONFIG['session_context_tokens']
+        selected = set()
         
-        # Берем последние 6 записей (3 пары диалогов)
-        recent_history = history[-6:]
-        context_lines = []
+        def take(position: int) -> bool:
+            nonlocal budget
+            tokens = sum(count_tokens(entry) for entry in pairs[position])
+            # Последняя пара нужна всегда, даже если сама больше бюджета
+            if selected and tokens > budget:
+                return False
+            budget -= tokens
+            selected.add(position)
+            return True
         
-        for entry in recent_history:
-            context_lines.append(entry)
+        recent = max(MODULE_CONFIG['session_recent_turns'], 1)
+        for position in range(len(pairs) - 1, max(len(pairs) - recent, 0) - 1, -1):
+            if not take(position):
+                break
+        
+        index = self.session_index.get(user_id)
+        if index is not None and current_message:
+            for turn, _ in index.search(current_message):
+                position = turn - first_turn
+                if 0 <= position < len(pairs) and position not in selected:
+                    take(position)
+        
+        return [entry for position in sorted(selected) for entry in pairs[position]]
+    
+    def get_session_context(self, user_id: str, current_message: str = "") -> str:
+        """Получает контекст из сессионной памяти (недавние и относящиеся к сообщению диалоги)"""
+        context_lines = self._select_session_entries(user_id, current_message)
         
         if context_lines:
             return "Контекст текущей беседы:\n" + "\n".join(context_lines)
         
         return ""
-    
+
+    def get_session_turns(self, user_id: str, current_message: str = "") -> List[Dict[str, str]]:
+        """Возвращает отобранные реплики сессии как сообщения с ролями user/assistant"""
+        turns = []
+        for entry in self._select_session_entries(user_id, current_message):
+            if entry.startswith("👤: "):
+                turns.append({"role": "user", "content": entry[len("👤: "):]})
+            elif entry.startswith("🤖: "):
+                turns.append({"role": "assistant", "content": entry[len("🤖: "):]})
+
+        return turns
+
     def save_to_session_memory(self, user_id: str, user_message: str, ai_response: str):
-        """Сохраняет диалог в сессионную память"""
-        self.session_memory[user_id].append(f"👤: {user_message}")
-        self.session_memory[user_id].append(f"🤖: {ai_response}")
+        """Сохраняет диалог в сессионную память и индекс (за время, пропорциональное длине диалога)"""
+        history = self.session_memory[user_id]
+        index = self.session_index.setdefault(user_id, BM25Index())
+        turn = self.session_turn_count[user_id]
+        # Самая старая пара вытесняется из истории - убираем ее и из индекса
+        if len(history) == history.maxlen:
+            index.remove(turn - history.maxlen // 2)
+        history.append(f"👤: {user_message}")
+        history.append(f"🤖: {ai_response}")
+        index.add(turn, f"{user_message}\n{ai_response}")
+        self.session_turn_count[user_id] = turn + 1
     
     def clear_session_memory(self, user_id: str) -> bool:
         """Очищает сессионную память пользователя"""
         try:
             if user_id in self.session_memory:
                 self.session_memory[user_id].clear()
+            self.session_index.pop(user_id, None)
             return True
         except Exception:
             return False
@@ -225,7 +281,7 @@ class HybridMemoryService:
         return {
             'messages_count': len(history) // 2,  # Пары диалогов
             'total_entries': len(history),
-            'max_capacity': getattr(history, 'maxlen', 10) or 10
+            'max_capacity': max(MODULE_CONFIG['session_history_size'], 1)
         }
     
     # === ГИБРИДНЫЕ МЕТОДЫ ===
@@ -282,7 +338,46 @@ class HybridMemoryService:
                 context_source = "сессионной"
                 
             return session_context, context_count, context_source
-    
+
+    async def get_prompt_context(self, user_id: str, query: str) -> Dict[str, Any]:
+        """
+        Получает контекст из обеих систем памяти по частям для построения промпта
+
+        В отличие от get_full_context не склеивает всё в одну строку:
+        профиль, воспоминания и реплики сессии раскладываются по разным
+        сообщениям, чтобы префикс промпта оставался стабильным.
+
+        Returns:
+            dict: profile, memories, turns, count, source
+        """
+        profile = ""
+        memories = ""
+        turns = self.get_session_turns(user_id, query)
+        context_count = 0
+        context_source = ""
+
+        if MODULE_CONFIG.get('mem0_enabled', False):
+            # ГИБРИДНЫЙ РЕЖИМ: Mem0 + RAM
+            memories = await self.mem0_service.search_relevant_memories(user_id, query, limit=3)
+            profile = await self.mem0_service.get_user_profile(user_id)
+
+            if profile or memories or turns:
+                mem0_count = len(memories.split('\n')) - 1 if memories else 0
+                context_count = mem0_count + len(turns) // 2
+                context_source = "гибридной"
+        elif turns:
+            # СЕССИОННАЯ ПАМЯТЬ: только RAM (отобранные пары диалогов)
+            context_count = len(turns) // 2
+            context_source = "сессионной"
+
+        return {
+            'profile': profile,
+            'memories': memories,
+            'turns': turns,
+            'count': context_count,
+            'source': context_source,
+        }
+
     async def save_conversation(self, user_id: str, user_message: str, ai_response: str):
         """Сохраняет диалог в соответствующие системы памяти"""
         
@@ -3,21 +3,33 @@
 """
 
 MESSAGES = {
-    "activation": "🤖 Модуль ChatGPT + Vision + Whisper + Гибридная память активирован!\n\n📝 **Поддерживаемые форматы:**\n• Текстовые сообщения\n• 🖼️ Изображения (с подписью или без)\n• 🎤 Голосовые сообщения\n• ⭕ Кружочки (видео заметки)\n• 🎵 Аудио файлы\n\n💡 **Примеры:**\n• Напишите текст: \"Расскажи анекдот\"\n• Отправьте фото: \"Что на этом изображении?\"\n• Отправьте голосовое: \"Переведи на английский\"\n• Загрузите аудио файл с вопросом\n\n🧠 AI поймет и ответит на любом языке!\n\n🔥 **Гибридная память:** Максимальный контекст из долговременной (Mem0) и сессионной (RAM) памяти для лучшего понимания.",
+    "activation": "🤖 Модуль ChatGPT + Vision + Whisper + Гибридная память активирован!\n\n📝 **Поддерживаемые форматы:**\n• Текстовые сообщения\n• 🖼️ Изображения (с подписью или без)\n• 🎤 Голосовые сообщения\n• ⭕ Кружочки (видео заметки)\n• 🎵 Аудио файлы\n• 📎 Документы TXT, MD, PDF\n\n💡 **Примеры:**\n• Напишите текст: \"Расскажи анекдот\"\n• Отправьте фото: \"Что на этом изображении?\"\n• Отправьте голосовое: \"Переведи на английский\"\n• Загрузите аудио файл с вопросом\n• Загрузите документ и спросите по нему\n\n🧠 AI поймет и ответит на любом языке!\n\n🔥 **Гибридная память:** Максимальный контекст из долговременной (Mem0) и сессионной (RAM) памяти для лучшего понимания.",
     
     "not_configured": "❌ ChatGPT модуль не настроен!\n\n📋 **Для настройки:**\n1. Скопируйте файл `env.example` в `.env`\n2. Получите API ключ на https://platform.openai.com/api-keys\n3. Добавьте ключ в файл `.env`\n4. Выберите модель ChatGPT и режим Whisper\n5. Перезапустите бота\n\n🤖 **Модели ChatGPT:**\n• `gpt-3.5-turbo` - быстро, дешево\n• `gpt-4` - умнее, дороже\n• `o1-mini` - reasoning, логика\n• `o1-preview` - максимальное качество\n\n💡 **Whisper режимы:**\n• `WHISPER_MODE=api` - быстро, точно, платно\n• `WHISPER_MODE=local` - медленно, бесплатно",
     
     "thinking": "🤔 Думаю...",
     
+    "cancelled": "⛔ **Запрос отменен**",
+    
     "processing_audio": "🎧 Обрабатываю аудио...\n\n⏳ Распознаю речь с помощью Whisper",
     
+    "transcribing_segments": "🎧 Длинная запись: распознано {done} из {total} сегментов...",
+    "audio_queued": "⏳ Аудио в очереди на распознавание: {position}-е, ожидание {wait}",
+    "transcribing_partial": "🎧 Распознаю...\n\n{text}",
+    "transcription_final": "✅ **Речь распознана** ({method})\n\n{text}",
+    "long_input_progress": "📚 Длинная запись: обработано {done} из {total} частей...",
+    "document_indexing": "📎 Читаю документ...",
+    "document_ready": "📎 **Документ «{name}» загружен** ({chunks} фрагм.)\n\nЗадавайте вопросы по нему - в ответ попадут подходящие фрагменты. Документ забывается при очистке памяти.",
+    "document_ready_short": "📎 Документ «{name}» загружен, отвечаю на вопрос...",
+    "document_error": "❌ **Не удалось прочитать документ:**\n{error}",
+    "document_too_large": "❌ **Документ слишком большой** (максимум {max_size} МБ)",
     "transcription_success": "✅ **Речь распознана!** ({method})\n\n📝 *Текст:* {text}\n\n🤖 Отправляю в ChatGPT...",
     
     "audio_error": "❌ **Ошибка обработки аудио:**\n{error}\n\n💡 **Возможные причины:**\n• Файл слишком большой или длинный\n• Плохое качество записи\n• Отсутствует речь в аудио\n• Проблемы с Whisper API/локальной моделью",
     
     "no_speech_detected": "🔇 **Речь не обнаружена**\n\nВ аудио не найдена человеческая речь.\n\n💡 **Попробуйте:**\n• Говорите четче и громче\n• Запишите в тихом месте\n• Проверьте, что микрофон работает",
     
-    "unsupported_format": "🤖 **Поддерживаемые форматы:**\n\n📝 Текстовые сообщения\n🖼️ Изображения (фото)\n🎤 Голосовые сообщения  \n⭕ Кружочки (видео заметки)\n🎵 Аудио файлы\n\n❌ **Не поддерживается:**\n🎬 Видео, стикеры, GIF\n📎 Документы, локации\n\nОтправьте текст, изображение или аудио для общения с ChatGPT!",
+    "unsupported_format": "🤖 **Поддерживаемые форматы:**\n\n📝 Текстовые сообщения\n🖼️ Изображения (фото)\n🎤 Голосовые сообщения  \n⭕ Кружочки (видео заметки)\n🎵 Аудио файлы\n📎 Документы TXT, MD, PDF\n\n❌ **Не поддерживается:**\n🎬 Видео, стикеры, GIF\n📎 Другие документы, локации\n\nОтправьте текст, изображение, аудио или документ для общения с ChatGPT!",
     
     "error_api": "❌ **Ошибка OpenAI API:**\n{error}\n\n🔍 **Проверьте:**\n• API ключ корректен\n• Есть средства на балансе OpenAI\n• Сервис доступен\n• Нет превышения лимитов\n• Модель поддерживает ваши параметры\n\n💡 **Для o1-моделей:** увеличьте max_tokens до 5000+",
     
@@ -25,7 +37,7 @@ MESSAGES = {
     
     "model_info": "🤖 **Текущая конфигурация:**\n\n**ChatGPT:**\n• Модель: {model}\n• Температура: {temperature} {temp_note}\n• Макс. токенов: {max_tokens} {token_note}\n\n**Whisper:**\n• Режим: {whisper_mode}\n• Язык: {whisper_language}\n\n**Аудио лимиты:**\n• Размер: до {max_size} МБ\n• Длительность: до {max_duration} мин",
     
-    "help": "🤖 **ChatGPT + Vision + Whisper модуль**\n\n**🎯 Возможности:**\n• Общение с ChatGPT текстом, изображениями и голосом\n• Анализ изображений через Vision API\n• Распознавание речи через Whisper\n• Поддержка множества языков\n• Настраиваемые параметры AI\n• Автоматический расчет затрат 💰\n\n**📱 Поддерживаемые форматы:**\n• 📝 Текст - прямое общение\n• 🖼️ Изображения - анализ через Vision API\n• 🎤 Голосовые - через Whisper\n• ⭕ Кружочки - извлечение аудио\n• 🎵 Аудио файлы - полная обработка\n\n**🤖 Модели с Vision API:**\n• gpt-4o, gpt-4o-mini - современные, эффективные\n• gpt-4-vision-preview - специально для изображений\n• gpt-4-turbo - высокое качество\n\n**⚙️ Режимы Whisper:**\n• API - быстро и точно (платно)\n• Локальный - медленно (бесплатно)\n\n**💰 Управление затратами:**\n• Автосжатие больших изображений\n• Выбор качества обработки (low/high)\n• Предупреждения о стоимости\n• Точный расчет токенов\n\n**🔧 Команды:**\n• Любой текст/изображение/аудио → ответ ChatGPT\n• /chatgpt_info → информация о настройках",
+    "help": "🤖 **ChatGPT + Vision + Whisper модуль**\n\n**🎯 Возможности:**\n• Общение с ChatGPT текстом, изображениями и голосом\n• Анализ изображений через Vision API\n• Распознавание речи через Whisper\n• Поддержка множества языков\n• Настраиваемые параметры AI\n• Автоматический расчет затрат 💰\n\n**📱 Поддерживаемые форматы:**\n• 📝 Текст - прямое общение\n• 🖼️ Изображения - анализ через Vision API\n• 🎤 Голосовые - через Whisper\n• ⭕ Кружочки - извлечение аудио\n• 🎵 Аудио файлы - полная обработка\n• 📎 Документы TXT, MD, PDF - вопросы по тексту\n\n**🤖 Модели с Vision API:**\n• gpt-4o, gpt-4o-mini - современные, эффективные\n• gpt-4-vision-preview - специально для изображений\n• gpt-4-turbo - высокое качество\n\n**⚙️ Режимы Whisper:**\n• API - быстро и точно (платно)\n• Локальный - медленно (бесплатно)\n\n**💰 Управление затратами:**\n• Автосжатие больших изображений\n• Выбор качества обработки (low/high)\n• Предупреждения о стоимости\n• Точный расчет токенов\n\n**🔧 Команды:**\n• Любой текст/изображение/аудио → ответ ChatGPT\n• /chatgpt_info → информация о настройках",
     
     "welcome_back": "🏠 Возвращаюсь в главное меню.",
     
@@ -0,0 +1,96 @@
+"""
+Построение промптов для ChatGPT с учетом кеширования на стороне провайдера
+
+OpenAI кеширует самый длинный совпадающий префикс промпта, поэтому сообщения
+раскладываются от самых стабильных к самым изменчивым:
+1. system промпт + профиль пользователя (почти не меняются)
+2. долговременная память (меняется медленно)
+3. последние реплики беседы отдельными user/assistant сообщениями
+4. новый вопрос пользователя (всегда последним)
+"""
+from typing import Any, Dict, List, Optional
+
+DEFAULT_SYSTEM_PROMPT = "Вы полезный AI ассистент. Отвечайте на русском языке, будьте дружелюбны и информативны."
+
+
+def build_chat_messages(
+    question: str,
+    system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+    user_profile: str = "",
+    memory_context: str = "",
+    history: Optional[List[Dict[str, str]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Собирает список сообщений для Chat Completions API
+
+    Args:
+        question: Новый вопрос пользователя
+        system_prompt: Базовая инструкция ассистенту
+        user_profile: Профиль пользователя из долговременной памяти
+        memory_context: Релевантные воспоминания (Mem0 и т.п.)
+        history: Последние реплики [{"role": "user/assistant", "content": "..."}]
+
+    Returns:
+        List[Dict]: Сообщения в порядке от стабильного префикса к вопросу
+    """
+    system_content = system_prompt
+    if user_profile:
+        system_content += f"\n\n{user_profile}"
+
+    messages: List[Dict[str, Any]] = [{"role": "system", "content": system_content}]
+
+    if memory_context:
+        messages.append({
+            "role": "system",
+            "content": f"Контекст из предыдущих диалогов:\n{memory_context}"
+        })
+
+    for turn in history or []:
+        if turn.get("role") in ("user", "assistant") and turn.get("content"):
+            messages.append({"role": turn["role"], "content": turn["content"]})
+
+    messages.append({"role": "user", "content": question})
+    return messages
+
+
+class PromptCacheStats:
+    """Статистика попаданий в кеш промптов OpenAI (usage.prompt_tokens_details.cached_tokens)"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, usage: Any) -> int:
+        """Учитывает usage из ответа API, возвращает количество закешированных токенов"""
+        if usage is None:
+            return 0
+
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        return cached_tokens
+
+    @property
+    def hit_rate(self) -> float:
+        """Доля входных токенов, обслуженных из кеша (0.0-1.0)"""
+        if not self.prompt_tokens:
+            return 0.0
+        return self.cached_tokens / self.prompt_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Возвращает сводку для отображения пользователю"""
+        return {
+            'requests': self.requests,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+            'hit_rate': round(self.hit_rate * 100, 1),
+        }
+
+
+# Глобальная статистика кеша промптов
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,104 @@
+"""
+Лексический поиск BM25 по фрагментам текста
+
+Легкий индекс без внешних зависимостей: фрагменты добавляются и удаляются по
+одному (за время, пропорциональное длине фрагмента), поиск проходит только по
+спискам фрагментов со словами запроса.
+
+Слова приводятся к нижнему регистру и обрезаются до первых символов - грубая,
+но быстрая замена стеммингу для русского языка («договор», «договора»,
+«договором» совпадают).
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# Параметры BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Сколько первых символов слова учитывается
+STEM_LENGTH = 6
+
+WORD_PATTERN = re.compile(r"\w+")
+
+STOP_WORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было вот от
+меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до вас нибудь опять уж
+вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя их чем была сам чтоб без
+будто чего раз тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь этом один
+почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при наконец два об другой хоть после
+над больше тот через эти нас про всего них какая много разве три эту моя впрочем хорошо свою этой перед
+иногда лучше чуть том нельзя такой им более всегда конечно всю между это
+the a an and or of to in on for is are was were be it this that with as at by from
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Слова текста для индекса: нижний регистр, ё = е, без стоп-слов, обрезанные до STEM_LENGTH"""
+    words = WORD_PATTERN.findall(text.lower().replace("ё", "е"))
+    return [word[:STEM_LENGTH] for word in words if word not in STOP_WORDS and (len(word) > 1 or word.isdigit())]
+
+
+class BM25Index:
+    """Инкрементальный индекс BM25: add/remove за O(длина фрагмента), поиск по спискам слов запроса"""
+
+    def __init__(self):
+        # слово -> {фрагмент: число вхождений}
+        self._postings: Dict[str, Dict[Hashable, int]] = {}
+        self._terms: Dict[Hashable, Counter] = {}
+        self._lengths: Dict[Hashable, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __contains__(self, doc_id: Hashable) -> bool:
+        return doc_id in self._lengths
+
+    def add(self, doc_id: Hashable, text: str):
+        """Добавляет фрагмент (повторное добавление заменяет его)"""
+        if doc_id in self._lengths:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        self._terms[doc_id] = terms
+        length = sum(terms.values())
+        self._lengths[doc_id] = length
+        self._total_length += length
+        for term, count in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = count
+
+    def remove(self, doc_id: Hashable):
+        """Удаляет фрагмент из индекса"""
+        terms = self._terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def scores(self, query: str) -> Dict[Hashable, float]:
+        """Оценки BM25 фрагментов, содержащих хотя бы одно слово запроса"""
+        count = len(self._lengths)
+        if not count:
+            return {}
+        avg_length = self._total_length / count or 1.0
+        result: Dict[Hashable, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_id] / avg_length)
+                result[doc_id] = result.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return result
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[Hashable, float]]:
+        """Фрагменты по убыванию релевантности: [(фрагмент, оценка)]"""
+        ranked = sorted(self.scores(query).items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit] if limit else ranked
@@ -3,6 +3,9 @@ ChatGPT + Whisper модуль для Telegram бота
 Интеграция с OpenAI API и поддержка аудио
 """
 import asyncio
+import html
+from pathlib import Path
+from typing import Optional
 from aiogram import Router, F, Bot
 from aiogram.types import CallbackQuery, Message
 from aiogram.filters import StateFilter
@@ -10,11 +13,29 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from .config import MODULE_CONFIG, OPENAI_API_KEY
+from .config import MODULE_CONFIG
 from .messages import MESSAGES
+from .completions import (
+    BACKEND_LOCAL, OPENAI_AVAILABLE, backend_stats, openai_breaker, openai_client, request_completion,
+    select_completion_profile
+)
+from .prompt_builder import DEFAULT_SYSTEM_PROMPT, build_chat_messages, prompt_cache_stats
 from .services import transcribe_voice_message, transcribe_video_note, transcribe_audio_file
 from .image_utils import create_image_processor
+from .documents import document_store, supported_extensions
+from .fast_path import fast_path
+from .long_input import long_input_processor
 from .memory_service import memory_service
+from media.cache import get_transcription_cache
+from media.metrics import audio_pipeline_stats
+from media.telegram_files import get_telegram_downloads, max_download_bytes, read_telegram_file
+from media.transcription import get_transcription_engine
+from utils.coalescer import MessageCoalescer
+from utils.deadline import Deadline
+from utils.fair_queue import format_wait
+from utils.progress import ProgressMessage
+from utils.tasks import task_registry, get_cancel_reason
+from keyboards.cancel import get_cancel_menu
 
 # Состояния модуля
 class ChatGPTStates(StatesGroup):
@@ -22,18 +43,23 @@ class ChatGPTStates(StatesGroup):
 
 chatgpt_router = Router()
 
-# Проверяем наличие OpenAI
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = bool(OPENAI_API_KEY)
-    if OPENAI_API_KEY:
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
-    else:
-        openai_client = None
-except ImportError:
-    OPENAI_AVAILABLE = False
-    openai_client = None
-    print("⚠️ OpenAI library not installed. Run: pip install openai")
+# Сколько последних символов промежуточной расшифровки помещается в статус
+PARTIAL_TEXT_LIMIT = 3500
+# Сколько символов длинной расшифровки показывается в ответе
+LONG_TRANSCRIPTION_PREVIEW = 1500
+
+# Склейка быстрых текстовых сообщений пользователя
+message_coalescer = MessageCoalescer(MODULE_CONFIG['coalesce_window_ms'])
+
+@chatgpt_router.startup()
+async def on_startup():
+    """Фоновая предзагрузка локального Whisper (бот начинает отвечать, не дожидаясь ее)"""
+    get_transcription_engine().start()
+
+@chatgpt_router.shutdown()
+async def on_shutdown():
+    """Остановка воркеров локального Whisper"""
+    await get_transcription_engine().close()
 
 # Инициализируем обработчик изображений
 try:
@@ -121,53 +147,66 @@ def get_back_menu():
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-def get_token_params(model: str, max_tokens: int) -> dict:
-    """
-    Возвращает правильные параметры токенов для разных моделей OpenAI
-    
-    Reasoning-модели (o1, o3, o4 серии) используют max_completion_tokens
-    Остальные модели используют max_tokens
-    """
-    # Reasoning-модели (o1, o3, o4 серии)
-    if any(model.startswith(prefix) for prefix in ['o1-', 'o3-', 'o4-']):
-        return {'max_completion_tokens': max_tokens}
-    # Все остальные модели (gpt-3.5-turbo, gpt-4, gpt-4o и т.д.)
-    else:
-        return {'max_tokens': max_tokens}
+def format_prompt_cache_info() -> str:
+    """Блок со статистикой кеша промптов для /chatgpt_info"""
+    cache_stats = prompt_cache_stats.get_stats()
+    info_text = f"\n\n**⚡ Кеш промптов OpenAI:**\n"
+    info_text += f"• Запросов: {cache_stats['requests']}\n"
+    info_text += f"• Из кеша: {cache_stats['cached_tokens']}/{cache_stats['prompt_tokens']} токенов ({cache_stats['hit_rate']}%)"
+    long_stats = long_input_processor.get_stats()
+    if long_stats['documents']:
+        info_text += (f"\n• Длинных записей по частям: {long_stats['documents']} "
+                      f"(частей {long_stats['chunks']}, конспектов из кэша {long_stats['cache_hits']})")
+    backends = backend_stats.get_stats()
+    if MODULE_CONFIG['local_llm_base_url']:
+        local_requests = backends['requests'].get(BACKEND_LOCAL, 0)
+        local_ms = backends['avg_ms'].get(BACKEND_LOCAL)
+        info_text += (f"\n• Локальная модель ({MODULE_CONFIG['local_llm_mode']}): запросов {local_requests}"
+                      f"{f', в среднем {local_ms} мс' if local_ms is not None else ''}, "
+                      f"переходов на запасной {backends['fallbacks']}")
+        if openai_breaker.is_open:
+            info_text += "\n• ⚠️ OpenAI недоступен - запросы идут на локальную модель"
+    document_stats = document_store.get_stats()
+    if document_stats['indexed'] or document_stats['cache_hits']:
+        search = "BM25 + векторы" if document_stats['vectors'] else "BM25"
+        info_text += (f"\n• Документов: {document_stats['indexed']} (+{document_stats['cache_hits']} из кэша), "
+                      f"вопросов по ним {document_stats['questions']}, поиск {search}")
+    return info_text
 
-def get_api_params(model: str, messages: list, temperature: float, max_tokens: int, timeout: int) -> dict:
-    """
-    Формирует параметры для вызова OpenAI API с учетом особенностей модели
-    
-    Reasoning-модели (o1, o3, o4 серии) не поддерживают system сообщения и параметр temperature
-    """
-    base_params = {
-        'model': model,
-        'timeout': timeout
-    }
-    
-    # Reasoning-модели имеют ограничения
-    if any(model.startswith(prefix) for prefix in ['o1-', 'o3-', 'o4-']):
-        # Убираем system сообщения для reasoning-моделей (они не поддерживаются)
-        user_messages = [msg for msg in messages if msg.get('role') != 'system']
-        if not user_messages:
-            # Если остались только system сообщения, берем последнее user сообщение
-            user_messages = [{'role': 'user', 'content': messages[-1]['content']}]
-        
-        base_params.update({
-            'messages': user_messages,
-            **get_token_params(model, max_tokens)
-            # temperature не поддерживается для reasoning-моделей
-        })
-    else:
-        # Стандартные модели поддерживают все параметры
-        base_params.update({
-            'messages': messages,
-            'temperature': temperature,
-            **get_token_params(model, max_tokens)
-        })
-    
-    return base_params
+def format_audio_pipeline_info() -> str:
+    """Блок со статистикой обработки аудио для /chatgpt_info"""
+    stats = audio_pipeline_stats.get_stats()
+    if not stats['files']:
+        return ""
+    stages = ", ".join(f"{name} {ms} мс" for name, ms in stats['avg_stage_ms'].items())
+    info_text = f"\n\n**🎧 Обработка аудио:**\n"
+    info_text += f"• Файлов: {stats['files']}, в среднем {stats['avg_total_ms']} мс ({stages})"
+    if stats['peak_rss_mb'] is not None:
+        info_text += f"\n• Пик памяти процесса: {stats['peak_rss_mb']} МБ"
+    engine_stats = get_transcription_engine().get_stats()
+    pool_stats = engine_stats['local_pool']
+    if pool_stats:
+        info_text += (f"\n• Локальный Whisper: воркеров {pool_stats['workers']}, в очереди {pool_stats['queue_depth']}, "
+                      f"средний пакет {pool_stats['avg_batch']}")
+    routing = engine_stats['routing']
+    if engine_stats['whisper_mode'] == "auto" and routing['decisions']:
+        routes = ", ".join(f"{route} {count}" for route, count in routing['decisions'].items())
+        info_text += f"\n• Способы распознавания: {routes}"
+    queue = engine_stats['queue']
+    if queue and queue['admitted']:
+        info_text += f"\n• Очередь распознавания: сейчас ждут {queue['waiting']}, среднее ожидание {queue['avg_wait_sec']} сек"
+    workspace = engine_stats['workspace']
+    if workspace['quota_waits']:
+        info_text += (f"\n• Рабочие папки: занято {workspace['used_mb']} из {workspace['quota_mb']} МБ, "
+                      f"ожиданий места {workspace['quota_waits']}")
+    downloads = get_telegram_downloads().get_stats()
+    cached_files = downloads['memory_hits'] + downloads['disk_hits'] + downloads['deduplicated']
+    if cached_files:
+        info_text += f"\n• Файлы Telegram: скачано {downloads['downloads']}, без повторного скачивания {cached_files}"
+    cache = get_transcription_cache().get_stats()
+    if cache['hits']:
+        info_text += f"\n• Из кэша распознавания: {cache['hits']} ({cache['hit_rate']}%)"
+    return info_text
 
 @chatgpt_router.callback_query(F.data == "chatgpt_mode")
 async def activate_chatgpt(callback: CallbackQuery, state: FSMContext):
@@ -195,244 +234,273 @@ async def activate_chatgpt(callback: CallbackQuery, state: FSMContext):
 @chatgpt_router.message(StateFilter(ChatGPTStates.waiting_for_message), F.text)
 async def handle_chatgpt_message(message: Message, state: FSMContext):
     """Обработка текстовых сообщений для ChatGPT"""
-    if not OPENAI_AVAILABLE or not openai_client or not message.text:
+    if not OPENAI_AVAILABLE or not message.text:
         return
     
     if not message.from_user:
         return
         
     user_id = str(message.from_user.id)
-    user_text = message.text
     
-    # Показываем что бот думает
-    thinking_msg = await message.reply(MESSAGES["thinking"])
+    # «Привет», «спасибо», «ок» - ответ по шаблону, без ChatGPT и поиска по памяти
+    fast_answer = fast_path.answer(message.text)
+    if fast_answer:
+        await message.reply(fast_answer, reply_markup=get_back_menu())
+        return
     
-    try:
-        # Получаем полный контекст из гибридной системы памяти
-        memory_context, context_count, context_source = await memory_service.get_full_context(user_id, user_text)
-        
-        # print(f"🔍 ОТЛАДКА - Контекст из {context_source} памяти: {context_count} элементов")
-        # print(f"🔍 ОТЛАДКА - Загруженный контекст: {memory_context}")
-        
-        # Формируем сообщения для API
-        system_content = "Вы полезный AI ассистент. Отвечайте на русском языке, будьте дружелюбны и информативны."
-        
-        # Для reasoning-моделей добавляем контекст в пользовательское сообщение
-        user_content = user_text
-        if memory_context:
-            user_content = f"Контекст из предыдущих диалогов:\n{memory_context}\n\nВопрос пользователя: {user_text}"
-        
-        api_messages = [
-            {"role": "system", "content": system_content},
-            {"role": "user", "content": user_content}
-        ]
-        
-        # Получаем параметры для API с учетом модели
-        api_params = get_api_params(
-            model=MODULE_CONFIG['model'],
-            messages=api_messages,
-            temperature=MODULE_CONFIG['temperature'],
-            max_tokens=MODULE_CONFIG['max_tokens'],
-            timeout=MODULE_CONFIG['timeout']
-        )
-        
-        # Делаем запрос к OpenAI API
-        response = await asyncio.to_thread(
-            openai_client.chat.completions.create,  # type: ignore
-            **api_params
-        )
-        
-        # Получаем ответ
-        ai_response = response.choices[0].message.content
-        if ai_response:
-            ai_response = ai_response.strip()
-        else:
-            ai_response = "Извините, не удалось получить ответ."
-        
-        # Удаляем сообщение "Думаю..."
-        await thinking_msg.delete()
-        
-        # Формируем ответ с информацией о памяти
-        response_text = f"🤖 **ChatGPT:**\n\n{ai_response}"
-        
-        # Добавляем информацию о загруженном контексте если есть
-        if context_count > 0:
-            if context_source == "гибридной":
-                response_text += f"\n\n🔥 *Загружен контекст из гибридной памяти: {context_count} элементов*"
-            elif context_source == "сессионной":
-                response_text += f"\n\n📝 *Загружен контекст из сессионной памяти: {context_count} диалогов*"
-        
-        # Отправляем ответ AI
-        await message.reply(response_text, reply_markup=get_back_menu())
-        
-        # Сохраняем диалог в гибридную память
+    # Быстрые сообщения подряд склеиваются в один запрос, а новое сообщение
+    # отменяет еще не отправленный ответ (исправление предыдущего вопроса)
+    if message_coalescer.enabled or MODULE_CONFIG['supersede_inflight']:
+        task = message_coalescer.submit(user_id, message, _answer_text_messages)
+        task_registry.track(user_id, task, kind="chat")
+        return
+    
+    await task_registry.run(user_id, _answer_text_messages([message], lambda: None), kind="chat")
+
+def _progress(message: Message, text: str) -> ProgressMessage:
+    """Статус обработки: «печатает...», а при долгой обработке - заглушка с кнопкой отмены"""
+    return ProgressMessage(
+        message,
+        text,
+        reply_markup=get_cancel_menu(),
+        placeholder_delay=MODULE_CONFIG['placeholder_delay_sec'],
+        min_edit_interval=MODULE_CONFIG['progress_edit_interval_sec']
+    )
+
+async def _answer_text_messages(messages: list, commit):
+    """
+    Ответ ChatGPT на одно или несколько подряд идущих текстовых сообщений
+    
+    commit() вызывается перед отправкой ответа: до этого момента обработка
+    может быть отменена новым сообщением пользователя
+    """
+    message = messages[-1]
+    user_id = str(message.from_user.id)
+    user_text = "\n".join(msg.text or msg.caption for msg in messages if msg.text or msg.caption)
+    
+    # Показываем что бот думает
+    async with _progress(message, MESSAGES["thinking"]) as progress:
         try:
-            await memory_service.save_conversation(user_id, user_text, ai_response)
-            # print(f"💾 ОТЛАДКА - Сохранен диалог в {context_source} память")
+            # Получаем контекст из гибридной системы памяти по частям
+            prompt_context = await memory_service.get_prompt_context(user_id, user_text)
+            context_count = prompt_context['count']
+            context_source = prompt_context['source']
+            
+            # print(f"🔍 ОТЛАДКА - Контекст из {context_source} памяти: {context_count} элементов")
+            
+            # Вопрос о недавней длинной записи - отвечаем по ее конспекту
+            memory_context = prompt_context['memories']
+            recent_summary = long_input_processor.recent_summary(user_id, user_text)
+            if recent_summary:
+                memory_context = "\n\n".join(filter(None, [
+                    memory_context, f"Конспект недавней длинной голосовой записи пользователя:\n{recent_summary}"
+                ]))
+            
+            # Вопрос по загруженным документам - только подходящие фрагменты
+            document_context = await document_store.context(user_id, user_text)
+            if document_context:
+                memory_context = "\n\n".join(filter(None, [
+                    memory_context, f"Фрагменты документов пользователя:\n{document_context}"
+                ]))
+            
+            # Стабильный префикс (system + профиль) → память → реплики беседы → вопрос
+            api_messages = build_chat_messages(
+                question=user_text,
+                system_prompt=DEFAULT_SYSTEM_PROMPT,
+                user_profile=prompt_context['profile'],
+                memory_context=memory_context,
+                history=prompt_context['turns']
+            )
+            
+            # Делаем запрос к OpenAI API
+            ai_response = await request_completion(api_messages)
+            if not ai_response:
+                ai_response = "Извините, не удалось получить ответ."
+            
+            # Дальше ответ уже не отменяется новыми сообщениями
+            commit()
+            
+            # Формируем ответ с информацией о памяти
+            response_text = f"🤖 **ChatGPT:**\n\n{ai_response}"
+            
+            # Добавляем информацию о загруженном контексте если есть
+            if context_count > 0:
+                if context_source == "гибридной":
+                    response_text += f"\n\n🔥 *Загружен контекст из гибридной памяти: {context_count} элементов*"
+                elif context_source == "сессионной":
+                    response_text += f"\n\n📝 *Загружен контекст из сессионной памяти: {context_count} диалогов*"
+            
+            # Отправляем ответ AI (в заглушку, если она уже показана)
+            await progress.finish(response_text, reply_markup=get_back_menu())
+            
+            # Сохраняем диалог в гибридную память
+            try:
+                await memory_service.save_conversation(user_id, user_text, ai_response)
+                # print(f"💾 ОТЛАДКА - Сохранен диалог в {context_source} память")
+            except Exception as e:
+                print(f"⚠️ Ошибка сохранения в память: {e}")
+            
+        except asyncio.CancelledError as error:
+            # Пришло новое сообщение - запрос повторится вместе с ним;
+            # отмена пользователем - показываем, что запрос отменен
+            await progress.cancelled(get_cancel_reason(error), MESSAGES["cancelled"])
+            raise
+            
+        except asyncio.TimeoutError:
+            await progress.finish(MESSAGES["error_timeout"])
+            
         except Exception as e:
-            print(f"⚠️ Ошибка сохранения в память: {e}")
-        
-    except asyncio.TimeoutError:
-        await thinking_msg.edit_text(MESSAGES["error_timeout"])
-        
-    except Exception as e:
-        error_text = MESSAGES["error_api"].format(error=str(e))
-        await thinking_msg.edit_text(error_text)
+            error_text = MESSAGES["error_api"].format(error=str(e))
+            await progress.finish(error_text)
 
 @chatgpt_router.message(StateFilter(ChatGPTStates.waiting_for_message), F.voice)
 async def handle_voice_message(message: Message, bot: Bot, state: FSMContext):
     """Обработка голосовых сообщений"""
-    if not OPENAI_AVAILABLE or not openai_client or not message.voice:
+    if not OPENAI_AVAILABLE or not message.voice or not message.from_user:
         return
     
-    # Показываем что обрабатываем аудио
-    processing_msg = await message.reply(MESSAGES["processing_audio"])
-    
-    try:
-        # Транскрибируем голосовое сообщение
-        transcription, method, error = await transcribe_voice_message(bot, message.voice)
-        
-        if error:
-            await processing_msg.edit_text(MESSAGES["audio_error"].format(error=error))
-            return
-        
-        if not transcription:
-            await processing_msg.edit_text(MESSAGES["no_speech_detected"])
-            return
-        
-        # Обновляем сообщение - показываем что распознали
-        await processing_msg.edit_text(MESSAGES["transcription_success"].format(
-            method=method, 
-            text=transcription[:100] + ("..." if len(transcription) > 100 else "")
-        ))
-        
-        # Отправляем транскрипцию в ChatGPT
-        await _process_transcribed_text(message, transcription, "🎤 Голосовое")
-        
-    except Exception as e:
-        await processing_msg.edit_text(MESSAGES["audio_error"].format(error=str(e)))
+    await task_registry.run(
+        str(message.from_user.id),
+        _handle_audio_message(message, lambda deadline, *callbacks: transcribe_voice_message(bot, message.voice, deadline, *callbacks, user_id=str(message.from_user.id)), "🎤 Голосовое"),
+        kind="audio"
+    )
 
 @chatgpt_router.message(StateFilter(ChatGPTStates.waiting_for_message), F.video_note)
 async def handle_video_note(message: Message, bot: Bot, state: FSMContext):
     """Обработка кружочков (видео заметок)"""
-    if not OPENAI_AVAILABLE or not openai_client or not message.video_note:
+    if not OPENAI_AVAILABLE or not message.video_note or not message.from_user:
         return
     
-    # Показываем что обрабатываем аудио
-    processing_msg = await message.reply(MESSAGES["processing_audio"])
-    
-    try:
-        # Транскрибируем кружочек
-        transcription, method, error = await transcribe_video_note(bot, message.video_note)
-        
-        if error:
-            await processing_msg.edit_text(MESSAGES["audio_error"].format(error=error))
-            return
-        
-        if not transcription:
-            await processing_msg.edit_text(MESSAGES["no_speech_detected"])
-            return
-        
-        # Обновляем сообщение - показываем что распознали
-        await processing_msg.edit_text(MESSAGES["transcription_success"].format(
-            method=method, 
-            text=transcription[:100] + ("..." if len(transcription) > 100 else "")
-        ))
-        
-        # Отправляем транскрипцию в ChatGPT
-        await _process_transcribed_text(message, transcription, "⭕ Кружочек")
-        
-    except Exception as e:
-        await processing_msg.edit_text(MESSAGES["audio_error"].format(error=str(e)))
+    await task_registry.run(
+        str(message.from_user.id),
+        _handle_audio_message(message, lambda deadline, *callbacks: transcribe_video_note(bot, message.video_note, deadline, *callbacks, user_id=str(message.from_user.id)), "⭕ Кружочек"),
+        kind="audio"
+    )
 
 @chatgpt_router.message(StateFilter(ChatGPTStates.waiting_for_message), F.audio)
 async def handle_audio_file(message: Message, bot: Bot, state: FSMContext):
     """Обработка аудио файлов"""
-    if not OPENAI_AVAILABLE or not openai_client or not message.audio:
+    if not OPENAI_AVAILABLE or not message.audio or not message.from_user:
         return
     
-    # Показываем что обрабатываем аудио
-    processing_msg = await message.reply(MESSAGES["processing_audio"])
-    
-    try:
-        # Транскрибируем аудио файл
-        transcription, method, error = await transcribe_audio_file(bot, message.audio)
-        
-        if error:
-            await processing_msg.edit_text(MESSAGES["audio_error"].format(error=error))
-            return
+    await task_registry.run(
+        str(message.from_user.id),
+        _handle_audio_message(message, lambda deadline, *callbacks: transcribe_audio_file(bot, message.audio, deadline, *callbacks, user_id=str(message.from_user.id)), "🎵 Аудио файл"),
+        kind="audio"
+    )
+
+async def _handle_audio_message(message: Message, transcribe, audio_type: str):
+    """Общая обработка аудио: транскрипция → ChatGPT (отменяемая задача)"""
+    # Единый бюджет времени на все этапы: скачивание, распознавание, ответ
+    # (длинные записи распознаются по сегментам и получают больший бюджет)
+    media = message.voice or message.video_note or message.audio
+    audio_settings = get_transcription_engine().settings
+    is_long = audio_settings.long_audio_enabled and (media.duration or 0) > audio_settings.long_audio_threshold_sec
+    deadline = Deadline(MODULE_CONFIG['long_audio_deadline_sec'] if is_long else MODULE_CONFIG['voice_deadline_sec'])
+    
+    # Показываем что обрабатываем аудио; весь путь - в одном статусном сообщении
+    async with _progress(message, MESSAGES["processing_audio"]) as progress:
+        async def on_progress(done: int, total: int):
+            await progress.update(MESSAGES["transcribing_segments"].format(done=done, total=total))
+        
+        # Текст по мере распознавания (локальный Whisper); правки статуса ограничены по частоте
+        streamed = False
+        async def on_partial(text: str):
+            nonlocal streamed
+            streamed = True
+            if len(text) > PARTIAL_TEXT_LIMIT:
+                text = "…" + text[-PARTIAL_TEXT_LIMIT:]
+            await progress.update(MESSAGES["transcribing_partial"].format(text=text))
+        
+        # Позиция в общей очереди, пока аудио ждет распознавания
+        async def on_queue(position: int, eta: Optional[float]):
+            await progress.update(MESSAGES["audio_queued"].format(position=position, wait=format_wait(eta)))
         
-        if not transcription:
-            await processing_msg.edit_text(MESSAGES["no_speech_detected"])
+        try:
+            # Транскрибируем аудио
+            transcription, method, error = await transcribe(deadline, on_progress, on_partial, on_queue)
+            
+            if error:
+                await progress.finish(MESSAGES["audio_error"].format(error=error))
+                return
+            
+            if not transcription:
+                await progress.finish(MESSAGES["no_speech_detected"])
+                return
+            
+            # Пользователь уже видел текст по ходу распознавания - отдаем расшифровку без ChatGPT
+            if streamed and not MODULE_CONFIG['local_streaming_complete']:
+                await progress.finish(MESSAGES["transcription_final"].format(method=method, text=transcription))
+                return
+            
+            # Обновляем статус - показываем что распознали
+            await progress.update(MESSAGES["transcription_success"].format(
+                method=method, 
+                text=transcription[:100] + ("..." if len(transcription) > 100 else "")
+            ))
+            
+        except asyncio.CancelledError as error:
+            await progress.cancelled(get_cancel_reason(error), MESSAGES["cancelled"])
+            raise
+            
+        except Exception as e:
+            await progress.finish(MESSAGES["audio_error"].format(error=str(e)))
             return
         
-        # Обновляем сообщение - показываем что распознали
-        await processing_msg.edit_text(MESSAGES["transcription_success"].format(
-            method=method, 
-            text=transcription[:100] + ("..." if len(transcription) > 100 else "")
-        ))
-        
         # Отправляем транскрипцию в ChatGPT
-        await _process_transcribed_text(message, transcription, "🎵 Аудио файл")
-        
-    except Exception as e:
-        await processing_msg.edit_text(MESSAGES["audio_error"].format(error=str(e)))
+        await _process_transcribed_text(progress, transcription, audio_type, deadline, str(message.from_user.id))
 
-async def _process_transcribed_text(message: Message, transcription: str, audio_type: str):
-    """Обработка распознанного текста через ChatGPT"""
-    # Показываем что ChatGPT думает
-    thinking_msg = await message.reply(MESSAGES["thinking"])
-    
+async def _process_transcribed_text(progress: ProgressMessage, transcription: str, audio_type: str,
+                                    deadline: Optional[Deadline] = None, user_id: Optional[str] = None):
+    """Обработка распознанного текста через ChatGPT (длинная расшифровка - по частям)"""
     try:
+        question = transcription
+        if long_input_processor.is_long(transcription):
+            # Части конспектируются параллельно, ответ строится по конспектам
+            async def on_progress(done: int, total: int):
+                await progress.update(MESSAGES["long_input_progress"].format(done=done, total=total))
+            
+            # Каждый запрос получает остаток бюджета; истекший бюджет прерывает конспектирование
+            summary = await long_input_processor.summarize(transcription, deadline, on_progress)
+            if user_id:
+                long_input_processor.remember(user_id, summary)
+            question = long_input_processor.reduce_prompt(summary)
+            if len(transcription) > LONG_TRANSCRIPTION_PREVIEW:
+                transcription = transcription[:LONG_TRANSCRIPTION_PREVIEW] + "…"
+        
         # Формируем сообщения для API
-        api_messages = [
-            {"role": "system", "content": "Вы полезный AI ассистент. Отвечайте на русском языке, будьте дружелюбны и информативны."},
-            {"role": "user", "content": transcription}
-        ]
+        api_messages = build_chat_messages(question=question)
         
-        # Получаем параметры для API с учетом модели
-        api_params = get_api_params(
-            model=MODULE_CONFIG['model'],
-            messages=api_messages,
-            temperature=MODULE_CONFIG['temperature'],
-            max_tokens=MODULE_CONFIG['max_tokens'],
-            timeout=MODULE_CONFIG['timeout']
-        )
+        # Модель и таймаут зависят от оставшегося бюджета времени
+        profile = select_completion_profile(deadline)
         
         # Делаем запрос к OpenAI API
-        response = await asyncio.to_thread(
-            openai_client.chat.completions.create,  # type: ignore
-            **api_params
-        )
-        
-        # Получаем ответ
-        ai_response = response.choices[0].message.content
-        if ai_response:
-            ai_response = ai_response.strip()
-        else:
+        ai_response = await request_completion(api_messages, **profile)
+        if not ai_response:
             ai_response = "Извините, не удалось получить ответ."
         
-        # Удаляем сообщение "Думаю..."
-        await thinking_msg.delete()
-        
         # Отправляем ответ с указанием источника
         response_text = f"{audio_type} → 🤖 **ChatGPT:**\n\n"
         response_text += f"*Распознано:* {transcription}\n\n"
         response_text += f"*Ответ:* {ai_response}"
         
-        await message.reply(response_text, reply_markup=get_back_menu())
+        await progress.finish(response_text, reply_markup=get_back_menu())
+        
+    except asyncio.CancelledError as error:
+        await progress.cancelled(get_cancel_reason(error), MESSAGES["cancelled"])
+        raise
         
     except asyncio.TimeoutError:
-        await thinking_msg.edit_text(MESSAGES["error_timeout"])
+        await progress.finish(MESSAGES["error_timeout"])
         
     except Exception as e:
         error_text = MESSAGES["error_api"].format(error=str(e))
-        await thinking_msg.edit_text(error_text)
+        await progress.finish(error_text)
 
 @chatgpt_router.message(StateFilter(ChatGPTStates.waiting_for_message), F.photo)
 async def handle_image_message(message: Message, bot: Bot, state: FSMContext):
     """Обработка изображений через Vision API"""
-    if not OPENAI_AVAILABLE or not openai_client or not message.photo:
+    if not OPENAI_AVAILABLE or not openai_client or not message.photo or not message.from_user:
         return
     
     if not VISION_AVAILABLE or not image_processor:
@@ -447,22 +515,26 @@ async def handle_image_message(message: Message, bot: Bot, state: FSMContext):
         )
         return
     
+    await task_registry.run(str(message.from_user.id), _analyze_image(message, bot), kind="vision")
+
+async def _analyze_image(message: Message, bot: Bot):
+    """Анализ изображения через Vision API (отменяемая задача)"""
     # Показываем что обрабатываем изображение
-    processing_msg = await message.reply("🖼️ Обрабатываю изображение...")
-    
+    async with _progress(message, "🖼️ Обрабатываю изображение...") as progress:
+        await _run_image_analysis(message, bot, progress)
+
+async def _run_image_analysis(message: Message, bot: Bot, progress: ProgressMessage):
+    """Загрузка изображения, запрос к Vision API и ответ"""
     try:
         # Берем изображение наивысшего качества
         photo = message.photo[-1]
         
-        # Загружаем изображение
-        file_stream = await bot.download(photo)  # type: ignore
-        if not file_stream:
-            await processing_msg.edit_text("❌ Не удалось загрузить изображение")
+        # Загружаем изображение (с локального сервера Bot API - прямо с диска)
+        image_bytes = await read_telegram_file(bot, photo.file_id, photo.file_unique_id)
+        if not image_bytes:
+            await progress.finish("❌ Не удалось загрузить изображение")
             return
         
-        image_bytes = file_stream.read()  # type: ignore
-        file_stream.close()
-        
         # Подготавливаем изображение для API
         base64_image, image_info = image_processor.prepare_image_for_api(
                             image_bytes, MODULE_CONFIG['vision_quality']
@@ -471,11 +543,9 @@ async def handle_image_message(message: Message, bot: Bot, state: FSMContext):
         # Показываем информацию о затратах (если включено)
         if MODULE_CONFIG['vision_cost_warnings']:
             cost_warning = image_processor.get_cost_warning(image_info, MODULE_CONFIG['model'])
-            await processing_msg.edit_text(
-                f"🖼️ **Изображение обработано:**\n\n{cost_warning}\n\n🤖 Анализирую..."
-            )
+            await progress.update(f"🖼️ **Изображение обработано:**\n\n{cost_warning}\n\n🤖 Анализирую...")
         else:
-            await processing_msg.edit_text("🤖 Анализирую изображение...")
+            await progress.update("🤖 Анализирую изображение...")
         
         # Формируем сообщения для Vision API
         user_text = message.caption if message.caption else "Опишите, что вы видите на этом изображении."
@@ -500,31 +570,11 @@ async def handle_image_message(message: Message, bot: Bot, state: FSMContext):
             }
         ]
         
-        # Получаем параметры для API с учетом модели (без temperature для reasoning моделей)
-        api_params = get_api_params(
-            model=MODULE_CONFIG['model'],
-            messages=api_messages,
-            temperature=MODULE_CONFIG['temperature'],
-            max_tokens=MODULE_CONFIG['max_tokens'],
-            timeout=MODULE_CONFIG['timeout']
-        )
-        
-        # Делаем запрос к Vision API
-        response = await asyncio.to_thread(
-            openai_client.chat.completions.create,  # type: ignore
-            **api_params
-        )
-        
-        # Получаем ответ
-        ai_response = response.choices[0].message.content
-        if ai_response:
-            ai_response = ai_response.strip()
-        else:
+        # Делаем запрос к Vision API (без temperature для reasoning моделей)
+        ai_response = await request_completion(api_messages)
+        if not ai_response:
             ai_response = "Извините, не удалось проанализировать изображение."
         
-        # Удаляем сообщение обработки
-        await processing_msg.delete()
-        
         # Формируем итоговый ответ
         response_text = f"🖼️ **Vision API:**\n\n"
         if message.caption:
@@ -536,11 +586,65 @@ async def handle_image_message(message: Message, bot: Bot, state: FSMContext):
             estimated_cost = image_processor.estimate_cost_usd(image_info['estimated_tokens'], MODULE_CONFIG['model'])
             response_text += f"\n\n💰 *Затрачено: ~${estimated_cost:.4f} (~{image_info['estimated_tokens']} токенов)*"
         
-        await message.reply(response_text, reply_markup=get_back_menu())
+        await progress.finish(response_text, reply_markup=get_back_menu())
+        
+    except asyncio.CancelledError as error:
+        await progress.cancelled(get_cancel_reason(error), MESSAGES["cancelled"])
+        raise
         
     except Exception as e:
         error_text = f"❌ **Ошибка Vision API:**\n{str(e)}\n\n💡 Возможные причины:\n• Модель не поддерживает изображения\n• Превышен лимит API\n• Проблемы с обработкой изображения"
-        await processing_msg.edit_text(error_text)
+        await progress.finish(error_text)
+
+@chatgpt_router.message(StateFilter(ChatGPTStates.waiting_for_message), F.document)
+async def handle_document_message(message: Message, bot: Bot, state: FSMContext):
+    """Документы (TXT, Markdown, PDF): индексируются для вопросов по тексту"""
+    if not OPENAI_AVAILABLE or not message.document or not message.from_user:
+        return
+    
+    document = message.document
+    extension = Path(document.file_name or "").suffix.lower()
+    if not MODULE_CONFIG['documents_enabled'] or extension not in supported_extensions():
+        await handle_unsupported_message(message)
+        return
+    
+    # Облачный Bot API отдает ботам файлы только до 20 МБ
+    max_size = min(MODULE_CONFIG['document_max_size_mb'] * 1024 * 1024, max_download_bytes(bot))
+    if document.file_size and document.file_size > max_size:
+        await message.reply(
+            MESSAGES["document_too_large"].format(max_size=int(max_size // (1024 * 1024))),
+            reply_markup=get_back_menu()
+        )
+        return
+    
+    await task_registry.run(str(message.from_user.id), _index_document(message, bot), kind="document")
+
+async def _index_document(message: Message, bot: Bot):
+    """Загрузка и индексация документа; вопрос в подписи - сразу ответ по нему (отменяемая задача)"""
+    document = message.document
+    user_id = str(message.from_user.id)
+    async with _progress(message, MESSAGES["document_indexing"]) as progress:
+        try:
+            data = await read_telegram_file(bot, document.file_id, document.file_unique_id)
+            indexed = await document_store.add(user_id, document.file_unique_id, document.file_name, data)
+            
+        except asyncio.CancelledError as error:
+            await progress.cancelled(get_cancel_reason(error), MESSAGES["cancelled"])
+            raise
+            
+        except Exception as e:
+            await progress.finish(MESSAGES["document_error"].format(error=str(e)), reply_markup=get_back_menu())
+            return
+        
+        if not message.caption:
+            await progress.finish(
+                MESSAGES["document_ready"].format(name=html.escape(indexed.name), chunks=len(indexed.chunks)),
+                reply_markup=get_back_menu()
+            )
+            return
+        await progress.finish(MESSAGES["document_ready_short"].format(name=html.escape(indexed.name)))
+    
+    await _answer_text_messages([message], lambda: None)
 
 @chatgpt_router.message(StateFilter(ChatGPTStates.waiting_for_message))
 async def handle_unsupported_message(message: Message):
@@ -559,8 +663,9 @@ async def clear_user_memory(callback: CallbackQuery):
     user_id = str(callback.from_user.id)
     
     try:
-        # Очищаем всю память пользователя в гибридной системе
+        # Очищаем всю память пользователя в гибридной системе (и отключаем его документы)
         success = await memory_service.clear_all_memory(user_id)
+        document_store.clear(user_id)
         
         if success:
             await callback.message.edit_text(  # type: ignore
@@ -633,7 +738,7 @@ async def show_memory_info(callback: CallbackQuery):
             info_text += f"**Сессионная память:** {session_stats['messages_count']}/{session_stats['max_capacity']} диалогов\n\n"
             info_text += f"**Как работает:**\n"
             info_text += f"• 🧠 Семантический поиск по всей истории (Mem0)\n"
-            info_text += f"• 📝 Последние диалоги текущей сессии (RAM)\n"
+            info_text += f"• 📝 Недавние и относящиеся к вопросу диалоги сессии (RAM)\n"
             info_text += f"• 🔀 Объединение обоих контекстов для максимальной эффективности\n\n"
             info_text += f"**Преимущества:**\n"
             info_text += f"• Максимально полный контекст\n"
@@ -651,7 +756,7 @@ async def show_memory_info(callback: CallbackQuery):
             info_text += f"**Время жизни:** До перезапуска бота\n\n"
             info_text += f"**Как работает:**\n"
             info_text += f"• 💾 Хранит последние {session_stats['max_capacity']} пар диалогов\n"
-            info_text += f"• ⚡ Быстрый доступ к недавней истории\n"
+            info_text += f"• 🔎 В запрос - недавние и относящиеся к вопросу диалоги\n"
             info_text += f"• 🆓 Полностью бесплатная\n\n"
             info_text += f"**Для максимального эффекта включите гибридный режим! 🔥**"
         
@@ -671,8 +776,9 @@ async def exit_chatgpt_mode(callback: CallbackQuery, state: FSMContext):
     if not callback.message:
         return
     
-    # Очищаем состояние
+    # Очищаем состояние и отменяем незавершенные запросы пользователя
     await state.clear()
+    task_registry.cancel(str(callback.from_user.id))
     
     # Импортируем главное меню
     from keyboards.main_menu import get_main_menu
@@ -685,6 +791,7 @@ async def exit_chatgpt_mode(callback: CallbackQuery, state: FSMContext):
 async def show_module_info(message: Message):
     """Показать информацию о текущей конфигурации модуля"""
     current_model = MODULE_CONFIG['model']
+    audio_settings = get_transcription_engine().settings
     effective_tokens = MODULE_CONFIG['max_tokens']
     temperature = MODULE_CONFIG['temperature']
     
@@ -704,10 +811,10 @@ async def show_module_info(message: Message):
         temp_note=temp_note,
         max_tokens=display_tokens,
         token_note=token_note,
-        whisper_mode=MODULE_CONFIG['whisper_mode'],
-        whisper_language=MODULE_CONFIG['whisper_language'],
-        max_size=MODULE_CONFIG['max_audio_size_mb'],
-        max_duration=MODULE_CONFIG['max_audio_duration_sec'] // 60  # В минутах
+        whisper_mode=audio_settings.whisper_mode,
+        whisper_language=audio_settings.whisper_language,
+        max_size=audio_settings.max_audio_size_mb,
+        max_duration=audio_settings.max_audio_duration_sec // 60  # В минутах
     )
     
     # Добавляем информацию о гибридной системе памяти
@@ -727,6 +834,21 @@ async def show_module_info(message: Message):
         info_text += f"• Диалогов: {session_stats['messages_count']}/{session_stats['max_capacity']}\n"
         info_text += f"• Только текущая сессия"
     
+    info_text += format_prompt_cache_info()
+    info_text += format_audio_pipeline_info()
+    
+    if message_coalescer.enabled:
+        coalesce_stats = message_coalescer.get_stats()
+        info_text += f"\n\n**📨 Склейка сообщений:**\n"
+        info_text += f"• Окно: {coalesce_stats['window_ms']} мс\n"
+        info_text += f"• Сэкономлено запросов: {coalesce_stats['requests_saved']}"
+    
+    fast_stats = fast_path.get_stats()
+    if fast_stats:
+        answered = ", ".join(f"{intent} {count}" for intent, count in fast_stats.items())
+        info_text += f"\n\n**⚡ Быстрые ответы без ChatGPT:**\n"
+        info_text += f"• Запросов не понадобилось: {sum(fast_stats.values())} ({answered})"
+    
     await message.reply(info_text, reply_markup=get_back_menu())
 
 @chatgpt_router.message(F.text.startswith("/chatgpt_info"))
@@ -737,6 +859,7 @@ async def show_module_info_outside(message: Message):
         return
         
     current_model = MODULE_CONFIG['model']
+    audio_settings = get_transcription_engine().settings
     effective_tokens = MODULE_CONFIG['max_tokens']
     temperature = MODULE_CONFIG['temperature']
     
@@ -760,10 +883,10 @@ async def show_module_info_outside(message: Message):
         temp_note=temp_note,
         max_tokens=display_tokens,
         token_note=token_note,
-        whisper_mode=MODULE_CONFIG['whisper_mode'],
-        whisper_language=MODULE_CONFIG['whisper_language'],
-        max_size=MODULE_CONFIG['max_audio_size_mb'],
-        max_duration=MODULE_CONFIG['max_audio_duration_sec'] // 60  # В минутах
+        whisper_mode=audio_settings.whisper_mode,
+        whisper_language=audio_settings.whisper_language,
+        max_size=audio_settings.max_audio_size_mb,
+        max_duration=audio_settings.max_audio_duration_sec // 60  # В минутах
     )
     
     # Добавляем информацию о Vision API
@@ -788,6 +911,8 @@ async def show_module_info_outside(message: Message):
         info_text += f"• Хранение: Локальное во время сессии\n"
         info_text += f"• Для максимального эффекта: настройте MEM0_API_KEY в .env"
     
+    info_text += format_prompt_cache_info()
+    
     info_text += f"\n\n💡 Активируйте модуль: /start → 🤖 ChatGPT"
     
     await message.reply(info_text) 
\ No newline at end of file
@@ -24,7 +24,11 @@ async def run_all_tests():
     tests = [
         ("Сессионная память", "test_session_memory"),
         ("Гибридная память", "test_hybrid_memory"),
-        ("Переключение режимов", "test_memory_toggle")
+        ("Переключение режимов", "test_memory_toggle"),
+        ("Построение промптов", "test_prompt_builder"),
+        ("Длинные записи", "test_long_audio"),
+        ("Релевантный контекст сессии", "test_session_relevance"),
+        ("Быстрые ответы", "test_fast_path")
     ]
     
     results = {}
@@ -50,6 +54,26 @@ async def run_all_tests():
                 await test_memory_toggle()
                 results[test_name] = "✅ УСПЕШНО"
                 
+            elif test_module == "test_prompt_builder":
+                from test_prompt_builder import test_prompt_builder
+                test_prompt_builder()
+                results[test_name] = "✅ УСПЕШНО"
+                
+            elif test_module == "test_long_audio":
+                from test_long_audio import test_long_audio
+                test_long_audio()
+                results[test_name] = "✅ УСПЕШНО"
+                
+            elif test_module == "test_session_relevance":
+                from test_session_relevance import test_session_relevance
+                test_session_relevance()
+                results[test_name] = "✅ УСПЕШНО"
+                
+            elif test_module == "test_fast_path":
+                from test_fast_path import test_fast_path
+                test_fast_path()
+                results[test_name] = "✅ УСПЕШНО"
+                
         except Exception as e:
             print(f"❌ ОШИБКА В ТЕСТЕ {test_name}:")
             print(f"   {str(e)}")
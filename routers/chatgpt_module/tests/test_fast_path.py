@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Тест быстрых ответов ChatGPT модуля
+Проверяет распознавание служебных сообщений, пропуск вопросов и настройку намерений
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from routers.chatgpt_module.fast_path import FastPath, normalize
+
+def test_fast_path():
+    """Тестирует классификатор служебных сообщений"""
+    print("🧪 Начинаю тест быстрых ответов...")
+
+    fast_path = FastPath(intents=["greeting", "thanks", "ack", "goodbye"])
+
+    print("\n1️⃣ Тест служебных сообщений:")
+
+    cases = {
+        "Привет!": "greeting",
+        "Добрый вечер": "greeting",
+        "Привееет 👋": "greeting",
+        "Спасибо большое!!!": "thanks",
+        "спасиб": "thanks",
+        "ок": "ack",
+        "Понятно, спасибо": None,  # Фразы разных намерений - в ChatGPT
+        "Ок ок": "ack",
+        "До свидания": "goodbye",
+    }
+    for text, expected in cases.items():
+        intent = fast_path.classify(text)
+        print(f"  📝 '{text}' -> {intent}")
+        assert intent == expected
+    print("  ✅ Приветствия, благодарности и «ок» распознаны")
+
+    print("\n2️⃣ Тест сообщений для ChatGPT:")
+
+    for text in ["Спасибо, а как настроить VPN?", "Привет, расскажи анекдот",
+                 "Что такое BM25?", "Окончательный ответ", "", "👍",
+                 "Привет?", "Спасибо?!", "привед медвед"]:
+        assert fast_path.classify(text) is None, text
+    assert fast_path.classify("спасибо " * 10) is None
+    print("  ✅ Вопросы и длинные сообщения идут в ChatGPT")
+
+    print("\n3️⃣ Тест ответов и статистики:")
+
+    assert fast_path.answer("Привет") is not None
+    assert fast_path.answer("спасибо") is not None
+    assert fast_path.answer("Как дела у проекта?") is None
+    assert fast_path.get_stats() == {"greeting": 1, "thanks": 1}
+    print(f"  ✅ Сэкономлено запросов: {fast_path.get_stats()}")
+
+    print("\n4️⃣ Тест настройки намерений:")
+
+    only_thanks = FastPath(intents=["thanks"])
+    assert only_thanks.classify("Привет") is None
+    assert only_thanks.classify("Спасибо") == "thanks"
+    assert not FastPath(intents=[]).enabled
+    assert normalize("Ёжик,  ПРИВЕЕЕТ!") == "ежик привет"
+    print("  ✅ Выключенные намерения не распознаются")
+
+    print("\n🎉 Тест быстрых ответов завершен!")
+
+if __name__ == "__main__":
+    test_fast_path()
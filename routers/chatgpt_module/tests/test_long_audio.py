@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Тест обработки длинных записей
+Проверяет нарезку по паузам, обрезку тишины и склейку текста сегментов
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+import numpy as np
+
+from media.chunking import plan_chunks, stitch_transcripts, MISSING_SEGMENT_MARK
+from media.vad import trim_silence
+
+SAMPLE_RATE = 16000
+
+
+def make_speech(seconds: float) -> np.ndarray:
+    """Тон вместо речи (int16)"""
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 300 * t) * 32767).astype(np.int16)
+
+
+def make_silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(SAMPLE_RATE * seconds), dtype=np.int16)
+
+
+def test_long_audio():
+    """Тестирует VAD, нарезку и склейку"""
+    print("🧪 Начинаю тест длинных записей...")
+
+    print("\n1️⃣ Тест обрезки тишины:")
+
+    audio = np.concatenate([make_silence(3), make_speech(2), make_silence(0.3), make_speech(2), make_silence(5)])
+    result = trim_silence(audio, SAMPLE_RATE)
+    print(f"  📊 {result.original_sec:.1f} сек → {result.kept_sec:.1f} сек")
+
+    assert result.has_speech
+    assert 4.0 <= result.kept_sec <= 5.0, "Короткая пауза сохраняется, длинные вырезаются"
+    assert abs(result.to_original_time(0) - 2.8) < 0.05, "Карта времени указывает на начало речи"
+    assert not trim_silence(make_silence(2), SAMPLE_RATE).has_speech
+    print("  ✅ Тишина вырезана, карта времени корректна")
+
+    print("\n2️⃣ Тест нарезки по паузам:")
+
+    block = np.concatenate([make_speech(4), make_silence(0.5)])
+    long_audio = np.tile(block, 100)  # 7.5 минут
+    chunks = plan_chunks(long_audio, SAMPLE_RATE, max_chunk_sec=120, overlap_sec=1)
+    print(f"  📝 Сегментов: {len(chunks)}")
+
+    assert len(chunks) == 4
+    assert chunks[0].start == 0 and chunks[-1].end == len(long_audio)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.start < previous.end, "Соседние сегменты перекрываются"
+        assert current.duration(SAMPLE_RATE) <= 120
+    # Разрезы попадают в паузы: в точке разреза тишина
+    assert all(long_audio[chunk.end - 1] == 0 for chunk in chunks[:-1])
+    print("  ✅ Сегменты ограничены по длине и разрезаны в паузах")
+
+    print("\n3️⃣ Тест склейки текста:")
+
+    text = stitch_transcripts(["Привет, как дела у тебя", "у тебя все хорошо?", "Отлично."])
+    print(f"  📝 {text}")
+    assert text == "Привет, как дела у тебя все хорошо? Отлично."
+
+    text = stitch_transcripts(["Первый сегмент", None, "и третий"])
+    assert text == f"Первый сегмент {MISSING_SEGMENT_MARK} и третий"
+    assert stitch_transcripts(["сказал и", "и ушел"]) == "сказал и и ушел", "Короткие слова не считаются повтором"
+    print("  ✅ Повторы на стыках удалены, пропуски помечены")
+
+    print("\n🎉 Тест длинных записей завершен!")
+
+
+if __name__ == "__main__":
+    test_long_audio()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Тест построения промптов ChatGPT модуля
+Проверяет порядок сообщений для кеширования префикса и обработку reasoning-моделей
+"""
+
+import sys
+import os
+from types import SimpleNamespace
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from routers.chatgpt_module.prompt_builder import build_chat_messages, PromptCacheStats
+from routers.chatgpt_module.completions import get_api_params
+
+def test_prompt_builder():
+    """Тестирует раскладку промпта и учет закешированных токенов"""
+    print("🧪 Начинаю тест построения промптов...")
+
+    print("\n1️⃣ Тест порядка сообщений:")
+
+    history = [
+        {"role": "user", "content": "Как тебя зовут?"},
+        {"role": "assistant", "content": "Меня зовут Ассистент."},
+    ]
+    messages = build_chat_messages(
+        question="А что ты умеешь?",
+        system_prompt="Системный промпт",
+        user_profile="Информация о пользователе:\nЛюбит кофе",
+        memory_context="• Спрашивал про погоду",
+        history=history
+    )
+    roles = [msg["role"] for msg in messages]
+    print(f"  📝 Роли: {roles}")
+
+    assert roles == ["system", "system", "user", "assistant", "user"]
+    assert messages[0]["content"].startswith("Системный промпт")
+    assert "Любит кофе" in messages[0]["content"]
+    assert messages[-1]["content"] == "А что ты умеешь?"
+    print("  ✅ Стабильный префикс идет первым, вопрос последним")
+
+    print("\n2️⃣ Тест стабильности префикса между ходами:")
+
+    next_messages = build_chat_messages(
+        question="Другой вопрос",
+        system_prompt="Системный промпт",
+        user_profile="Информация о пользователе:\nЛюбит кофе",
+        memory_context="• Спрашивал про погоду",
+        history=history
+    )
+    assert next_messages[:-1] == messages[:-1]
+    print("  ✅ Префикс не зависит от нового вопроса")
+
+    print("\n3️⃣ Тест параметров для reasoning-моделей:")
+
+    params = get_api_params("o4-mini", messages, temperature=0.7, max_tokens=5000, timeout=30)
+    assert 'temperature' not in params
+    assert params['max_completion_tokens'] == 5000
+    assert all(msg["role"] != "system" for msg in params['messages'])
+    assert [msg["content"] for msg in params['messages']] == [msg["content"] for msg in messages]
+    print("  ✅ system сообщения перенесены в user без потери порядка")
+
+    params = get_api_params("gpt-4o-mini", messages, temperature=0.7, max_tokens=1000, timeout=30)
+    assert params['temperature'] == 0.7
+    assert params['max_tokens'] == 1000
+    assert params['messages'] == messages
+    print("  ✅ Обычные модели получают сообщения без изменений")
+
+    print("\n4️⃣ Тест статистики кеша промптов:")
+
+    stats = PromptCacheStats()
+    stats.record(SimpleNamespace(prompt_tokens=2000, prompt_tokens_details=SimpleNamespace(cached_tokens=1536)))
+    stats.record(SimpleNamespace(prompt_tokens=2000, prompt_tokens_details=None))
+    print(f"  📊 Статистика: {stats.get_stats()}")
+
+    assert stats.requests == 2
+    assert stats.cached_tokens == 1536
+    assert abs(stats.hit_rate - 0.384) < 1e-9
+    print("  ✅ Доля попаданий в кеш считается корректно")
+
+    print("\n🎉 Тест построения промптов завершен!")
+
+if __name__ == "__main__":
+    test_prompt_builder()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Тест отбора сессионного контекста по релевантности
+Проверяет индекс BM25 по диалогам, окно последних реплик и вытеснение старых пар
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from routers.chatgpt_module.config import MODULE_CONFIG
+from routers.chatgpt_module.memory_service import HybridMemoryService
+
+def test_session_relevance():
+    """Тестирует выбор реплик сессии: недавние + относящиеся к вопросу"""
+    print("🧪 Начинаю тест релевантного сессионного контекста...")
+
+    memory_service = HybridMemoryService()
+    test_user_id = "test_user_relevance"
+    history_size = MODULE_CONFIG['session_history_size']
+    recent = MODULE_CONFIG['session_recent_turns']
+
+    print("\n1️⃣ Тест выбора старого диалога по теме вопроса:")
+
+    memory_service.save_to_session_memory(
+        test_user_id, "Посоветуй сорт кофе для турки", "Попробуйте эфиопскую арабику мелкого помола."
+    )
+    for i in range(recent + 3):
+        memory_service.save_to_session_memory(test_user_id, f"Сколько будет {i} плюс {i}?", f"Будет {i + i}.")
+
+    turns = memory_service.get_session_turns(test_user_id, "А какой помол кофе лучше?")
+    contents = [turn["content"] for turn in turns]
+    print(f"  📝 Выбрано реплик: {len(turns)}")
+
+    assert "Посоветуй сорт кофе для турки" in contents
+    assert contents[-1] == f"Будет {2 * (recent + 2)}."
+    assert len(turns) == 2 * (recent + 1)
+    print("  ✅ Старый диалог о кофе найден, последние реплики сохранены, лишние пропущены")
+
+    print("\n2️⃣ Тест сообщения без общих слов с историей:")
+
+    turns = memory_service.get_session_turns(test_user_id, "Почему?")
+    assert len(turns) == 2 * recent
+    print(f"  ✅ Только последние пары диалогов: {recent}")
+
+    print("\n3️⃣ Тест вытеснения старых пар из индекса:")
+
+    for i in range(history_size):
+        memory_service.save_to_session_memory(test_user_id, f"Вопрос номер {i}", f"Ответ номер {i}")
+    index = memory_service.session_index[test_user_id]
+    assert len(index) == history_size
+    turns = memory_service.get_session_turns(test_user_id, "кофе помол арабика")
+    assert all("кофе" not in turn["content"] for turn in turns)
+    print(f"  ✅ В индексе {len(index)} пар, вытесненный диалог больше не находится")
+
+    print("\n4️⃣ Тест очистки:")
+
+    memory_service.clear_session_memory(test_user_id)
+    assert memory_service.get_session_turns(test_user_id, "Вопрос номер 1") == []
+    assert test_user_id not in memory_service.session_index
+    print("  ✅ История и индекс очищены")
+
+    print("\n🎉 Тест релевантного сессионного контекста завершен!")
+
+if __name__ == "__main__":
+    test_session_relevance()
@@ -4,6 +4,8 @@ from aiogram.filters import CommandStart, Command
 from config import ALLOWED_USER_IDS
 from messages import MESSAGES as GLOBAL_MESSAGES
 from keyboards.main_menu import get_main_menu
+from keyboards.cancel import CANCEL_CALLBACK
+from utils.tasks import task_registry
 
 core_router = Router()
 
@@ -39,4 +41,13 @@ async def show_main_menu(callback: CallbackQuery):
     if not callback.message:
         return
     await callback.message.edit_text("📋 Главное меню:", reply_markup=get_main_menu())  # type: ignore
-    await callback.answer() 
\ No newline at end of file
+    await callback.answer() 
+
+@core_router.callback_query(F.data == CANCEL_CALLBACK)
+async def cancel_user_tasks(callback: CallbackQuery):
+    """Отмена выполняемых задач пользователя (кнопка «⛔ Отмена»)"""
+    cancelled = task_registry.cancel(str(callback.from_user.id))
+    if cancelled:
+        await callback.answer("⛔ Отменено")
+    else:
+        await callback.answer("ℹ️ Нечего отменять")
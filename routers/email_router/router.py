@@ -8,9 +8,12 @@ from .messages import MESSAGES  # локальные сообщения
 from messages import MESSAGES as GLOBAL_MESSAGES  # глобальные сообщения
 from .services import send_email_oauth2, get_auth_status, is_authorized
 from .keyboards import get_email_menu, get_recipient_menu
+from media.telegram_files import read_telegram_file
+from utils.progress import ProgressMessage
 import re
 import asyncio
 from aiogram import F
+from aiogram.enums import ChatAction
 
 email_router = Router()
 
@@ -20,6 +23,34 @@ default_recipient = DEFAULT_EMAIL_RECIPIENT
 def is_valid_email(email):
     return re.match(r"[^@\s]+@[^@\s]+\.[a-zA-Z]{2,}", email)
 
+async def send_email_with_progress(message: Message, state, subject, body, file=None, success_text=None):
+    """
+    Отправка письма со статусом «отправляет файл...» вместо промежуточных сообщений
+
+    Вложения - файлы черновика (state["files"]) и file из текущего сообщения.
+    Список вложений собирается после ожидания файлов альбома и забирается из
+    черновика до отправки: файлы, прикрепленные во время отправки, останутся
+    для следующего письма.
+    """
+    async with ProgressMessage(message, "📤 Отправляю письмо...", action=ChatAction.UPLOAD_DOCUMENT, as_reply=False) as progress:
+        # Ждем 2 секунды для накопления файлов из групповых сообщений
+        await asyncio.sleep(2)
+        
+        attachments, state["files"] = state["files"], []
+        state["draft"] = {}
+        if file is not None:
+            attachments.append(file)
+        if success_text is None:
+            success_text = "✅ Письмо с вложением отправлено." if attachments else "✅ Письмо отправлено."
+        recipient = state["recipient"] or default_recipient
+        
+        # Отправка блокирующая - выполняем в потоке, чтобы статус продолжал обновляться
+        success, error_msg = await asyncio.to_thread(send_email_oauth2, recipient, subject, body, attachments)
+        if success:
+            await progress.finish(success_text)
+        else:
+            await progress.finish(f"{MESSAGES['email_failed']}\n❌ {error_msg}")
+
 # Команды /start и /menu перенесены в core модуль для лучшей архитектуры
 
 @email_router.callback_query(F.data.in_({
@@ -153,14 +184,10 @@ async def handle_input(message: Message):
             try:
                 # Безопасная загрузка файла из Telegram
                 if message.bot and message.document:
-                    file_stream = await message.bot.download(message.document)  # type: ignore
-                    if file_stream:
-                        file_bytes = file_stream.read()  # type: ignore  # Читаем все байты
-                        file_stream.close()  # Закрываем поток
-                        file_name = message.document.file_name or f"document_{message.document.file_unique_id}"
-                    else:
-                        await message.answer("❌ Не удалось загрузить файл")
-                        return
+                    # С локальным сервером Bot API файл читается прямо с диска
+                    file_bytes = await read_telegram_file(message.bot, message.document.file_id,
+                                                          message.document.file_unique_id)
+                    file_name = message.document.file_name or f"document_{message.document.file_unique_id}"
                 else:
                     await message.answer("❌ Ошибка: отсутствует бот или документ")
                     return
@@ -171,20 +198,10 @@ async def handle_input(message: Message):
             if message.caption:
                 lines = message.caption.strip().splitlines()
                 if len(lines) >= 2:
-                    # Ждем 2 секунды для накопления файлов из групповых сообщений
-                    await asyncio.sleep(2)
-                    
                     subject = lines[0]
                     body = "\n".join(lines[1:])
-                    recipient = state["recipient"] or default_recipient
-                    attachments = state["files"] + [(file_name, file_bytes)]
-                    success, error_msg = send_email_oauth2(recipient, subject, body, attachments)
-                    if success:
-                        await message.answer("✅ Письмо с вложением отправлено.")
-                    else:
-                        await message.answer(f"{MESSAGES['email_failed']}\n❌ {error_msg}")
-                    state["draft"] = {}
-                    state["files"] = []
+                    await send_email_with_progress(message, state, subject, body, (file_name, file_bytes),
+                                                   "✅ Письмо с вложением отправлено.")
                     user_states[user_id]["email_router"] = state
                     return
                 else:
@@ -198,14 +215,8 @@ async def handle_input(message: Message):
             photo = message.photo[-1]
             try:
                 if message.bot:
-                    file_stream = await message.bot.download(photo)  # type: ignore
-                    if file_stream:
-                        file_bytes = file_stream.read()  # type: ignore
-                        file_stream.close()
-                        file_name = f"screenshot_{photo.file_unique_id}.jpg"
-                    else:
-                        await message.answer("❌ Не удалось загрузить фото")
-                        return
+                    file_bytes = await read_telegram_file(message.bot, photo.file_id, photo.file_unique_id)
+                    file_name = f"screenshot_{photo.file_unique_id}.jpg"
                 else:
                     await message.answer("❌ Ошибка: отсутствует бот")
                     return
@@ -216,20 +227,10 @@ async def handle_input(message: Message):
             if message.caption:
                 lines = message.caption.strip().splitlines()
                 if len(lines) >= 2:
-                    # Ждем 2 секунды для накопления файлов из групповых сообщений
-                    await asyncio.sleep(2)
-                    
                     subject = lines[0]
                     body = "\n".join(lines[1:])
-                    recipient = state["recipient"] or default_recipient
-                    attachments = state["files"] + [(file_name, file_bytes)]
-                    success, error_msg = send_email_oauth2(recipient, subject, body, attachments)
-                    if success:
-                        await message.answer("✅ Письмо с изображением отправлено.")
-                    else:
-                        await message.answer(f"{MESSAGES['email_failed']}\n❌ {error_msg}")
-                    state["draft"] = {}
-                    state["files"] = []
+                    await send_email_with_progress(message, state, subject, body, (file_name, file_bytes),
+                                                   "✅ Письмо с изображением отправлено.")
                     user_states[user_id]["email_router"] = state
                     return
                 else:
@@ -241,22 +242,9 @@ async def handle_input(message: Message):
         elif not state["draft"] and message.text:
             lines = text.splitlines()
             if len(lines) >= 2:
-                # Ждем 2 секунды для накопления файлов из групповых сообщений
-                await asyncio.sleep(2)
-                
                 subject = lines[0]
                 body = "\n".join(lines[1:])
-                recipient = state["recipient"] or default_recipient
-                success, error_msg = send_email_oauth2(recipient, subject, body, state["files"])
-                if success:
-                    if state["files"]:
-                        await message.answer("✅ Письмо с вложением отправлено.")
-                    else:
-                        await message.answer("✅ Письмо отправлено.")
-                else:
-                    await message.answer(f"{MESSAGES['email_failed']}\n❌ {error_msg}")
-                state["draft"] = {}
-                state["files"] = []
+                await send_email_with_progress(message, state, subject, body)
             else:
                 await message.answer(MESSAGES["invalid_format"])
         else:
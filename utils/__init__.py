@@ -0,0 +1,3 @@
+"""
+Общие утилиты бота, не привязанные к конкретному модулю
+"""
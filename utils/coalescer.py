@@ -0,0 +1,117 @@
+"""
+Склейка быстрых сообщений пользователя (debounce)
+
+Пользователь часто пишет мысль 3-4 короткими сообщениями подряд. Вместо
+отдельного запроса на каждое сообщение коалесер ждет окно тишины и передает
+обработчику все накопленные сообщения разом. Новое сообщение, пришедшее до
+отправки ответа, отменяет начатую обработку и попадает в ту же пачку.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List
+
+from .tasks import CANCEL_SUPERSEDED, get_cancel_reason
+
+logger = logging.getLogger(__name__)
+
+# Обработчик пачки: (сообщения, commit) -> None
+# commit() вызывается перед отправкой ответа - после него пачка не отменяется
+BatchHandler = Callable[[List[Any], Callable[[], None]], Awaitable[None]]
+
+
+class MessageCoalescer:
+    """Собирает сообщения пользователя в пачки по окну тишины"""
+
+    def __init__(self, window_ms: int):
+        self.window = max(window_ms, 0) / 1000
+        self._pending: Dict[str, List[Any]] = defaultdict(list)
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+        # Статистика
+        self.messages_received = 0
+        self.batches_started = 0
+        self.batches_superseded = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Окно склейки включено"""
+        return self.window > 0
+
+    def submit(self, key: str, message: Any, handler: BatchHandler) -> asyncio.Task:
+        """
+        Добавляет сообщение в пачку пользователя и (пере)запускает ожидание окна
+
+        Если обработка предыдущей пачки еще не дошла до commit(), она отменяется,
+        а ее сообщения обрабатываются заново вместе с новым.
+        """
+        self.messages_received += 1
+        self._pending[key].append(message)
+
+        previous = self._tasks.get(key)
+        if previous and not previous.done():
+            previous.cancel(CANCEL_SUPERSEDED)
+            self.batches_superseded += 1
+
+        task = asyncio.create_task(self._run(key, handler))
+        task.add_done_callback(self._log_task_error)
+        self._tasks[key] = task
+        return task
+
+    async def _run(self, key: str, handler: BatchHandler):
+        """Ждет окно тишины и передает пачку обработчику"""
+        task = asyncio.current_task()
+        batch: List[Any] = []
+        superseded = False
+        try:
+            await asyncio.sleep(self.window)
+
+            batch = list(self._pending[key])
+            if not batch:
+                return
+
+            self.batches_started += 1
+            if len(batch) > 1:
+                logger.info(f"Склеено {len(batch)} сообщений пользователя {key}")
+
+            await handler(batch, lambda: self._commit(key, batch, task))
+        except asyncio.CancelledError as error:
+            superseded = get_cancel_reason(error) == CANCEL_SUPERSEDED
+            if not superseded and not batch:
+                # Отмена пользователем еще во время ожидания окна
+                batch = list(self._pending[key])
+            raise
+        finally:
+            # Пачка, замененная новым сообщением, остается в очереди;
+            # в остальных случаях (ответ, ошибка, отмена) она снимается
+            if not superseded:
+                self._commit(key, batch, task)
+
+    def _commit(self, key: str, batch: List[Any], task: Any):
+        """Фиксирует пачку: новые сообщения больше не отменяют ее обработку"""
+        remaining = [msg for msg in self._pending.get(key, []) if not any(msg is item for item in batch)]
+        if remaining:
+            self._pending[key] = remaining
+        else:
+            self._pending.pop(key, None)
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    @staticmethod
+    def _log_task_error(task: asyncio.Task):
+        """Логирует необработанные ошибки фоновой обработки"""
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error:
+            logger.error(f"Ошибка обработки пачки сообщений: {error}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Возвращает статистику склейки"""
+        return {
+            'window_ms': int(self.window * 1000),
+            'messages_received': self.messages_received,
+            'batches_started': self.batches_started,
+            'batches_superseded': self.batches_superseded,
+            'requests_saved': max(self.messages_received - self.batches_started, 0),
+        }
@@ -0,0 +1,61 @@
+"""
+Бюджет времени на обработку одного обновления (deadline propagation)
+
+Deadline создается один раз на входе (например, при получении голосового)
+и передается через все этапы: скачивание → транскрипция → ChatGPT.
+Каждый этап берет себе оставшееся время, а не собственный фиксированный
+таймаут, поэтому худший случай ограничен бюджетом, а не суммой таймаутов.
+"""
+import asyncio
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Бюджет времени на обработку исчерпан"""
+
+    def __init__(self, stage: str = ""):
+        self.stage = stage
+        super().__init__(f"Превышено время обработки{f' (этап: {stage})' if stage else ''}")
+
+
+class Deadline:
+    """Абсолютный срок завершения обработки"""
+
+    def __init__(self, budget_sec: float):
+        self.budget = budget_sec
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget_sec
+
+    def remaining(self) -> float:
+        """Оставшееся время в секундах (не меньше нуля)"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def elapsed(self) -> float:
+        """Прошедшее время в секундах"""
+        return time.monotonic() - self.started_at
+
+    @property
+    def expired(self) -> bool:
+        """Срок истек"""
+        return self.remaining() <= 0
+
+    def check(self, stage: str = ""):
+        """Прерывает обработку, если время вышло"""
+        if self.expired:
+            raise DeadlineExceeded(stage)
+
+    def timeout(self, cap: Optional[float] = None, stage: str = "") -> float:
+        """
+        Таймаут для очередного этапа: оставшееся время, но не больше cap
+
+        Raises:
+            DeadlineExceeded: если времени не осталось
+        """
+        self.check(stage)
+        remaining = self.remaining()
+        return min(remaining, cap) if cap else remaining
+
+    def is_short(self, threshold_sec: float) -> bool:
+        """Осталось меньше threshold_sec - пора переходить на быстрые режимы"""
+        return self.remaining() < threshold_sec
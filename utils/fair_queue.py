@@ -0,0 +1,274 @@
+"""
+Справедливая очередь тяжелых заданий (распознавание аудио)
+
+Одновременно выполняется не больше max_concurrent заданий, остальные ждут.
+Порядок допуска:
+- приоритет: короткие голосовые обгоняют длинные файлы (у каждого задания
+  класс приоритета, 0 - самый высокий); задание, которое ждет дольше
+  aging_sec, допускается независимо от приоритета;
+- внутри класса - по очереди между пользователями (deficit round robin):
+  каждый пользователь за круг получает quantum «стоимости» (секунд аудио),
+  поэтому десять длинных файлов одного пользователя не задерживают всех
+  остальных.
+
+Ожидающие задания получают свою позицию в очереди и оценку времени ожидания
+(по скользящему среднему времени выполнения на единицу стоимости).
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Позиция в очереди (1 - следующее) и ожидаемое время ожидания в секундах (None - пока неизвестно)
+PositionCallback = Callable[[int, Optional[float]], Awaitable[None]]
+
+# Вес нового замера в скользящем среднем времени выполнения
+EWMA_ALPHA = 0.3
+
+
+@dataclass
+class _Waiter:
+    """Задание, ожидающее допуска"""
+    user_id: str
+    cost: float
+    priority: int
+    future: asyncio.Future
+    on_position: Optional[PositionCallback] = None
+    seq: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+    position: Optional[int] = None
+
+
+@dataclass
+class _Running:
+    """Выполняемое задание"""
+    cost: float
+    started_at: float = field(default_factory=time.monotonic)
+
+
+class FairQueue:
+    """Очередь с лимитом одновременных заданий, приоритетами и справедливостью между пользователями"""
+
+    def __init__(self, max_concurrent: int, quantum: float = 60.0, aging_sec: float = 120.0):
+        self.max_concurrent = max(max_concurrent, 1)
+        self.quantum = max(quantum, 1.0)
+        self.aging_sec = aging_sec
+        # priority -> user_id -> задания пользователя по порядку
+        self._classes: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {}
+        self._deficit: Dict[int, Dict[str, float]] = {}
+        self._running: Dict[int, _Running] = {}
+        self._seq = itertools.count()
+        # Секунд выполнения на единицу стоимости
+        self._sec_per_cost: Optional[float] = None
+
+        # Статистика
+        self.admitted = 0
+        self.waited = 0
+        self.total_wait_sec = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(jobs) for users in self._classes.values() for jobs in users.values())
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, cost: float = 1.0, priority: int = 0,
+                   on_position: Optional[PositionCallback] = None,
+                   timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Место для выполнения задания (ждет своей очереди)
+
+        Args:
+            cost: Стоимость задания (например, секунды аудио) - для справедливости и ETA
+            priority: Класс приоритета (меньше - раньше)
+            on_position: Вызывается при изменении позиции в очереди
+            timeout: Сколько можно ждать допуска (asyncio.TimeoutError по истечении)
+        """
+        job_id = await self.acquire(user_id, cost, priority, on_position, timeout)
+        try:
+            yield
+        finally:
+            self.release(job_id)
+
+    async def acquire(self, user_id: str, cost: float = 1.0, priority: int = 0,
+                      on_position: Optional[PositionCallback] = None, timeout: Optional[float] = None) -> int:
+        """Ждет допуска; возвращает номер задания для release()"""
+        cost = max(cost, 0.1)
+        job_id = next(self._seq)
+        if not self.waiting and self.running < self.max_concurrent:
+            self._running[job_id] = _Running(cost)
+            self.admitted += 1
+            return job_id
+
+        waiter = _Waiter(user_id, cost, priority, asyncio.get_running_loop().create_future(), on_position, job_id)
+        users = self._classes.setdefault(priority, OrderedDict())
+        users.setdefault(user_id, deque()).append(waiter)
+        self._notify_positions()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Допуск уже выдан - освобождаем место для следующего
+                self.release(job_id)
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+                self._notify_positions()
+            raise
+
+        wait_sec = time.monotonic() - waiter.enqueued_at
+        self.waited += 1
+        self.total_wait_sec += wait_sec
+        logger.info(f"Задание пользователя {user_id} ждало в очереди {wait_sec:.1f} сек")
+        return job_id
+
+    def release(self, job_id: int):
+        """Задание завершено: учитываем время и допускаем следующие"""
+        running = self._running.pop(job_id, None)
+        if running is None:
+            return
+        rate = (time.monotonic() - running.started_at) / running.cost
+        if self._sec_per_cost is None:
+            self._sec_per_cost = rate
+        else:
+            self._sec_per_cost += EWMA_ALPHA * (rate - self._sec_per_cost)
+        self._admit()
+
+    def _admit(self):
+        """Допускает ожидающие задания, пока есть свободные места"""
+        admitted = False
+        while self.running < self.max_concurrent:
+            waiter = self._pop_next(self._classes, self._deficit)
+            if waiter is None:
+                break
+            if waiter.future.done():
+                continue
+            self._running[waiter.seq] = _Running(waiter.cost)
+            self.admitted += 1
+            waiter.future.set_result(None)
+            admitted = True
+        if admitted:
+            self._notify_positions()
+
+    def _pop_next(self, classes: Dict[int, "OrderedDict[str, Deque[_Waiter]]"],
+                  deficit: Dict[int, Dict[str, float]]) -> Optional[_Waiter]:
+        """Следующее задание: давно ждущее, иначе - по приоритету и по кругу между пользователями"""
+        priority = self._aged_class(classes)
+        if priority is None:
+            active = [p for p, users in classes.items() if users]
+            if not active:
+                return None
+            priority = min(active)
+
+        users = classes[priority]
+        credits = deficit.setdefault(priority, {})
+        while True:
+            user_id, jobs = next(iter(users.items()))
+            head = jobs[0]
+            if credits.get(user_id, 0.0) >= head.cost:
+                jobs.popleft()
+                credits[user_id] -= head.cost
+                if not jobs:
+                    # Опустевший пользователь не копит кредит на будущее
+                    del users[user_id]
+                    credits.pop(user_id, None)
+                return head
+            # Кредита не хватает - пополняем и передаем ход следующему пользователю
+            credits[user_id] = credits.get(user_id, 0.0) + self.quantum
+            users.move_to_end(user_id)
+
+    def _aged_class(self, classes: Dict[int, "OrderedDict[str, Deque[_Waiter]]"]) -> Optional[int]:
+        """Класс задания, которое ждет дольше aging_sec (самого старого), или None"""
+        if self.aging_sec <= 0:
+            return None
+        now = time.monotonic()
+        oldest = None
+        for priority, users in classes.items():
+            for jobs in users.values():
+                head = jobs[0]
+                if now - head.enqueued_at >= self.aging_sec and (oldest is None or head.seq < oldest.seq):
+                    oldest = head
+        return oldest.priority if oldest else None
+
+    def _remove(self, waiter: _Waiter):
+        """Убирает отмененное задание из очереди"""
+        users = self._classes.get(waiter.priority, {})
+        jobs = users.get(waiter.user_id)
+        if jobs is None:
+            return
+        try:
+            jobs.remove(waiter)
+        except ValueError:
+            return
+        if not jobs:
+            del users[waiter.user_id]
+            self._deficit.get(waiter.priority, {}).pop(waiter.user_id, None)
+
+    def order(self) -> List[_Waiter]:
+        """Ожидающие задания в порядке будущего допуска (расчет на копии состояния)"""
+        classes = {
+            priority: OrderedDict((user_id, deque(jobs)) for user_id, jobs in users.items())
+            for priority, users in self._classes.items()
+        }
+        deficit = {priority: dict(credits) for priority, credits in self._deficit.items()}
+        result = []
+        while True:
+            waiter = self._pop_next(classes, deficit)
+            if waiter is None:
+                return result
+            result.append(waiter)
+
+    def estimate_wait(self, ahead: List[_Waiter]) -> Optional[float]:
+        """Ожидание до допуска: работа впереди и остаток выполняемых заданий на все места"""
+        if self._sec_per_cost is None:
+            return None
+        now = time.monotonic()
+        running_left = sum(
+            max(job.cost * self._sec_per_cost - (now - job.started_at), 0.0)
+            for job in self._running.values()
+        )
+        work = running_left + sum(waiter.cost for waiter in ahead) * self._sec_per_cost
+        return work / self.max_concurrent
+
+    def _notify_positions(self):
+        """Сообщает ожидающим заданиям их новую позицию"""
+        order = self.order()
+        for index, waiter in enumerate(order):
+            if waiter.on_position is None or waiter.position == index + 1:
+                continue
+            waiter.position = index + 1
+            asyncio.create_task(self._call(waiter, index + 1, self.estimate_wait(order[:index])))
+
+    @staticmethod
+    async def _call(waiter: _Waiter, position: int, eta: Optional[float]):
+        try:
+            await waiter.on_position(position, eta)
+        except Exception as e:
+            logger.debug(f"Не удалось сообщить позицию в очереди: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Выполняется, ждет, допущено и среднее ожидание"""
+        return {
+            'running': self.running,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'avg_wait_sec': round(self.total_wait_sec / self.waited, 1) if self.waited else 0.0,
+        }
+
+
+def format_wait(eta_sec: Optional[float]) -> str:
+    """Ожидаемое время ожидания для пользователя: «~40 сек», «~3 мин» или «оценивается»"""
+    if eta_sec is None:
+        return "оценивается"
+    if eta_sec < 60:
+        return f"~{max(int(round(eta_sec / 5) * 5), 5)} сек"
+    return f"~{int(round(eta_sec / 60))} мин"
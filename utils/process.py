@@ -0,0 +1,36 @@
+"""
+Запуск внешних процессов (ffmpeg и т.п.) с поддержкой отмены
+"""
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+async def run_process(args: List[str], input_data: Optional[bytes] = None) -> Tuple[int, bytes, bytes]:
+    """
+    Запускает процесс и дожидается его завершения
+
+    При отмене вызывающей задачи процесс принудительно завершается,
+    поэтому отмена доходит до ffmpeg и не оставляет висящих процессов.
+
+    Returns:
+        Tuple[returncode, stdout, stderr]
+    """
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE if input_data is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await process.communicate(input_data)
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+            logger.info(f"Процесс {args[0]} остановлен из-за отмены задачи")
+        raise
+
+    return process.returncode, stdout, stderr
@@ -0,0 +1,241 @@
+"""
+Индикация прогресса с минимумом вызовов Bot API
+
+Вместо сообщения-заглушки («Думаю...» → delete → ответ) пользователь видит
+статус «печатает» (send_chat_action), который обновляется раз в несколько
+секунд. Заглушка с кнопкой отмены появляется, только если обработка затянулась,
+а готовый ответ записывается в нее через edit_text. Промежуточные обновления
+пропускаются, если текст не изменился, и отправляются не чаще заданного интервала:
+последний текст из слишком частых обновлений записывается, когда интервал истечет.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Optional
+
+from aiogram.enums import ChatAction
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from .tasks import CANCEL_BY_USER, CANCEL_SUPERSEDED
+
+logger = logging.getLogger(__name__)
+
+# Telegram показывает chat action около 5 секунд
+CHAT_ACTION_INTERVAL_SEC = 4.5
+# Через сколько секунд показывать заглушку (с кнопкой отмены)
+DEFAULT_PLACEHOLDER_DELAY_SEC = 3.0
+# Минимальный интервал между промежуточными правками сообщения
+DEFAULT_MIN_EDIT_INTERVAL_SEC = 1.5
+
+
+def _content_hash(text: str, reply_markup: Optional[InlineKeyboardMarkup]) -> str:
+    """Хеш содержимого сообщения: текст + клавиатура"""
+    markup = reply_markup.model_dump_json() if reply_markup else ""
+    return hashlib.md5(f"{text}\x00{markup}".encode("utf-8")).hexdigest()
+
+
+class ProgressMessage:
+    """
+    Статус долгой операции в ответ на сообщение пользователя
+
+    Использование:
+        async with ProgressMessage(message, MESSAGES["thinking"], reply_markup=get_cancel_menu()) as progress:
+            await progress.update("🎧 Распознаю...")
+            ...
+            await progress.finish(answer_text, reply_markup=get_back_menu())
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        text: str,
+        action: ChatAction = ChatAction.TYPING,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        placeholder_delay: float = DEFAULT_PLACEHOLDER_DELAY_SEC,
+        min_edit_interval: float = DEFAULT_MIN_EDIT_INTERVAL_SEC,
+        as_reply: bool = True,
+    ):
+        self.source = message
+        self.as_reply = as_reply
+        self.action = action
+        self.reply_markup = reply_markup
+        self.placeholder_delay = max(placeholder_delay, 0)
+        self.min_edit_interval = min_edit_interval
+
+        self.message: Optional[Message] = None  # Заглушка, если уже отправлена
+        self._text = text
+        self._sent_hash: Optional[str] = None
+        self._last_edit_at = 0.0
+        self._started_at = time.monotonic()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._flush: Optional[asyncio.Task] = None  # Отложенная правка последним текстом
+        self._lock = asyncio.Lock()
+        self.finished = False
+
+    async def __aenter__(self) -> "ProgressMessage":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+        return False
+
+    async def start(self):
+        """Запускает chat action (и заглушку сразу, если задержка нулевая)"""
+        if self.placeholder_delay == 0:
+            await self._ensure_placeholder()
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        """Останавливает chat action и отложенную правку"""
+        for task in (self._heartbeat, self._flush):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    async def _heartbeat_loop(self):
+        """Повторяет chat action и показывает заглушку, если операция затянулась"""
+        placeholder_due = self._started_at + self.placeholder_delay
+        action_due = 0.0
+        try:
+            while not self.finished:
+                now = time.monotonic()
+                if now >= action_due:
+                    await self._send_action()
+                    action_due = now + CHAT_ACTION_INTERVAL_SEC
+
+                if self.message is None and now >= placeholder_due:
+                    await self._ensure_placeholder()
+
+                next_due = action_due if self.message is not None else min(action_due, placeholder_due)
+                await asyncio.sleep(max(next_due - time.monotonic(), 0))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Индикация прогресса остановлена: {e}")
+
+    async def _send_action(self):
+        """Отправляет статус «печатает» / «записывает» и т.п."""
+        try:
+            await self.source.bot.send_chat_action(self.source.chat.id, self.action)
+        except Exception as e:
+            logger.debug(f"Не удалось отправить chat action: {e}")
+
+    async def _ensure_placeholder(self):
+        """Отправляет заглушку с последним текстом статуса"""
+        async with self._lock:
+            if self.message is not None or self.finished:
+                return
+            text, reply_markup = self._text, self.reply_markup
+            send = asyncio.ensure_future(self._send(text, reply_markup))
+            try:
+                self.message = await asyncio.shield(send)
+            except asyncio.CancelledError:
+                # stop() во время отправки: дожидаемся ее, чтобы finish() или
+                # cancelled() отредактировали или удалили уже отправленную заглушку
+                try:
+                    self.message = await send
+                except Exception as e:
+                    logger.debug(f"Не удалось отправить заглушку: {e}")
+                raise
+            finally:
+                if self.message is not None:
+                    self._sent_hash = _content_hash(text, reply_markup)
+                    self._last_edit_at = time.monotonic()
+
+    async def _send(self, text: str, reply_markup: Optional[InlineKeyboardMarkup]) -> Message:
+        """Новое сообщение в чат: ответом на исходное или просто сообщением"""
+        if self.as_reply:
+            return await self.source.reply(text, reply_markup=reply_markup)
+        return await self.source.answer(text, reply_markup=reply_markup)
+
+    async def _edit(self, text: str, reply_markup: Optional[InlineKeyboardMarkup]):
+        """Редактирует заглушку, пропуская правки без изменений"""
+        content_hash = _content_hash(text, reply_markup)
+        if content_hash == self._sent_hash:
+            return
+        try:
+            await self.message.edit_text(text, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
+        self._sent_hash = content_hash
+        self._last_edit_at = time.monotonic()
+
+    async def update(self, text: str, force: bool = False):
+        """
+        Промежуточный статус
+
+        Пока заглушки нет, текст только запоминается. Правки чаще
+        min_edit_interval (кроме force=True) откладываются: когда интервал
+        истечет, в заглушку запишется последний текст.
+        """
+        self._text = text
+        if self.message is None or self.finished:
+            return
+        wait = self._last_edit_at + self.min_edit_interval - time.monotonic()
+        if not force and wait > 0:
+            if self._flush is None or self._flush.done():
+                self._flush = asyncio.create_task(self._flush_later(wait))
+            return
+        async with self._lock:
+            await self._edit(text, self.reply_markup)
+
+    async def _flush_later(self, delay: float):
+        """Записывает в заглушку последний текст статуса после паузы между правками"""
+        await asyncio.sleep(delay)
+        async with self._lock:
+            if self.message is None or self.finished:
+                return
+            try:
+                await self._edit(self._text, self.reply_markup)
+            except Exception as e:
+                logger.debug(f"Не удалось обновить статус: {e}")
+
+    async def finish(self, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None) -> Message:
+        """
+        Итоговый ответ: правка заглушки, а если ее нет - обычный reply
+
+        Returns:
+            Message: Сообщение с ответом
+        """
+        self.finished = True
+        await self.stop()
+        async with self._lock:
+            if self.message is not None:
+                try:
+                    await self._edit(text, reply_markup)
+                    return self.message
+                except TelegramBadRequest as e:
+                    # Например, ответ не помещается в правку - отправляем отдельно
+                    logger.warning(f"Не удалось записать ответ в заглушку: {e}")
+                    await self._delete_placeholder()
+            return await self._send(text, reply_markup)
+
+    async def cancelled(self, reason: str, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        """Показывает отмену: замененная задача убирает заглушку молча"""
+        self.finished = True
+        await self.stop()
+        async with self._lock:
+            if reason == CANCEL_SUPERSEDED:
+                await self._delete_placeholder()
+            elif reason == CANCEL_BY_USER and self.message is not None:
+                try:
+                    await self._edit(text, reply_markup)
+                except Exception:
+                    pass
+
+    async def _delete_placeholder(self):
+        """Удаляет заглушку, если она была отправлена"""
+        if self.message is None:
+            return
+        try:
+            await self.message.delete()
+        except Exception:
+            pass
+        self.message = None
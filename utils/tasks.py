@@ -0,0 +1,95 @@
+"""
+Реестр выполняемых задач пользователей
+
+Каждая тяжелая операция (запрос к ChatGPT, Vision, транскрипция) запускается
+отдельной задачей и регистрируется за пользователем. Это позволяет отменить ее
+кнопкой «⛔ Отмена», при выходе из режима или когда новое сообщение заменяет
+старое. Отмена задачи прерывает HTTP запрос и завершает дочерние процессы.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Coroutine, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Причины отмены (передаются в task.cancel(msg) и доступны в CancelledError.args)
+CANCEL_BY_USER = "cancelled_by_user"
+CANCEL_SUPERSEDED = "superseded"
+
+
+def get_cancel_reason(error: asyncio.CancelledError) -> str:
+    """Возвращает причину отмены или пустую строку (например, при остановке бота)"""
+    return str(error.args[0]) if error.args else ""
+
+
+class UserTaskRegistry:
+    """Отслеживает выполняемые задачи каждого пользователя"""
+
+    def __init__(self):
+        # user_id -> {task: kind}
+        self._tasks: Dict[str, Dict[asyncio.Task, str]] = defaultdict(dict)
+        self.cancelled_count = 0
+
+    def track(self, user_id: str, task: asyncio.Task, kind: str = "default") -> asyncio.Task:
+        """Регистрирует уже созданную задачу (снимается с учета автоматически)"""
+        self._tasks[user_id][task] = kind
+        task.add_done_callback(lambda done: self._forget(user_id, done))
+        return task
+
+    async def run(self, user_id: str, coro: Coroutine, kind: str = "default") -> Optional[Any]:
+        """
+        Выполняет корутину отдельной отменяемой задачей
+
+        Returns:
+            Результат корутины или None, если задача была отменена через реестр
+        """
+        task = self.track(user_id, asyncio.create_task(coro), kind)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if task.cancelled() and not (current and current.cancelling()):
+                # Отменили дочернюю задачу, а не сам обработчик
+                return None
+            raise
+
+    def cancel(self, user_id: str, kind: Optional[str] = None, reason: str = CANCEL_BY_USER) -> int:
+        """
+        Отменяет задачи пользователя (все или только указанного типа)
+
+        Returns:
+            int: Количество отмененных задач
+        """
+        cancelled = 0
+        for task, task_kind in list(self._tasks.get(user_id, {}).items()):
+            if kind is not None and task_kind != kind:
+                continue
+            if not task.done():
+                task.cancel(reason)
+                cancelled += 1
+
+        if cancelled:
+            self.cancelled_count += cancelled
+            logger.info(f"Отменено задач пользователя {user_id}: {cancelled} ({reason})")
+        return cancelled
+
+    def has_active(self, user_id: str, kind: Optional[str] = None) -> bool:
+        """Есть ли у пользователя выполняемые задачи"""
+        return any(
+            not task.done() and (kind is None or task_kind == kind)
+            for task, task_kind in self._tasks.get(user_id, {}).items()
+        )
+
+    def _forget(self, user_id: str, task: asyncio.Task):
+        """Снимает завершенную задачу с учета"""
+        user_tasks = self._tasks.get(user_id)
+        if user_tasks is None:
+            return
+        user_tasks.pop(task, None)
+        if not user_tasks:
+            del self._tasks[user_id]
+
+
+# Глобальный реестр задач (общий для всех модулей)
+task_registry = UserTaskRegistry()